@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Debitoor API, used by the benchmark suite.
+
+Emulates customers, invoices, drafts, tax rates and environment
+endpoints with in-memory data, configurable latency, error rate and
+throttling.
+
+Examples
+--------
+    >>> server = MockDebitoorServer(latency=0.01, error_rate=0.01)
+    >>> server.start()
+    >>> client = DebitoorClient('token', base_url=server.base_url)
+    >>> server.stop()
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+API_PREFIX = '/api'
+VALID_TOKEN = 'token'
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class MockState(object):
+    """
+    In-memory Debitoor account.
+    """
+
+    def __init__(self, customers=100, invoices=1000, seed=0):
+        rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.customers = {}
+        self.invoices = {}
+        self.drafts = {}
+        for number in range(1, customers + 1):
+            customer = {'id': self.next_id(), 'number': number,
+                        'name': 'Customer %d' % number,
+                        'email': 'customer%d@example.com' % number,
+                        'countryCode': 'FR', 'paymentTermsId': 1}
+            self.customers[customer['id']] = customer
+        customer_ids = sorted(self.customers)
+        for number in range(1, invoices + 1):
+            day = rng.randint(0, 364)
+            invoice = {
+                'id': self.next_id(), 'number': number,
+                'customerId': rng.choice(customer_ids) if customer_ids
+                else None,
+                'date': time.strftime(
+                    '%Y-%m-%d', time.gmtime(1451606400 + day * 86400)),
+                'lastModified': time.strftime(
+                    '%Y-%m-%dT%H:%M:%SZ',
+                    time.gmtime(1451606400 + day * 86400)),
+                'lines': [{'description': 'Line %d' % line,
+                           'quantity': rng.randint(1, 10),
+                           'unitNetPrice': rng.randint(100, 10000) / 100.0,
+                           'taxRate': 20, 'taxEnabled': True}
+                          for line in range(rng.randint(1, 5))]}
+            self.invoices[invoice['id']] = invoice
+
+    def next_id(self):
+        self.sequence += 1
+        return '%024x' % self.sequence
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffer headers and body into a single write, avoiding Nagle /
+    # delayed ACK stalls on keep-alive connections.
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    routes = []
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def send_json(self, status, body, extra_headers=None):
+        data = json.dumps(body).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(data).hexdigest()
+        if status == 200 and self.command == 'GET' and \
+                self.headers.get('If-None-Match') == etag:
+            return self.send_raw(304, b'', None, {'ETag': etag})
+        headers = {'ETag': etag} if status == 200 else {}
+        headers.update(extra_headers or {})
+        self.send_raw(status, data, 'application/json; charset=utf-8',
+                      headers)
+
+    def send_raw(self, status, data, content_type, extra_headers=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        return json.loads(data.decode('utf-8')) if data else {}
+
+    def handle_any(self):
+        config = self.config
+        with self.state.lock:
+            self.server.calls += 1
+        body = self.read_json() if self.command in ('POST', 'PUT',
+                                                    'PATCH') else None
+        if config['latency']:
+            time.sleep(config['latency'] *
+                       random.uniform(1 - config['jitter'],
+                                      1 + config['jitter']))
+        if config['token'] is not None and \
+                self.headers.get('x-token') != config['token']:
+            return self.send_json(401, {'message': 'Unauthorized'})
+        if random.random() < config['throttle_rate']:
+            return self.send_json(429, {'message': 'Too many requests'},
+                                  {'Retry-After': str(config['retry_after'])})
+        if random.random() < config['error_rate']:
+            return self.send_json(503, {'message': 'Unavailable'})
+
+        url = urlparse(self.path)
+        path = url.path[len(API_PREFIX):] if url.path.startswith(
+            API_PREFIX) else url.path
+        query = dict((key, values[0])
+                     for key, values in parse_qs(url.query).items())
+        for method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if method == self.command and match:
+                with self.state.lock:
+                    return handler(self, query, body, *match.groups())
+        self.send_json(404, {'message': 'Not found'})
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_any
+
+    # Handlers, called with the state lock held.
+
+    def environment(self, query, body):
+        self.send_json(200, {'environment': 'mock'})
+
+    def validate(self, query, body, _kind):
+        self.send_json(200, {})
+
+    def list_customers(self, query, body):
+        self.send_json(200, sorted(self.state.customers.values(),
+                                   key=lambda customer: customer['number']))
+
+    def create_customer(self, query, body):
+        body['id'] = self.state.next_id()
+        body.setdefault('number', len(self.state.customers) + 1)
+        self.state.customers[body['id']] = body
+        self.send_json(200, body)
+
+    def customer(self, query, body, customer_id):
+        customers = self.state.customers
+        if customer_id not in customers:
+            return self.send_json(404, {'message': 'Not found'})
+        if self.command == 'GET':
+            return self.send_json(200, customers[customer_id])
+        if self.command == 'DELETE':
+            del customers[customer_id]
+            return self.send_json(200, {})
+        if self.command == 'PUT':
+            body['id'] = customer_id
+            customers[customer_id] = body
+        else:
+            customers[customer_id].update(body)
+        self.send_json(200, customers[customer_id])
+
+    def __filter_invoices(self, query):
+        from_date = query.get('from_date', '')
+        to_date = query.get('to_date', '9999')
+        return sorted((invoice for invoice in self.state.invoices.values()
+                       if from_date <= invoice['date'] <= to_date),
+                      key=lambda invoice: invoice['number'])
+
+    def list_invoices(self, query, body):
+        self.send_json(200, self.__filter_invoices(query))
+
+    def invoice_headers(self, query, body):
+        self.send_json(200, [dict((key, value)
+                                  for key, value in invoice.items()
+                                  if key != 'lines')
+                             for invoice in self.__filter_invoices(query)])
+
+    def invoice(self, query, body, invoice_id):
+        if invoice_id not in self.state.invoices:
+            return self.send_json(404, {'message': 'Not found'})
+        self.send_json(200, self.state.invoices[invoice_id])
+
+    def invoice_pdf(self, query, body, invoice_id):
+        if invoice_id not in self.state.invoices:
+            return self.send_json(404, {'message': 'Not found'})
+        self.send_raw(200, b'%PDF-1.4\n' + b'0' * self.config['pdf_size'],
+                      'application/pdf')
+
+    def invoice_email(self, query, body, invoice_id):
+        if invoice_id not in self.state.invoices:
+            return self.send_json(404, {'message': 'Not found'})
+        if not body.get('recipient') or not body.get('subject'):
+            return self.send_json(400, {'errors': {'recipient': 'required'}})
+        self.send_json(200, {})
+
+    def create_draft(self, query, body):
+        body['id'] = self.state.next_id()
+        self.state.drafts[body['id']] = body
+        self.send_json(200, body)
+
+    def book_draft(self, query, body, draft_id):
+        draft = self.state.drafts.pop(draft_id, None)
+        if draft is None:
+            return self.send_json(404, {'message': 'Not found'})
+        draft['id'] = self.state.next_id()
+        draft.setdefault('number', len(self.state.invoices) + 1)
+        draft.setdefault('date', time.strftime('%Y-%m-%d'))
+        draft['lastModified'] = time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                              time.gmtime())
+        self.state.invoices[draft['id']] = draft
+        self.send_json(200, draft)
+
+    def tax_rates(self, query, body):
+        country = query.get('customerCountry') or \
+            query.get('supplierCountry')
+        self.send_json(200, {'baseTax': {'defaultRate': 20,
+                                         'rates': [0, 5.5, 10, 20]},
+                             'customerCountry': country,
+                             'date': query.get('date')})
+
+
+_ID = '([0-9a-zA-Z]+)'
+MockHandler.routes = [
+    (method, re.compile('^%s$' % pattern), handler)
+    for method, pattern, handler in (
+        ('GET', '/environment/v1', MockHandler.environment),
+        ('POST', '/sales/(customers|invoices|draftinvoices)/validate/v1',
+         MockHandler.validate),
+        ('GET', '/customers/v1', MockHandler.list_customers),
+        ('POST', '/customers/v1', MockHandler.create_customer),
+        ('GET', '/customers/%s/v1' % _ID, MockHandler.customer),
+        ('PUT', '/customers/%s/v1' % _ID, MockHandler.customer),
+        ('PATCH', '/customers/%s/v1' % _ID, MockHandler.customer),
+        ('DELETE', '/customers/%s/v1' % _ID, MockHandler.customer),
+        ('GET', '/sales/invoices/v1', MockHandler.list_invoices),
+        ('GET', '/sales/invoices/headers/v1', MockHandler.invoice_headers),
+        ('GET', '/sales/invoices/%s/v1' % _ID, MockHandler.invoice),
+        ('GET', '/sales/invoices/%s/pdf/v1' % _ID, MockHandler.invoice_pdf),
+        ('POST', '/sales/invoices/%s/email/v2' % _ID,
+         MockHandler.invoice_email),
+        ('POST', '/sales/draftinvoices/v1', MockHandler.create_draft),
+        ('POST', '/sales/draftinvoices/%s/book/v1' % _ID,
+         MockHandler.book_draft),
+        ('GET', '/sales/taxrates/v1', MockHandler.tax_rates),
+        ('GET', '/purchase/taxrates/v1', MockHandler.tax_rates),
+    )]
+
+
+class MockDebitoorServer(object):
+    """
+    Threaded HTTP server emulating the Debitoor API on localhost.
+
+    Parameters
+    ----------
+    latency: float
+        Mean delay added to each answer, in seconds.
+    jitter: float
+        Relative latency variation, 0.2 means +/- 20%.
+    error_rate: float
+        Fraction of calls answered with a 503.
+    throttle_rate: float
+        Fraction of calls answered with a 429.
+    retry_after: float
+        Retry-After sent with 429 answers, in seconds.
+    customers: int
+        Number of seeded customers.
+    invoices: int
+        Number of seeded invoices, spread over 2016.
+    pdf_size: int
+        Size of invoice PDFs, in bytes.
+    token: str
+        Only accepted access token. None accepts any token.
+    port: int
+        Listening port, 0 picks a free one.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.2, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=0.1, customers=100,
+                 invoices=1000, pdf_size=100 * 1024, token=VALID_TOKEN,
+                 port=0):
+        self.httpd = _ThreadingServer(('127.0.0.1', port), MockHandler)
+        self.httpd.config = {'latency': latency, 'jitter': jitter,
+                             'error_rate': error_rate,
+                             'throttle_rate': throttle_rate,
+                             'retry_after': retry_after,
+                             'pdf_size': pdf_size, 'token': token}
+        self.httpd.state = MockState(customers, invoices)
+        self.httpd.calls = 0
+        self.__thread = None
+
+    @property
+    def config(self):
+        return self.httpd.config
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    @property
+    def calls(self):
+        return self.httpd.calls
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d%s' % (self.httpd.server_address[1],
+                                          API_PREFIX)
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.httpd.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
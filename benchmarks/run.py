@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark DebitoorClient and its services against the local mock server.
+
+Usage
+-----
+    python -m benchmarks.run [--latency 0.01] [--calls 200] [--threads 8]
+                             [--json results.json] [--baseline old.json]
+
+Each scenario reports throughput (calls per second), p50/p99 call latency
+and peak Python memory (tracemalloc). With --baseline, the run fails if a
+scenario throughput dropped by more than --tolerance.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from pydebitoor.calc import TaxCalculator
+from pydebitoor.client import DebitoorClient
+from pydebitoor.retry import RetryPolicy
+
+from .mock_server import MockDebitoorServer, VALID_TOKEN
+
+SCENARIOS = []
+
+
+def scenario(func):
+    SCENARIOS.append(func)
+    return func
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def timed(func, *args, **kwargs):
+    started_at = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - started_at
+
+
+def completion_times(results):
+    """
+    Time elapsed until each result of a bulk operation was yielded.
+    """
+    started_at = time.perf_counter()
+    return [time.perf_counter() - started_at for _ in results]
+
+
+def measure(name, calls, run):
+    """
+    Run `run()`, which returns the list of per-call latencies.
+    """
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    latencies = run()
+    elapsed = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'scenario': name, 'calls': calls, 'elapsed': elapsed,
+            'throughput': calls / elapsed if elapsed else None,
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'peak_memory': peak}
+
+
+@scenario
+def serial_get(client, server, args):
+    service = client.get_service('CustomerService')
+    ids = sorted(server.state.customers)
+    return measure('serial CustomerService.get', args.calls, lambda: [
+        timed(service.get, ids[index % len(ids)])
+        for index in range(args.calls)])
+
+
+@scenario
+def threaded_get(client, server, args):
+    service = client.get_service('InvoiceService')
+    ids = sorted(server.state.invoices)
+
+    def run():
+        with ThreadPoolExecutor(args.threads) as executor:
+            return list(executor.map(
+                lambda index: timed(service.get, ids[index % len(ids)]),
+                range(args.calls)))
+    return measure('threaded InvoiceService.get', args.calls, run)
+
+
+@scenario
+def bulk_create(client, server, args):
+    service = client.get_service('CustomerService')
+
+    return measure('bulk CustomerService.create', args.calls,
+                   lambda: completion_times(service.bulk_create(
+                       ({'name': 'Bulk %d' % index, 'countryCode': 'FR'}
+                        for index in range(args.calls)),
+                       max_workers=args.threads)))
+
+
+@scenario
+def bulk_complete(client, server, args):
+    service = client.get_service('DraftService')
+    draft_ids = [service.create({'customerName': 'Draft %d' % index})['id']
+                 for index in range(args.calls)]
+
+    return measure('bulk DraftService.complete', args.calls,
+                   lambda: completion_times(service.bulk_complete(
+                       draft_ids, max_workers=args.threads)))
+
+
+@scenario
+def tax_rates(client, server, args):
+    service = client.get_service('TaxService')
+    return measure('TaxService.sale_tax_rates', args.calls, lambda: [
+        timed(service.sale_tax_rates, 'FR', '2016-%02d-01' % (index % 12 + 1))
+        for index in range(args.calls)])
+
+
+@scenario
+def invoice_list(client, server, args):
+    service = client.get_service('InvoiceService')
+    return measure('InvoiceService.list', len(server.state.invoices),
+                   lambda: [timed(service.list, '2016-01-01', '2016-12-31')])
+
+
+@scenario
+def invoice_iter_list(client, server, args):
+    service = client.get_service('InvoiceService')
+
+    def run():
+        started_at = time.perf_counter()
+        for _ in service.iter_list('2016-01-01', '2016-12-31'):
+            pass
+        return [time.perf_counter() - started_at]
+    return measure('InvoiceService.iter_list', len(server.state.invoices),
+                   run)
+
+
+@scenario
+def invoice_list_parallel(client, server, args):
+    service = client.get_service('InvoiceService')
+    return measure('InvoiceService.list_parallel',
+                   len(server.state.invoices),
+                   lambda: [timed(service.list_parallel, '2016-01-01',
+                                  '2016-12-31', max_workers=args.threads)])
+
+
+def make_drafts(count, lines_per_draft, seed=0):
+    rng = random.Random(seed)
+    return [{'customerCountry': 'FR', 'date': '2016-%02d-01' % (index % 12 + 1),
+             'lines': [{'description': 'Line %d' % line,
+                        'quantity': rng.randint(1, 10),
+                        'unitNetPrice': rng.randint(100, 100000) / 100.0,
+                        'discountRate': rng.choice((0, 0, 10)),
+                        'taxRate': rng.choice((None, 5.5, 10, 20))}
+                       for line in range(lines_per_draft)]}
+            for index in range(count)]
+
+
+def per_line_totals(service, draft):
+    """
+    Reference: totals computed line by line, rates checked per draft.
+    """
+    rates = service.sale_tax_rates(draft['customerCountry'],
+                                   draft['date'])['baseTax']
+    net = tax = 0.0
+    for line in draft['lines']:
+        rate = line.get('taxRate')
+        if rate is None:
+            rate = rates['defaultRate']
+        elif rate not in rates['rates']:
+            raise ValueError(rate)
+        amount = round(line['quantity'] * line['unitNetPrice'] *
+                       (1 - line.get('discountRate', 0) / 100.0), 2)
+        net += amount
+        tax += round(amount * rate / 100.0, 2)
+    return net, tax
+
+
+@scenario
+def totals_per_line(client, server, args):
+    service = client.get_service('TaxService')
+    drafts = make_drafts(args.calls, 50)
+    return measure('per-line draft totals', args.calls * 50, lambda: [
+        timed(lambda: [per_line_totals(service, draft) for draft in drafts])])
+
+
+@scenario
+def totals_batched(client, server, args):
+    calculator = TaxCalculator(client.get_service('TaxService'))
+    drafts = make_drafts(args.calls, 50)
+    return measure('TaxCalculator.compute', args.calls * 50, lambda: [
+        timed(calculator.compute, drafts, lines=False)])
+
+
+def format_row(result):
+    def ms(value):
+        return '-' if value is None else '%.2f' % (value * 1000)
+    return '{:<34} {:>8} {:>10.1f} {:>9} {:>9} {:>10.1f}'.format(
+        result['scenario'], result['calls'], result['throughput'] or 0,
+        ms(result['p50']), ms(result['p99']),
+        result['peak_memory'] / 1024.0)
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as baseline_file:
+        baseline = dict((result['scenario'], result)
+                        for result in json.load(baseline_file))
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['scenario'])
+        if previous and previous['throughput'] and result['throughput'] < \
+                previous['throughput'] * (1 - tolerance):
+            regressions.append('%s: %.1f -> %.1f calls/s' % (
+                result['scenario'], previous['throughput'],
+                result['throughput']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='mock server latency, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--invoices', type=int, default=5000)
+    parser.add_argument('--only', help='run scenarios matching this name')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed throughput drop versus baseline')
+    args = parser.parse_args(argv)
+
+    server = MockDebitoorServer(latency=args.latency,
+                                error_rate=args.error_rate,
+                                throttle_rate=args.throttle_rate,
+                                invoices=args.invoices).start()
+    results = []
+    try:
+        print('{:<34} {:>8} {:>10} {:>9} {:>9} {:>10}'.format(
+            'scenario', 'calls', 'calls/s', 'p50 ms', 'p99 ms', 'peak KiB'))
+        for func in SCENARIOS:
+            if args.only and args.only not in func.__name__:
+                continue
+            client = DebitoorClient(
+                VALID_TOKEN, base_url=server.base_url,
+                pool_maxsize=args.threads,
+                retry_policy=RetryPolicy(max_attempts=5,
+                                         backoff_factor=0.01))
+            try:
+                result = func(client, server, args)
+            finally:
+                client.close()
+            results.append(result)
+            print(format_row(result))
+    finally:
+        server.stop()
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
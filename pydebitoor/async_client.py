@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio flavour of DebitoorClient.
+
+Services are shared with the blocking client: they only build URIs and
+payloads and hand them to the client, so with an AsyncDebitoorClient
+single-call methods (list, get, create, update, partial_update, delete,
+headers, copy, email, pdf and thumbnail without destination, complete,
+tax rates) return an awaitable instead of a result.
+
+Methods that stream, fan out on threads or chain calls (iter_list,
+iter_headers, list_parallel, headers_parallel, diff_update, upsert,
+get_index, bulk_*, pdf and thumbnail to a destination) and models
+(`as_model=True`) need a blocking DebitoorClient, and raise TypeError.
+`validate` only runs local checks, and raises TypeError if asked for a
+remote validation.
+
+Requires aiohttp (``pip install pydebitoor[async]``).
+"""
+import asyncio
+import logging
+
+from requests.exceptions import ConnectionError
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from .client import (DEFAULT_API_URL, DEFAULT_POOL_MAXSIZE, DEFAULT_TIMEOUT,
+                     SERVICE_MAPPING, encode_payload)
+from .errors import RequestError, NotFoundError
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+logger = logging.getLogger('pydebitoor')
+DEFAULT_MAX_CONCURRENCY = 50
+
+
+class AsyncDebitoorClient(object):
+    """
+    Debitoor API client for asyncio applications.
+
+    Parameters
+    ----------
+    access_token: str
+        Debitoor API token.
+    base_url: str
+        API base URL. Default to DEFAULT_API_URL.
+    timeout: float
+        Total timeout of a single call, in seconds.
+    pool_maxsize: int
+        Maximum number of connections kept alive per host.
+    max_concurrency: int
+        Maximum number of calls in flight at the same time. Extra calls
+        wait for a free slot, so fanning out hundreds of coroutines does
+        not exhaust sockets.
+
+    Examples
+    --------
+        >>> async with AsyncDebitoorClient('access_token') as client:
+        >>>     service = client.get_service('InvoiceService')
+        >>>     invoices = await asyncio.gather(
+        >>>         *[service.get(invoice_id) for invoice_id in ids])
+    """
+    # Checked by services to refuse methods that need a blocking client.
+    is_async = True
+
+    def __init__(self, access_token, base_url=None, timeout=DEFAULT_TIMEOUT,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        if aiohttp is None:
+            raise ImportError('AsyncDebitoorClient requires aiohttp')
+        self.access_token = access_token
+        self.base_url = base_url or DEFAULT_API_URL
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.max_concurrency = max_concurrency
+        self.session = None
+        self.__semaphore = None
+
+    def __get_session(self):
+        """
+        Lazily open the aiohttp session, which must be created
+        from within a running event loop.
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                             limit_per_host=self.pool_maxsize)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.session
+
+    async def close(self):
+        """
+        Release pooled connections.
+        """
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __make_url(self, uri):
+        return '{}{}'.format(self.base_url, uri)
+
+    def __make_header(self):
+        return {'x-token': self.access_token,
+                'Content-Type': 'application/json'}
+
+    @staticmethod
+    def __make_response(url, status, headers, content):
+        """
+        Wrap a fetched aiohttp answer into a requests Response, so errors
+        raised are the same as the blocking client ones.
+        """
+        response = Response()
+        response.url = url
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response.encoding = 'utf-8'
+        return response
+
+    async def __execute(self, method, url, **kwargs):
+        """
+        Execute API call.
+
+        Returns
+        -------
+        Call response, deserialized from Content-type
+           If JSON, perform a json.loads transformation.
+           Else, return response body as bytes.
+
+        Raises
+        ------
+        RequestError: If API call is invalid (Response code 400)
+        NotFoundError: If url is  invalid (Response code 404)
+        HTTPError: For any other error
+        """
+        session = self.__get_session()
+        params = dict((key, str(value))
+                      for key, value in (kwargs.pop('params', None)
+                                         or {}).items())
+        async with self.__semaphore:
+            try:
+                async with session.request(method, url, params=params,
+                                           headers=self.__make_header(),
+                                           **kwargs) as raw:
+                    content = await raw.read()
+                    response = self.__make_response(
+                        str(raw.url), raw.status, raw.headers, content)
+            except aiohttp.ClientConnectionError as exc:
+                raise ConnectionError(exc)
+
+        if 200 <= response.status_code <= 299:
+            if 'application/json' in response.headers.get('content-type',
+                                                          ''):
+                return response.json()
+            return response.content
+        elif response.status_code == 400:
+            logger.debug('Invalid request: %s', response.text)
+            raise RequestError(response=response)
+        elif response.status_code == 404:
+            logger.debug('Invalid API endpoint: %s', url)
+            raise NotFoundError(response=response)
+        logger.debug('API Error [HTTP Code %s]: %s',
+                     response.status_code, response.text)
+        response.raise_for_status()
+
+    async def post(self, uri, payload, **params):
+        payload = encode_payload(payload)
+        return await self.__execute('POST', self.__make_url(uri),
+                                    data=payload, params=params)
+
+    async def get(self, uri, **params):
+        return await self.__execute('GET', self.__make_url(uri),
+                                    params=params)
+
+    async def put(self, uri, payload, **params):
+        payload = encode_payload(payload)
+        return await self.__execute('PUT', self.__make_url(uri),
+                                    data=payload, params=params)
+
+    async def delete(self, uri, **params):
+        return await self.__execute('DELETE', self.__make_url(uri),
+                                    params=params)
+
+    async def patch(self, uri, payload, **params):
+        payload = encode_payload(payload)
+        return await self.__execute('PATCH', self.__make_url(uri),
+                                    data=payload, params=params)
+
+    def invalidate(self, uri):
+        """
+        No response cache on the async client, nothing to invalidate.
+        """
+
+    def get_service(self, service_name):
+        """
+        Get Debitoor service form name.
+        Service methods return awaitables when bound to this client.
+
+        Parameters
+        ----------
+        service_name:
+            Name of service. Must be one of CustomerService,
+            DraftService, InvoiceService, TaxService.
+
+        Returns
+        -------
+            Service instance.
+
+        Raises
+        -------
+            Value Error if the service does not exist
+        """
+        try:
+            return SERVICE_MAPPING[service_name](self)
+        except KeyError:
+            raise ValueError('Unknown service: %s' % service_name)
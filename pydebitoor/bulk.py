@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel execution of many independent API calls.
+"""
+import collections
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger('pydebitoor')
+DEFAULT_MAX_WORKERS = 4
+
+
+class BulkResult(collections.namedtuple('BulkResult',
+                                        ['index', 'item', 'result', 'error'])):
+    """
+    Outcome of one item of a bulk operation.
+
+    index: position of the item in the input iterable.
+    item: the input item itself.
+    result: API response, None if the call failed.
+    error: exception raised by the call (RequestError, NotFoundError, ...),
+        None if the call succeeded.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def execute_bulk(func, items, max_workers=DEFAULT_MAX_WORKERS,
+                 max_pending=None):
+    """
+    Call `func` on every item from a pool of threads.
+
+    A failing item never aborts the batch: its exception is reported
+    in the matching BulkResult.
+
+    Parameters
+    ----------
+    func: callable
+        Called with a single item.
+    items: iterable
+        Items to process. Consumed lazily, so it can be a generator.
+    max_workers: int
+        Number of calls executed concurrently.
+    max_pending: int
+        Maximum number of items read ahead from `items`.
+        Default to twice `max_workers`.
+
+    Returns
+    -------
+        Generator of BulkResult, in completion order.
+    """
+    max_pending = max_pending or 2 * max_workers
+    if max_pending < max_workers:
+        raise ValueError('max_pending must be greater than max_workers')
+
+    def run(index, item):
+        try:
+            return BulkResult(index, item, func(item), None)
+        except Exception as exc:
+            logger.debug('Bulk item %s failed: %s', index, exc)
+            return BulkResult(index, item, None, exc)
+
+    iterator = enumerate(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set(executor.submit(run, index, item)
+                      for index, item in itertools.islice(iterator,
+                                                          max_pending))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for index, item in itertools.islice(iterator, len(done)):
+                pending.add(executor.submit(run, index, item))
+            for future in done:
+                yield future.result()
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+In-process caches for API responses.
+"""
+import collections
+import copy
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from requests.compat import urlencode
+
+logger = logging.getLogger('pydebitoor')
+_MISSING = object()
+
+
+class TTLCache(object):
+    """
+    Bounded, thread-safe mapping with per-entry expiry and LRU eviction.
+
+    Parameters
+    ----------
+    maxsize: int
+        Maximum number of entries. The least recently used entry is
+        evicted when full.
+    ttl: float
+        Time to live of an entry, in seconds. None means entries never
+        expire.
+    path: str
+        Optional JSON file used to persist entries across restarts.
+        Entries are loaded at construction time and written by `save()`.
+        Keys must be strings or tuples of JSON scalars, values must be
+        JSON-serializable.
+
+    Examples
+    --------
+        >>> cache = TTLCache(maxsize=1024, ttl=3600)
+        >>> cache.set(('FR', '2016-01-01', None), rates)
+        >>> cache.get(('FR', '2016-01-01', None))
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, path=None):
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.__data = collections.OrderedDict()
+        self.__lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        """
+        Parameters
+        ----------
+        key: hashable
+            Entry key.
+        default:
+            Returned if the key is missing or expired.
+        count: bool
+            If false, do not update hit/miss counters.
+
+        Returns
+        -------
+            Cached value, or `default`.
+        """
+        with self.__lock:
+            entry = self.__data.get(key)
+            if entry is not None and entry[0] is not None \
+                    and entry[0] < time.time():
+                del self.__data[key]
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+            self.__data.pop(key)
+            self.__data[key] = entry
+            if count:
+                self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=_MISSING):
+        """
+        Store `value`, evicting the least recently used entry if full.
+
+        Parameters
+        ----------
+        ttl: float
+            Override the cache time to live for this entry.
+        """
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = None if ttl is None else time.time() + ttl
+        with self.__lock:
+            self.__data.pop(key, None)
+            self.__data[key] = (expires_at, value)
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+
+    def delete(self, key):
+        with self.__lock:
+            self.__data.pop(key, None)
+
+    def keys(self):
+        """
+        Returns
+        -------
+            Snapshot list of keys, expired ones included.
+        """
+        with self.__lock:
+            return list(self.__data)
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+
+    def stats(self):
+        """
+        Returns
+        -------
+            Dict with hits, misses and current size.
+        """
+        with self.__lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self.__data), 'maxsize': self.maxsize}
+
+    @staticmethod
+    def __dump_key(key):
+        return json.dumps(list(key) if isinstance(key, tuple) else key)
+
+    @staticmethod
+    def __load_key(raw):
+        key = json.loads(raw)
+        return tuple(key) if isinstance(key, list) else key
+
+    def save(self, path=None):
+        """
+        Write non-expired entries to `path` (default to the cache path).
+        The file is replaced atomically.
+        """
+        path = path or self.path
+        if not path:
+            raise ValueError('No path to save the cache to')
+        now = time.time()
+        with self.__lock:
+            entries = [[self.__dump_key(key), expires_at, value]
+                       for key, (expires_at, value) in self.__data.items()
+                       if expires_at is None or expires_at > now]
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(entries, tmp_file)
+            getattr(os, 'replace', os.rename)(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self, path=None):
+        """
+        Load entries saved by `save()`. Expired entries are skipped.
+        """
+        path = path or self.path
+        try:
+            with open(path) as cache_file:
+                entries = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            logger.warning('Could not load cache from %s', path,
+                           exc_info=True)
+            return
+        now = time.time()
+        with self.__lock:
+            for raw_key, expires_at, value in entries:
+                if expires_at is None or expires_at > now:
+                    self.__data[self.__load_key(raw_key)] = (expires_at,
+                                                             value)
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+
+
+class ResponseCache(object):
+    """
+    Store of JSON GET responses with their validators (ETag and
+    Last-Modified), used by DebitoorClient to send conditional requests.
+
+    Entries are partitioned by access token, so one cache can be shared by
+    several clients without leaking data between accounts.
+
+    Parameters
+    ----------
+    maxsize: int
+        Maximum number of cached responses, least recently used ones are
+        evicted first.
+    path: str
+        Optional JSON file persisting the cache, see TTLCache.
+    """
+
+    def __init__(self, maxsize=1024, path=None):
+        self.store = TTLCache(maxsize, ttl=None, path=path)
+        self.not_modified = 0
+
+    @staticmethod
+    def partition(access_token):
+        """
+        Returns
+        -------
+            Opaque partition name of an access token.
+        """
+        return hashlib.sha1(access_token.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def make_key(partition, url, params=None):
+        query = urlencode(sorted((params or {}).items()))
+        return '{} {}?{}'.format(partition, url, query)
+
+    def get(self, key):
+        """
+        Returns
+        -------
+            Dict with etag, last_modified and body keys, or None.
+        """
+        return self.store.get(key)
+
+    def validation_headers(self, entry):
+        """
+        Returns
+        -------
+            Conditional request headers matching a cached entry.
+        """
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def not_modified_body(self, entry):
+        """
+        Returns
+        -------
+            Copy of a cached body, served for a 304 answer.
+        """
+        self.not_modified += 1
+        return copy.deepcopy(entry['body'])
+
+    def save_response(self, key, response, body):
+        """
+        Cache a decoded body if the response carries validators.
+        """
+        etag = response.headers.get('etag')
+        last_modified = response.headers.get('last-modified')
+        if etag or last_modified:
+            self.store.set(key, {'etag': etag,
+                                 'last_modified': last_modified,
+                                 'body': copy.deepcopy(body)})
+
+    def invalidate(self, partition, url_prefix):
+        """
+        Drop every entry of a partition whose URL starts with `url_prefix`.
+        """
+        prefix = '{} {}'.format(partition, url_prefix)
+        for key in self.store.keys():
+            if key.startswith(prefix):
+                self.store.delete(key)
+
+    def stats(self):
+        stats = self.store.stats()
+        stats['not_modified'] = self.not_modified
+        return stats
+
+    def save(self, path=None):
+        self.store.save(path)
+
+
+def cached_call(cache, key, func, *args, **kwargs):
+    """
+    Return `func(*args, **kwargs)`, memoized in `cache` under `key`.
+    A copy is returned so callers cannot alter the cached value.
+    """
+    if cache is None:
+        return func(*args, **kwargs)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = func(*args, **kwargs)
+        cache.set(key, value)
+    return copy.deepcopy(value)
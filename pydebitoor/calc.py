@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Batched computation of draft and invoice totals.
+
+Lines of many drafts are processed together as columns: line amounts,
+per-rate tax breakdowns and totals are computed with NumPy when it is
+installed, with an equivalent pure Python loop otherwise. Amounts are
+handled in integer cents, rounded half up, so both give identical
+results.
+
+Tax is computed per draft and per rate on the sum of line amounts, and
+missing line tax rates default to the customer country rate, read from
+the cached TaxService.
+
+Examples
+--------
+    >>> calculator = TaxCalculator(client.get_service('TaxService'))
+    >>> totals = calculator.compute(drafts)
+    >>> totals[0]['totalGrossAmount'], totals[0]['taxes']
+    >>> for payload, totals in calculator.prepare(drafts):
+    >>>     client.get_service('DraftService').create(payload)
+"""
+import datetime
+import math
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from .services.invoice import DATE_FORMAT
+
+# Absorbs binary representation errors such as 1.005 * 100 == 100.4999...
+ROUNDING_EPSILON = 1e-7
+
+
+def _round_cents(value):
+    """
+    Round an amount in cents half up, away from zero.
+    """
+    rounded = math.floor(abs(value) + 0.5 + ROUNDING_EPSILON)
+    return int(-rounded if value < 0 else rounded)
+
+
+def _round_cents_array(values):
+    return (numpy.sign(values) * numpy.floor(
+        numpy.abs(values) + 0.5 + ROUNDING_EPSILON)).astype(numpy.int64)
+
+
+class LineColumns(object):
+    """
+    Lines of several drafts, as columns.
+    """
+    __slots__ = ('owners', 'quantities', 'prices', 'discounts', 'rates',
+                 'gross', 'offsets')
+
+    def __init__(self):
+        self.owners = []
+        self.quantities = []
+        self.prices = []
+        self.discounts = []
+        self.rates = []
+        self.gross = []
+        self.offsets = [0]
+
+    def __len__(self):
+        return len(self.owners)
+
+
+class TaxCalculator(object):
+    """
+    Compute line amounts, per-rate tax and totals of many drafts at once.
+
+    Parameters
+    ----------
+    tax_service: TaxService
+        Used to fill missing line tax rates with the customer country
+        default rate and, if `check_rates`, to reject rates not applicable
+        to the customer country. Lookups go through the client tax cache.
+    check_rates: bool
+        Check explicit line tax rates against the applicable ones.
+    use_numpy: bool
+        Force (True) or disable (False) NumPy. Default to NumPy if
+        installed.
+    """
+
+    def __init__(self, tax_service=None, check_rates=True, use_numpy=None):
+        if use_numpy and numpy is None:
+            raise ImportError('use_numpy requires numpy')
+        self.tax_service = tax_service
+        self.check_rates = check_rates
+        self.use_numpy = numpy is not None if use_numpy is None \
+            else use_numpy
+
+    def _tax_rates(self, draft, cache):
+        """
+        (default rate, applicable rates) of the draft customer country at
+        the draft date.
+        """
+        country = draft.get('customerCountry')
+        date = draft.get('date') or \
+            datetime.date.today().strftime(DATE_FORMAT)
+        key = (country, date)
+        if key not in cache:
+            if self.tax_service is None or not country:
+                raise ValueError('Lines without taxRate require a '
+                                 'customerCountry and a tax_service')
+            rates = self.tax_service.sale_tax_rates(
+                country, date, as_model=False).get('baseTax') or {}
+            cache[key] = (rates.get('defaultRate'),
+                          frozenset(rates.get('rates') or ()))
+        return cache[key]
+
+    def _columns(self, drafts, resolved=None):
+        """
+        Extract line columns, resolving tax rates.
+
+        Parameters
+        ----------
+        resolved: list
+            If given, receives for each draft the list of line tax rates.
+        """
+        columns = LineColumns()
+        cache = {}
+        owners, quantities = columns.owners, columns.quantities
+        prices, discounts = columns.prices, columns.discounts
+        line_rates, line_gross = columns.rates, columns.gross
+        for index, draft in enumerate(drafts):
+            if hasattr(draft, 'to_dict'):
+                draft = draft.to_dict()
+            gross = draft.get('priceDisplayType') == 'gross'
+            price_field = 'unitGrossPrice' if gross else 'unitNetPrice'
+            check = self.check_rates and self.tax_service is not None and \
+                bool(draft.get('customerCountry'))
+            tax_rates = None
+            rates = []
+            for line_index, line in enumerate(draft.get('lines') or ()):
+                if not isinstance(line, dict):
+                    line = line.to_dict()
+                price = line.get(price_field)
+                if price is None:
+                    raise ValueError('Draft {} line {} has no {}'.format(
+                        index, line_index, price_field))
+                rate = line.get('taxRate')
+                if line.get('taxEnabled') is False:
+                    rate = 0
+                elif rate is None or check:
+                    if tax_rates is None:
+                        tax_rates = self._tax_rates(draft, cache)
+                    if rate is None:
+                        rate = tax_rates[0] or 0
+                    elif rate not in tax_rates[1]:
+                        raise ValueError(
+                            'Draft {} line {}: tax rate {} not applicable '
+                            'in {}'.format(index, line_index, rate,
+                                           draft['customerCountry']))
+                rates.append(rate)
+                quantities.append(line.get('quantity') or 0)
+                prices.append(price)
+                discounts.append(line.get('discountRate') or 0)
+            owners.extend([index] * len(rates))
+            line_rates.extend(rates)
+            line_gross.extend([gross] * len(rates))
+            columns.offsets.append(len(columns))
+            if resolved is not None:
+                resolved.append(rates)
+        return columns
+
+    def compute(self, drafts, lines=True):
+        """
+        Parameters
+        ----------
+        drafts: list
+            Drafts or invoices, as dicts or `pydebitoor.models` entities,
+            with `lines` holding quantity, unitNetPrice (or unitGrossPrice
+            when priceDisplayType is 'gross'), discountRate and taxRate.
+        lines: bool
+            Include per-line amounts in the results.
+
+        Returns
+        -------
+            List of dicts, one per draft, with totalNetAmount,
+            totalTaxAmount, totalGrossAmount, `taxes` (list of rate,
+            netAmount, taxAmount) and, if `lines`, a `lines` dict of
+            netAmount, taxAmount and grossAmount lists.
+
+        Raises
+        ------
+        ValueError if a line has no price, or a tax rate that is missing
+        and cannot be resolved, or is not applicable.
+        """
+        drafts = list(drafts)
+        columns = self._columns(drafts)
+        if self.use_numpy:
+            return self._compute_numpy(columns, len(drafts), lines)
+        return self._compute_python(columns, len(drafts), lines)
+
+    def prepare(self, drafts):
+        """
+        Resolve tax rates and compute totals of drafts to create.
+
+        Returns
+        -------
+            List of (payload, totals) pairs. Payloads are copies of the
+            drafts whose lines all have an explicit taxRate, ready for
+            `DraftService.create`; totals are as returned by `compute`.
+        """
+        drafts = [draft.to_dict() if hasattr(draft, 'to_dict') else draft
+                  for draft in drafts]
+        resolved = []
+        columns = self._columns(drafts, resolved)
+        compute = self._compute_numpy if self.use_numpy \
+            else self._compute_python
+        results = compute(columns, len(drafts), False)
+        prepared = []
+        for draft, rates, totals in zip(drafts, resolved, results):
+            payload = dict(draft)
+            payload['lines'] = [
+                dict(line.to_dict() if hasattr(line, 'to_dict') else line,
+                     taxRate=rate)
+                for line, rate in zip(draft.get('lines') or (), rates)]
+            prepared.append((payload, totals))
+        return prepared
+
+    @staticmethod
+    def _result(net, tax, taxes):
+        return {'totalNetAmount': net / 100.0,
+                'totalTaxAmount': tax / 100.0,
+                'totalGrossAmount': (net + tax) / 100.0,
+                'taxes': [{'rate': rate, 'netAmount': rate_net / 100.0,
+                           'taxAmount': rate_tax / 100.0}
+                          for rate, rate_net, rate_tax in taxes]}
+
+    def _compute_python(self, columns, count, lines):
+        line_net, line_gross = [], []
+        groups = [{} for _ in range(count)]
+        for owner, quantity, price, discount, rate, gross in zip(
+                columns.owners, columns.quantities, columns.prices,
+                columns.discounts, columns.rates, columns.gross):
+            cents = _round_cents(quantity * price * (100 - discount))
+            if gross:
+                other = _round_cents(cents * 100.0 / (100 + rate))
+                line_net.append(other)
+                line_gross.append(cents)
+            else:
+                other = _round_cents(cents * (100 + rate) / 100.0)
+                line_net.append(cents)
+                line_gross.append(other)
+            group = groups[owner]
+            group[rate] = group.get(rate, 0) + cents
+
+        results = []
+        for index, group in enumerate(groups):
+            gross = columns.gross[columns.offsets[index]] \
+                if columns.offsets[index] < len(columns) else False
+            taxes, total_net, total_tax = [], 0, 0
+            for rate in sorted(group):
+                amount = group[rate]
+                if gross:
+                    net = _round_cents(amount * 100.0 / (100 + rate))
+                    tax = amount - net
+                else:
+                    net = amount
+                    tax = _round_cents(amount * rate / 100.0)
+                taxes.append((rate, net, tax))
+                total_net += net
+                total_tax += tax
+            result = self._result(total_net, total_tax, taxes)
+            if lines:
+                start, end = columns.offsets[index], columns.offsets[index + 1]
+                result['lines'] = {
+                    'netAmount': [value / 100.0
+                                  for value in line_net[start:end]],
+                    'taxAmount': [(gross_value - net_value) / 100.0
+                                  for net_value, gross_value in zip(
+                                      line_net[start:end],
+                                      line_gross[start:end])],
+                    'grossAmount': [value / 100.0
+                                    for value in line_gross[start:end]]}
+            results.append(result)
+        return results
+
+    def _compute_numpy(self, columns, count, lines):
+        if not len(columns):
+            return self._compute_python(columns, count, lines)
+        owners = numpy.asarray(columns.owners, dtype=numpy.int64)
+        rates = numpy.asarray(columns.rates, dtype=numpy.float64)
+        gross = numpy.asarray(columns.gross, dtype=bool)
+        cents = _round_cents_array(
+            numpy.asarray(columns.quantities, dtype=numpy.float64) *
+            numpy.asarray(columns.prices, dtype=numpy.float64) *
+            (100 - numpy.asarray(columns.discounts, dtype=numpy.float64)))
+        other = _round_cents_array(cents * numpy.where(
+            gross, 100.0 / (100 + rates), (100 + rates) / 100.0))
+        line_net = numpy.where(gross, other, cents)
+        line_gross = numpy.where(gross, cents, other)
+
+        # One group per (draft, rate): sum line amounts with bincount.
+        rate_values, rate_index = numpy.unique(rates, return_inverse=True)
+        width = len(rate_values)
+        keys = owners * width + rate_index.ravel()
+        amounts = numpy.rint(numpy.bincount(
+            keys, weights=cents, minlength=count * width)).astype(
+                numpy.int64).reshape(count, width)
+        present = numpy.bincount(
+            keys, minlength=count * width).reshape(count, width) > 0
+        draft_gross = numpy.zeros(count, dtype=bool)
+        draft_gross[owners] = gross
+        draft_gross = draft_gross[:, numpy.newaxis]
+        net = numpy.where(
+            draft_gross,
+            _round_cents_array(amounts * (100.0 / (100 + rate_values))),
+            amounts)
+        tax = numpy.where(
+            draft_gross, amounts - net,
+            _round_cents_array(amounts * (rate_values / 100.0)))
+        net = numpy.where(present, net, 0)
+        tax = numpy.where(present, tax, 0)
+        total_net = net.sum(axis=1).tolist()
+        total_tax = tax.sum(axis=1).tolist()
+
+        rate_list = rate_values.tolist()
+        rate_list = [int(rate) if rate == int(rate) else rate
+                     for rate in rate_list]
+        net_rows, tax_rows = net.tolist(), tax.tolist()
+        present_rows = present.tolist()
+        if lines:
+            line_net_list = (line_net / 100.0).tolist()
+            line_tax_list = ((line_gross - line_net) / 100.0).tolist()
+            line_gross_list = (line_gross / 100.0).tolist()
+        results = []
+        for index in range(count):
+            result = self._result(
+                total_net[index], total_tax[index],
+                [(rate, rate_net, rate_tax)
+                 for rate, rate_net, rate_tax, used in zip(
+                     rate_list, net_rows[index], tax_rows[index],
+                     present_rows[index]) if used])
+            if lines:
+                start, end = columns.offsets[index], columns.offsets[index + 1]
+                result['lines'] = {'netAmount': line_net_list[start:end],
+                                   'taxAmount': line_tax_list[start:end],
+                                   'grossAmount': line_gross_list[start:end]}
+            results.append(result)
+        return results
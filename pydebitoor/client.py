@@ -1,16 +1,37 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
+import os
+import time
 
 import requests
-from requests.exceptions import ConnectionError, HTTPError
-
-from .errors import RequestError, NotFoundError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+from .cache import ResponseCache, TTLCache
+from .errors import (ApiConnectionError, RequestError, NotFoundError,
+                     RateLimitError)
+from .ratelimit import RateLimiter, monotonic, parse_retry_after
+from .retry import RetryPolicy
+from .singleflight import SingleFlight
+from .streaming import DEFAULT_CHUNK_SIZE, iter_json_array
 from .services import (CustomerService, InvoiceService, DraftService,
                        TaxService)
 
 logger = logging.getLogger('pydebitoor')
 DEFAULT_API_URL = 'https://api.debitoor.com/api'
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_THROTTLE_RETRIES = 3
+DEFAULT_THROTTLE_DELAY = 1.0
+DEFAULT_TAX_CACHE_SIZE = 1024
+DEFAULT_TAX_CACHE_TTL = 24 * 3600
+DEFAULT_RESPONSE_CACHE_SIZE = 1024
+DEFAULT_VERIFY_TTL = 3600
+# Tokens known to be valid, shared by every client of the process.
+VERIFIED_CREDENTIALS = TTLCache(maxsize=4096, ttl=DEFAULT_VERIFY_TTL)
+HOOK_EVENTS = ('before_request', 'after_response', 'on_error')
 SERVICE_MAPPING = {
     'CustomerService': CustomerService,
     'DraftService': DraftService,
@@ -19,28 +40,226 @@ SERVICE_MAPPING = {
 }
 
 
-class DebitoorClient(object):
+def encode_payload(payload):
+    """
+    JSON-encode dicts and `pydebitoor.models` entities,
+    leave other payloads untouched.
+    """
+    if hasattr(payload, 'to_dict'):
+        payload = payload.to_dict()
+    if isinstance(payload, dict):
+        return json.dumps(payload)
+    return payload
+
+
+def make_session(pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False):
+    """
+    Build a keep-alive HTTP session backed by a connection pool.
+
+    Parameters
+    ----------
+    pool_connections: int
+        Number of per-host connection pools to cache.
+    pool_maxsize: int
+        Maximum number of connections kept alive per host.
+    pool_block: bool
+        If true, block when no free connection is available instead of
+        opening a throw-away one.
+
+    Returns
+    -------
+        requests.Session instance.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 
-    def __init__(self, access_token, base_url=None):
+class DebitoorClient(object):
+    """
+    Debitoor API client.
+
+    Every service returned by `get_service` shares the client HTTP session,
+    so TCP/TLS connections to the API are kept alive and reused.
+    The underlying urllib3 pool is thread-safe: a single client can be
+    used from several threads.
+
+    Parameters
+    ----------
+    access_token: str
+        Debitoor API token.
+    base_url: str
+        API base URL. Default to DEFAULT_API_URL.
+    timeout: float or tuple
+        Default (connect, read) timeout applied to every call.
+    pool_connections: int
+        Number of per-host connection pools to cache.
+    pool_maxsize: int
+        Maximum number of connections kept alive per host.
+    pool_block: bool
+        Block when the pool is exhausted instead of opening
+        extra connections.
+    session: requests.Session
+        Use an existing session instead of creating one. A session given
+        here is not closed by `close()`.
+    rate_limiter: RateLimiter or float
+        Token bucket shared by every call of this client. A number is
+        taken as a rate in calls per second. Pass the same RateLimiter to
+        several clients to share a quota.
+    max_throttle_retries: int
+        Number of times a call answered by a 429 is replayed, after
+        waiting for the Retry-After delay, before RateLimitError is raised.
+    retry_policy: RetryPolicy
+        Policy used to replay calls failing with connection errors or
+        transient HTTP codes. Default to RetryPolicy(), pass
+        `pydebitoor.retry.NO_RETRY` to disable retries.
+    tax_cache: TTLCache or bool
+        Cache of TaxService answers. True builds a default one
+        (1024 entries, kept one day), False disables caching.
+    response_cache: ResponseCache or bool
+        Cache of GET responses revalidated with ETag/Last-Modified
+        conditional requests. True builds a default one. Entries are
+        invalidated by writes made through services. Disabled by default.
+    coalesce: bool
+        If true, concurrent identical GET calls (same URI and parameters)
+        share a single API call. See `single_flight.stats()` for the number
+        of coalesced calls.
+    verify_credentials: bool
+        If true, check the access token at construction time with
+        `verify()`. Construction does not call the API otherwise: invalid
+        tokens are reported by the first call.
+    models: bool
+        If true, services return `pydebitoor.models` entities instead of
+        dicts. Can be overridden per call with `as_model`.
+
+    Examples
+    --------
+        >>> with DebitoorClient('access_token', pool_maxsize=20) as client:
+        >>>     client.get_service('CustomerService').list()
+    """
+
+    def __init__(self, access_token, base_url=None, timeout=DEFAULT_TIMEOUT,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False,
+                 session=None, rate_limiter=None,
+                 max_throttle_retries=DEFAULT_MAX_THROTTLE_RETRIES,
+                 retry_policy=None, tax_cache=True, response_cache=None,
+                 coalesce=False, verify_credentials=False, models=False):
         self.access_token = access_token
         self.base_url = base_url or DEFAULT_API_URL
-        self.__ensure_credentials()
+        self.timeout = timeout
+        self.__owns_session = session is None
+        if session is None:
+            session = make_session(pool_connections, pool_maxsize,
+                                   pool_block)
+        self.session = session
+        if rate_limiter is not None and \
+                not isinstance(rate_limiter, RateLimiter):
+            rate_limiter = RateLimiter(rate_limiter)
+        self.rate_limiter = rate_limiter
+        self.max_throttle_retries = max_throttle_retries
+        self.retry_policy = retry_policy or RetryPolicy()
+        if tax_cache is True:
+            tax_cache = TTLCache(DEFAULT_TAX_CACHE_SIZE,
+                                 DEFAULT_TAX_CACHE_TTL)
+        elif tax_cache is False:
+            tax_cache = None
+        self.tax_cache = tax_cache
+        if response_cache is True:
+            response_cache = ResponseCache(DEFAULT_RESPONSE_CACHE_SIZE)
+        self.response_cache = response_cache or None
+        self.__cache_partition = ResponseCache.partition(access_token)
+        self.single_flight = SingleFlight() if coalesce else None
+        self.hooks = dict((event, []) for event in HOOK_EVENTS)
+        self.models = models
+        self.__services = {}
+        if verify_credentials:
+            self.verify()
+
+    def close(self):
+        """
+        Release pooled connections.
+        Sessions given at construction time are left open.
+        """
+        if self.__owns_session:
+            self.session.close()
+
+    def add_hook(self, event, hook):
+        """
+        Register an instrumentation hook, called for every attempt of
+        every API call.
+
+        Parameters
+        ----------
+        event: str
+            One of:
+            - 'before_request': hook(method, url, attempt, kwargs)
+            - 'after_response': hook(method, url, response, elapsed, attempt)
+            - 'on_error': hook(method, url, error, elapsed, attempt)
+            `attempt` starts at 1 and grows with each retry, `elapsed` is
+            in seconds.
+        hook: callable
+            Exceptions raised by hooks propagate to the caller.
+        """
+        if event not in self.hooks:
+            raise ValueError('Unknown hook event: %s' % event)
+        self.hooks[event].append(hook)
 
-    def __ensure_credentials(self):
+    def remove_hook(self, event, hook):
+        self.hooks[event].remove(hook)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def cache_partition(self):
+        """
+        Opaque name of the access token, used to partition caches shared
+        between clients.
+        """
+        return self.__cache_partition
+
+    def verify(self, ttl=DEFAULT_VERIFY_TTL):
         """
         Check if credentials are valid by performing a
         base query.
 
+        Successful checks are memoized per token and API URL for `ttl`
+        seconds, for every client of the process.
+
+        Parameters
+        ----------
+        ttl: float
+            How long a successful check is remembered, in seconds.
+            0 forces a new check.
+
+        Returns
+        -------
+            True
+
         Raises
         ------
-        ConnectionError if credentials are invalid.
+        ApiConnectionError (a ConnectionError) if credentials are invalid.
 
         """
+        key = (self.base_url, self.__cache_partition)
+        if ttl and VERIFIED_CREDENTIALS.get(key, count=False):
+            return True
         try:
             self.get('/environment/v1')
         except HTTPError as exc:
             logger.exception('Could not connect to the API')
-            raise ConnectionError(exc)
+            raise ApiConnectionError(exc)
+        if ttl:
+            VERIFIED_CREDENTIALS.set(key, True, ttl=ttl)
+        return True
 
     def __make_url(self, uri):
         """
@@ -67,6 +286,128 @@ class DebitoorClient(object):
         return {'x-token': self.access_token,
                 'Content-Type': 'application/json'}
 
+    @staticmethod
+    def __attempt_timeout(timeout, deadline_at):
+        """
+        Shrink a call timeout so it does not run past the deadline.
+        """
+        if deadline_at is None:
+            return timeout
+        remaining = max(0.001, deadline_at - monotonic())
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(remaining if part is None else min(part, remaining)
+                         for part in timeout)
+        return min(timeout, remaining)
+
+    def __retry_delay(self, method, attempt, deadline_at, response=None,
+                      error=None):
+        """
+        Returns
+        -------
+            Seconds to wait before replaying a failed call,
+            None if it must not be replayed.
+        """
+        policy = self.retry_policy
+        if attempt >= policy.max_attempts or \
+                not policy.is_retryable(method, response, error):
+            return None
+        delay = policy.backoff(attempt)
+        if response is not None:
+            retry_after = parse_retry_after(
+                response.headers.get('retry-after'))
+            delay = max(delay, retry_after or 0)
+        if deadline_at is not None and monotonic() + delay >= deadline_at:
+            return None
+        return delay
+
+    def __send(self, method, url, **kwargs):
+        """
+        Send a request through the rate limiter and the retry policy.
+
+        Calls answered by a 429 are replayed after waiting for the
+        Retry-After delay, up to `max_throttle_retries` times.
+        Connection errors and transient HTTP codes are replayed according
+        to `retry_policy`.
+
+        Returns
+        -------
+            requests.Response
+
+        Raises
+        ------
+        RateLimitError: If the API still answers 429 after all replays.
+        ConnectionError: If the API cannot be reached after all retries.
+        """
+        headers = self.__make_header()
+        headers.update(kwargs.pop('headers', {}))
+        timeout = kwargs.pop('timeout', self.timeout)
+        deadline_at = None
+        if self.retry_policy.deadline is not None:
+            deadline_at = monotonic() + self.retry_policy.deadline
+        attempt = throttled = 0
+        while True:
+            attempt += 1
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            for hook in self.hooks['before_request']:
+                hook(method, url, attempt + throttled, kwargs)
+            started_at = monotonic()
+            try:
+                response = self.session.request(
+                    method, url, headers=headers,
+                    timeout=self.__attempt_timeout(timeout, deadline_at),
+                    **kwargs)
+            except Exception as exc:
+                for hook in self.hooks['on_error']:
+                    hook(method, url, exc, monotonic() - started_at,
+                         attempt + throttled)
+                if not isinstance(exc, (ConnectionError, Timeout)):
+                    raise
+                delay = self.__retry_delay(method, attempt, deadline_at,
+                                           error=exc)
+                if delay is None:
+                    raise
+                logger.debug('Retrying %s %s in %.2fs after error: %s',
+                             method, url, delay, exc)
+                time.sleep(delay)
+                continue
+
+            for hook in self.hooks['after_response']:
+                hook(method, url, response, monotonic() - started_at,
+                     attempt + throttled)
+            if response.status_code == 429:
+                retry_after = parse_retry_after(
+                    response.headers.get('retry-after'))
+                logger.debug('API throttled %s %s, retry after %ss',
+                             method, url, retry_after)
+                if self.rate_limiter is not None:
+                    self.rate_limiter.on_throttled(retry_after)
+                delay = DEFAULT_THROTTLE_DELAY if retry_after is None \
+                    else retry_after
+                if throttled >= self.max_throttle_retries or \
+                        (deadline_at is not None and
+                         monotonic() + delay >= deadline_at):
+                    raise RateLimitError(retry_after, response=response)
+                throttled += 1
+                attempt -= 1
+                response.close()
+                if self.rate_limiter is None:
+                    time.sleep(delay)
+                continue
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.on_success()
+            delay = self.__retry_delay(method, attempt, deadline_at,
+                                       response=response)
+            if delay is None:
+                return response
+            logger.debug('Retrying %s %s in %.2fs after HTTP %s',
+                         method, url, delay, response.status_code)
+            response.close()
+            time.sleep(delay)
+
     def __execute(self, method, url, **kwargs):
         """
         Execute API call.
@@ -90,16 +431,27 @@ class DebitoorClient(object):
         ------
         RequestError: If API call is invalid (Response code 400)
         NotFoundError: If url is  invalid (Response code 404)
+        RateLimitError: If API kept throttling the call (Response code 429)
         HTTPError: For any other error
         """
-        headers = self.__make_header()
-        headers.update(kwargs.pop('headers', {}))
-        response = requests.request(method, url, headers=headers, **kwargs)
+        return self.__decode(self.__send(method, url, **kwargs), url)
+
+    def __decode(self, response, url):
+        """
+        Deserialize a response, or raise the matching error.
+        """
         if 200 <= response.status_code <= 299:
             if 'application/json' in response.headers['content-type']:
                 return response.json()
             return response.content
-        elif response.status_code == 400:
+        self.__raise_for_status(response, url)
+
+    @staticmethod
+    def __raise_for_status(response, url):
+        """
+        Raise the exception matching an error response.
+        """
+        if response.status_code == 400:
             logger.debug('Invalid request: %s', response.text)
             raise RequestError(response=response)
         elif response.status_code == 404:
@@ -115,7 +467,7 @@ class DebitoorClient(object):
         ----------
         uri: str
             URI of the resource (without API base url)
-        payload: dict
+        payload: dict or pydebitoor.models.Model
             POST arguments.
         params: dict
             Querystring parameters
@@ -129,8 +481,7 @@ class DebitoorClient(object):
         NotFoundError: If url is  invalid (Response code 404)
         HTTPError: For any other error
         """
-        if isinstance(payload, dict):
-            payload = json.dumps(payload)
+        payload = encode_payload(payload)
         return self.__execute('POST', self.__make_url(uri),
                               data=payload, params=params)
 
@@ -154,7 +505,148 @@ class DebitoorClient(object):
         NotFoundError: If url is  invalid (Response code 404)
         HTTPError: For any other error
         """
-        return self.__execute('GET', self.__make_url(uri), params=params)
+        url = self.__make_url(uri)
+        if self.single_flight is not None:
+            key = ResponseCache.make_key(self.__cache_partition, url, params)
+            return self.single_flight.do(key, self.__get, url, params)
+        return self.__get(url, params)
+
+    def __get(self, url, params):
+        if self.response_cache is None:
+            return self.__execute('GET', url, params=params)
+        return self.__conditional_get(url, params)
+
+    def __conditional_get(self, url, params):
+        """
+        GET through the response cache: a cached response is revalidated
+        with a conditional request and served again on a 304 answer.
+        """
+        cache = self.response_cache
+        key = cache.make_key(self.__cache_partition, url, params)
+        entry = cache.get(key)
+        response = self.__send('GET', url, params=params,
+                               headers=cache.validation_headers(entry))
+        if response.status_code == 304 and entry is not None:
+            return cache.not_modified_body(entry)
+        result = self.__decode(response, url)
+        if 'application/json' in response.headers['content-type']:
+            cache.save_response(key, response, result)
+        return result
+
+    def download(self, uri, destination, chunk_size=DEFAULT_CHUNK_SIZE,
+                 **params):
+        """
+        Stream a binary resource (PDF, thumbnail...) to a file, chunk by
+        chunk, without loading it in memory.
+
+        Parameters
+        ----------
+        uri: str
+            URI of the resource (without API base url)
+        destination: str or file-like
+            Path of the file to write, or object with a `write` method.
+            A path is written to a temporary '.part' file renamed once the
+            download is complete, so it never holds a truncated file.
+        chunk_size: int
+            Number of bytes read from the socket at once.
+        params: dict
+            Querystring parameters
+        Returns
+        -------
+            Number of bytes written.
+
+        Raises
+        ------
+        RequestError: If API call is invalid (Response code 400)
+        NotFoundError: If url is  invalid (Response code 404)
+        HTTPError: For any other error
+        """
+        url = self.__make_url(uri)
+        response = self.__send('GET', url, params=params, stream=True)
+        try:
+            if not 200 <= response.status_code <= 299:
+                self.__raise_for_status(response, url)
+            if hasattr(destination, 'write'):
+                return self.__write_chunks(response, destination,
+                                           chunk_size)
+            part_path = destination + '.part'
+            try:
+                with open(part_path, 'wb') as part_file:
+                    size = self.__write_chunks(response, part_file,
+                                               chunk_size)
+                getattr(os, 'replace', os.rename)(part_path, destination)
+            except Exception:
+                if os.path.exists(part_path):
+                    os.unlink(part_path)
+                raise
+            return size
+        finally:
+            response.close()
+
+    @staticmethod
+    def __write_chunks(response, fileobj, chunk_size):
+        size = 0
+        for chunk in response.iter_content(chunk_size):
+            fileobj.write(chunk)
+            size += len(chunk)
+        return size
+
+    def invalidate(self, uri):
+        """
+        Drop cached responses of every URI starting with `uri`, and stop
+        sharing GET calls in flight on them. Called by services after each
+        write.
+
+        Parameters
+        ----------
+        uri: str
+            URI prefix of the resource (without API base url)
+        """
+        url = self.__make_url(uri)
+        if self.response_cache is not None:
+            self.response_cache.invalidate(self.__cache_partition, url)
+        if self.single_flight is not None:
+            self.single_flight.forget(
+                '{} {}'.format(self.__cache_partition, url))
+
+    def get_stream(self, uri, decoder=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   **params):
+        """
+        Perform a GET call returning a JSON array, and decode its items
+        incrementally as they are read from the socket.
+
+        Parameters
+        ----------
+        uri: str
+            URI of the resource (without API base url)
+        decoder: object
+            JSON decoder with a `raw_decode` method,
+            see `pydebitoor.streaming.iter_json_array`.
+        chunk_size: int
+            Number of bytes read from the socket at once.
+        params: dict
+            Querystring parameters
+        Returns
+        -------
+            Generator of decoded items.
+
+        Raises
+        ------
+        RequestError: If API call is invalid (Response code 400)
+        NotFoundError: If url is  invalid (Response code 404)
+        HTTPError: For any other error
+        ValueError: If the response is not a JSON array
+        """
+        url = self.__make_url(uri)
+        response = self.__send('GET', url, params=params, stream=True)
+        try:
+            if not 200 <= response.status_code <= 299:
+                self.__raise_for_status(response, url)
+            for item in iter_json_array(response.iter_content(chunk_size),
+                                        decoder):
+                yield item
+        finally:
+            response.close()
 
     def put(self, uri, payload, **params):
         """
@@ -164,7 +656,7 @@ class DebitoorClient(object):
         ----------
         uri: str
             URI of the resource (without API base url)
-        payload: dict
+        payload: dict or pydebitoor.models.Model
             POST arguments.
         params: dict
             Querystring parameters
@@ -178,8 +670,7 @@ class DebitoorClient(object):
         NotFoundError: If url is  invalid (Response code 404)
         HTTPError: For any other error
         """
-        if isinstance(payload, dict):
-            payload = json.dumps(payload)
+        payload = encode_payload(payload)
         return self.__execute('PUT', self.__make_url(uri), data=payload,
                               params=params)
 
@@ -213,7 +704,7 @@ class DebitoorClient(object):
         ----------
         uri: str
             URI of the resource (without API base url)
-        payload: dict
+        payload: dict or pydebitoor.models.Model
             POST arguments.
         params: dict
             Querystring parameters
@@ -227,6 +718,7 @@ class DebitoorClient(object):
         NotFoundError: If url is  invalid (Response code 404)
         HTTPError: For any other error
         """
+        payload = encode_payload(payload)
         return self.__execute('PATCH', self.__make_url(uri),
                               data=payload, params=params)
 
@@ -242,13 +734,18 @@ class DebitoorClient(object):
 
         Returns
         -------
-            Service instance.
+            Service instance, the same for every call with a given name.
 
         Raises
         -------
             Value Error if the service does not exist
         """
-        try:
-            return SERVICE_MAPPING[service_name](self)
-        except KeyError:
-            raise ValueError('Unknown service: %s' % service_name)
+        service = self.__services.get(service_name)
+        if service is None:
+            try:
+                service_class = SERVICE_MAPPING[service_name]
+            except KeyError:
+                raise ValueError('Unknown service: %s' % service_name)
+            service = self.__services.setdefault(service_name,
+                                                 service_class(self))
+        return service
@@ -11,10 +11,16 @@ class ApiConnectionError(ConnectionError):
 class RequestError(HTTPError):
     def __init__(self, *args, **kwargs):
         super(RequestError, self).__init__(*args, **kwargs)
-        if self.response:
-            self.errors = self.response.json()['errors']
-        else:
-            self.errors = {}
+        self.errors = {}
+        if self.response is not None:
+            # 400 bodies are not always JSON (proxies answer with HTML) and
+            # do not always carry `errors`.
+            try:
+                body = self.response.json()
+            except ValueError:
+                body = None
+            if isinstance(body, dict):
+                self.errors = body.get('errors') or {}
 
     def __str__(self):
         return 'Invalid request: %s' % pprint.pformat(self.errors)
@@ -30,5 +36,15 @@ class NotFoundError(HTTPError):
         return 'API endpoint not found: %s' % self.url
 
 
+class RateLimitError(HTTPError):
+
+    def __init__(self, retry_after=None, *args, **kwargs):
+        super(RateLimitError, self).__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return 'API rate limit exceeded, retry after %ss' % self.retry_after
+
+
 class ApiError(HTTPError):
     pass
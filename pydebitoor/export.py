@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming columnar export of customers and invoices.
+
+Entities are read lazily from the services (`iter_list`, `iter_headers`)
+and written in column batches of `batch_size` rows, so memory stays
+bounded whatever the export size. Every export has a fixed schema: missing
+fields are written as nulls and unknown fields are dropped.
+
+CSV needs no extra dependency. Arrow record batches and Parquet files
+require pyarrow (``pip install pydebitoor[arrow]``).
+
+Examples
+--------
+    >>> service = client.get_service('InvoiceService')
+    >>> export_invoices(service, 'invoices.parquet', '2016-01-01',
+    >>>                 '2016-12-31', format='parquet')
+    >>> export_invoices(service, 'lines.csv', '2016-01-01', lines=True)
+    >>> for batch in iter_record_batches(service.iter_headers(),
+    >>>                                  INVOICE_SCHEMA):
+    >>>     table = batch.to_pandas()
+"""
+import collections
+import csv
+import io
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+# The Python 2 csv module writes byte strings only.
+CSV_BYTES = text_type is not str
+
+DEFAULT_BATCH_SIZE = 10000
+
+STRING = 'string'
+INTEGER = 'int64'
+FLOAT = 'float64'
+BOOLEAN = 'bool'
+
+CUSTOMER_SCHEMA = (
+    ('id', STRING), ('number', INTEGER), ('name', STRING),
+    ('email', STRING), ('phone', STRING), ('address', STRING),
+    ('countryCode', STRING), ('ciNumber', STRING), ('vatNumber', STRING),
+    ('paymentTermsId', INTEGER), ('paymentTermsDays', INTEGER),
+    ('isArchived', BOOLEAN), ('createdDate', STRING),
+    ('lastModified', STRING))
+
+INVOICE_SCHEMA = (
+    ('id', STRING), ('number', INTEGER), ('type', STRING),
+    ('date', STRING), ('dueDate', STRING), ('customerId', STRING),
+    ('customerName', STRING), ('customerCountry', STRING),
+    ('currency', STRING), ('currencyRate', FLOAT),
+    ('totalNetAmount', FLOAT), ('totalTaxAmount', FLOAT),
+    ('totalGrossAmount', FLOAT), ('amountDue', FLOAT),
+    ('paid', BOOLEAN), ('booked', BOOLEAN), ('sent', BOOLEAN),
+    ('archived', BOOLEAN), ('lastModified', STRING))
+
+# One row per invoice line, with the invoice columns needed to join or
+# aggregate lines without reading the invoice table.
+INVOICE_LINE_SCHEMA = (
+    ('invoiceId', STRING), ('invoiceNumber', INTEGER),
+    ('invoiceDate', STRING), ('customerId', STRING), ('currency', STRING),
+    ('lineIndex', INTEGER), ('productId', STRING), ('productSku', STRING),
+    ('description', STRING), ('quantity', FLOAT), ('unitId', STRING),
+    ('unitNetPrice', FLOAT), ('unitGrossPrice', FLOAT),
+    ('taxRate', FLOAT), ('taxEnabled', BOOLEAN), ('discountRate', FLOAT))
+
+INVOICE_LINE_HEADER = (('invoiceId', 'id'), ('invoiceNumber', 'number'),
+                       ('invoiceDate', 'date'), ('customerId', 'customerId'),
+                       ('currency', 'currency'))
+
+CONVERTERS = {STRING: text_type, INTEGER: int, FLOAT: float, BOOLEAN: bool}
+
+
+def _as_dict(row):
+    return row.to_dict() if hasattr(row, 'to_dict') else row
+
+
+def flatten_lines(invoices):
+    """
+    Turn invoices into invoice line rows, see INVOICE_LINE_SCHEMA.
+
+    Parameters
+    ----------
+    invoices: iterable
+        Invoices, as dicts or `pydebitoor.models.Invoice`.
+
+    Returns
+    -------
+        Generator of line dicts.
+    """
+    for invoice in invoices:
+        invoice = _as_dict(invoice)
+        header = dict((column, invoice.get(field))
+                      for column, field in INVOICE_LINE_HEADER)
+        for index, line in enumerate(invoice.get('lines') or ()):
+            row = dict(line)
+            row.update(header)
+            row['lineIndex'] = index
+            yield row
+
+
+def iter_columns(rows, schema, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Group rows into column batches.
+
+    Parameters
+    ----------
+    rows: iterable
+        Entities, as dicts or `pydebitoor.models` entities.
+    schema: tuple
+        (name, type) pairs of the exported columns.
+    batch_size: int
+        Number of rows per batch.
+
+    Returns
+    -------
+        Generator of OrderedDict mapping column names to lists of values,
+        converted to the schema types.
+
+    Raises
+    ------
+    ValueError if a value cannot be converted to its column type.
+    """
+    if batch_size < 1:
+        raise ValueError('batch_size must be positive')
+    converters = [(name, CONVERTERS[kind]) for name, kind in schema]
+    columns = [[] for _ in converters]
+    size = 0
+    for row in rows:
+        row = _as_dict(row)
+        for column, (name, convert) in zip(columns, converters):
+            value = row.get(name)
+            column.append(None if value is None else convert(value))
+        size += 1
+        if size == batch_size:
+            yield collections.OrderedDict(
+                (name, column)
+                for (name, _), column in zip(converters, columns))
+            columns = [[] for _ in converters]
+            size = 0
+    if size:
+        yield collections.OrderedDict(
+            (name, column) for (name, _), column in zip(converters, columns))
+
+
+def _encode_row(row):
+    return [value.encode('utf-8') if isinstance(value, text_type) else value
+            for value in row]
+
+
+def write_csv(rows, destination, schema, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Write rows to a CSV file with a header line.
+
+    Parameters
+    ----------
+    rows: iterable
+        Entities to export.
+    destination: str or file-like
+        Path or file object to write to, opened in text mode (binary mode
+        on Python 2). Written as UTF-8 when a path is given.
+    schema: tuple
+        (name, type) pairs of the exported columns.
+    batch_size: int
+        Number of rows buffered between writes.
+
+    Returns
+    -------
+        Number of rows written.
+    """
+    if not hasattr(destination, 'write'):
+        if CSV_BYTES:
+            with open(destination, 'wb') as csv_file:
+                return write_csv(rows, csv_file, schema, batch_size)
+        with io.open(destination, 'w', newline='',
+                     encoding='utf-8') as csv_file:
+            return write_csv(rows, csv_file, schema, batch_size)
+    writer = csv.writer(destination)
+    writer.writerow([name for name, _ in schema])
+    count = 0
+    for batch in iter_columns(rows, schema, batch_size):
+        values = list(batch.values())
+        records = zip(*values)
+        if CSV_BYTES:
+            records = [_encode_row(record) for record in records]
+        writer.writerows(records)
+        count += len(values[0])
+    return count
+
+
+def arrow_schema(schema):
+    """
+    Returns
+    -------
+        pyarrow.Schema matching a pydebitoor export schema.
+    """
+    if pyarrow is None:
+        raise ImportError('Arrow and Parquet exports require pyarrow')
+    types = {STRING: pyarrow.string(), INTEGER: pyarrow.int64(),
+             FLOAT: pyarrow.float64(), BOOLEAN: pyarrow.bool_()}
+    return pyarrow.schema([pyarrow.field(name, types[kind])
+                           for name, kind in schema])
+
+
+def iter_record_batches(rows, schema, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Convert rows to Arrow record batches, see `iter_columns`.
+
+    Returns
+    -------
+        Generator of pyarrow.RecordBatch.
+    """
+    target = arrow_schema(schema)
+    for batch in iter_columns(rows, schema, batch_size):
+        yield pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(values, type=field.type)
+             for field, values in zip(target, batch.values())],
+            schema=target)
+
+
+def write_parquet(rows, destination, schema, batch_size=DEFAULT_BATCH_SIZE,
+                  compression='snappy'):
+    """
+    Write rows to a Parquet file, one row group per batch.
+
+    Parameters
+    ----------
+    rows: iterable
+        Entities to export.
+    destination: str or file-like
+        Path or binary file object to write to.
+    schema: tuple
+        (name, type) pairs of the exported columns.
+    batch_size: int
+        Number of rows per row group.
+    compression: str
+        Parquet compression codec.
+
+    Returns
+    -------
+        Number of rows written.
+    """
+    target = arrow_schema(schema)
+    count = 0
+    writer = pyarrow.parquet.ParquetWriter(destination, target,
+                                           compression=compression)
+    try:
+        for batch in iter_record_batches(rows, schema, batch_size):
+            writer.write_table(pyarrow.Table.from_batches([batch]))
+            count += batch.num_rows
+    finally:
+        writer.close()
+    return count
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet}
+
+
+def write(rows, destination, schema, format='csv',
+          batch_size=DEFAULT_BATCH_SIZE):
+    if format not in WRITERS:
+        raise ValueError('Unknown export format {}, expected one of {}'
+                         .format(format, ', '.join(sorted(WRITERS))))
+    return WRITERS[format](rows, destination, schema, batch_size)
+
+
+def export_invoices(service, destination, from_date=None, to_date=None,
+                    format='csv', lines=False, batch_size=DEFAULT_BATCH_SIZE,
+                    **window):
+    """
+    Export invoices of an interval.
+
+    Parameters
+    ----------
+    service: InvoiceService
+        Service to read invoices from.
+    destination: str or file-like
+        Path or file object to write to.
+    from_date: str
+        Interval start, 'YYYY-MM-DD'.
+    to_date: str
+        Interval end, 'YYYY-MM-DD'. Default to today.
+    format: str
+        'csv' or 'parquet'.
+    lines: bool
+        If true, export one row per invoice line (INVOICE_LINE_SCHEMA)
+        instead of one row per invoice read from the lighter headers
+        endpoint (INVOICE_SCHEMA).
+    batch_size: int
+        Number of rows per batch.
+    window: dict
+        Extra `iter_list` / `iter_headers` arguments, e.g. window_days.
+
+    Returns
+    -------
+        Number of rows written.
+    """
+    if lines:
+        rows = flatten_lines(service.iter_list(from_date, to_date,
+                                               as_model=False, **window))
+        schema = INVOICE_LINE_SCHEMA
+    else:
+        rows = service.iter_headers(from_date, to_date, as_model=False,
+                                    **window)
+        schema = INVOICE_SCHEMA
+    return write(rows, destination, schema, format, batch_size)
+
+
+def export_customers(service, destination, format='csv',
+                     batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Export every customer, see `export_invoices`.
+
+    Returns
+    -------
+        Number of rows written.
+    """
+    return write(service.iter_list(as_model=False), destination,
+                 CUSTOMER_SCHEMA, format, batch_size)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable, concurrent invoice emailing.
+
+Examples
+--------
+    >>> service = client.get_service('InvoiceService')
+    >>> dispatcher = EmailDispatcher(service, '/var/lib/app/emails.log')
+    >>> report = dispatcher.run(EmailJob(invoice['id'], invoice['email'],
+    >>>                                  'Your invoice')
+    >>>                         for invoice in invoices)
+    >>> report.as_dict()
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+from .bulk import DEFAULT_MAX_WORKERS, execute_bulk
+
+logger = logging.getLogger('pydebitoor')
+
+
+class EmailJob(collections.namedtuple(
+        'EmailJob', ['invoice_id', 'recipient', 'subject', 'cc_recipient',
+                     'message', 'attachment_name', 'copy_mail',
+                     'country_code'])):
+    """
+    Arguments of one `InvoiceService.email` call.
+    """
+    __slots__ = ()
+
+    def __new__(cls, invoice_id, recipient, subject, cc_recipient=None,
+                message=None, attachment_name=None, copy_mail=False,
+                country_code=None):
+        return super(EmailJob, cls).__new__(
+            cls, invoice_id, recipient, subject, cc_recipient, message,
+            attachment_name, copy_mail, country_code)
+
+    @property
+    def key(self):
+        """
+        Identity of the job in the checkpoint file.
+        """
+        return '{} {}'.format(self.invoice_id, self.recipient)
+
+
+class EmailCheckpoint(object):
+    """
+    Append-only log of sent jobs, synced to disk after every write.
+
+    A last line cut off by a crash is truncated when the file is opened
+    (its job is sent again).
+
+    Parameters
+    ----------
+    path: str
+        Checkpoint file path. Created if missing.
+
+    Raises
+    ------
+    ValueError if a line other than the last one cannot be read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__done = set()
+        if os.path.exists(path):
+            self.__load()
+        self.__file = open(path, 'a')
+
+    def __load(self):
+        with open(self.path, 'rb') as checkpoint_file:
+            lines = checkpoint_file.readlines()
+        size = 0
+        for number, line in enumerate(lines, 1):
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError('Unterminated line')
+                if line.strip():
+                    self.__done.add(json.loads(line.decode('utf-8')))
+            except ValueError:
+                if number < len(lines):
+                    raise ValueError('Corrupt checkpoint {} at line {}'
+                                     .format(self.path, number))
+                logger.warning('Truncating incomplete last line of '
+                               'checkpoint %s', self.path)
+                with open(self.path, 'r+b') as checkpoint_file:
+                    checkpoint_file.truncate(size)
+                return
+            size += len(line)
+
+    def __contains__(self, key):
+        return key in self.__done
+
+    def __len__(self):
+        return len(self.__done)
+
+    def mark(self, key):
+        with self.__lock:
+            self.__file.write(json.dumps(key) + '\n')
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+            self.__done.add(key)
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+class EmailReport(object):
+    """
+    Progress of an EmailDispatcher run.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.sent = 0
+        self.skipped = 0
+        self.failed = []
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started_at
+
+    @property
+    def throughput(self):
+        """
+        Emails sent per second.
+        """
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed else 0.0
+
+    def as_dict(self):
+        return {'sent': self.sent, 'skipped': self.skipped,
+                'failed': len(self.failed), 'elapsed': self.elapsed,
+                'throughput': self.throughput}
+
+
+class EmailDispatcher(object):
+    """
+    Send invoices by email from a pool of threads.
+
+    Calls go through the service client, so they share its rate limiter
+    and retry policy. Sent jobs are recorded in a checkpoint file: running
+    the same jobs again after a crash only sends the missing ones. A job
+    sent by the API right before a crash, but not yet recorded, may be
+    sent twice; at most one job per worker is exposed.
+
+    Parameters
+    ----------
+    service: InvoiceService
+        Service used to send emails.
+    checkpoint_path: str
+        Checkpoint file path. If not set, runs are not resumable.
+    max_workers: int
+        Number of emails sent concurrently.
+    progress: callable
+        Called with the EmailReport after each job.
+    """
+
+    def __init__(self, service, checkpoint_path=None,
+                 max_workers=DEFAULT_MAX_WORKERS, progress=None):
+        self.service = service
+        self.checkpoint_path = checkpoint_path
+        self.max_workers = max_workers
+        self.progress = progress
+
+    def __send(self, job):
+        return self.service.email(
+            job.invoice_id, job.recipient, job.subject,
+            cc_recipient=job.cc_recipient, message=job.message,
+            attachment_name=job.attachment_name, copy_mail=job.copy_mail,
+            country_code=job.country_code)
+
+    def run(self, jobs):
+        """
+        Send emails.
+
+        Parameters
+        ----------
+        jobs: iterable
+            EmailJob instances, or tuples of EmailJob arguments.
+            Consumed lazily.
+
+        Returns
+        -------
+            EmailReport. Failed jobs are listed in `report.failed` as
+            (job, exception) pairs and are not recorded in the checkpoint,
+            so they are retried by the next run.
+        """
+        report = EmailReport()
+        checkpoint = None
+        if self.checkpoint_path:
+            checkpoint = EmailCheckpoint(self.checkpoint_path)
+
+        def pending():
+            for job in jobs:
+                if not isinstance(job, EmailJob):
+                    job = EmailJob(*job)
+                if checkpoint is not None and job.key in checkpoint:
+                    report.skipped += 1
+                    continue
+                yield job
+
+        def send(job):
+            result = self.__send(job)
+            if checkpoint is not None:
+                checkpoint.mark(job.key)
+            return result
+
+        try:
+            for result in execute_bulk(send, pending(), self.max_workers):
+                if result.ok:
+                    report.sent += 1
+                else:
+                    logger.warning('Could not email invoice %s: %s',
+                                   result.item.invoice_id, result.error)
+                    report.failed.append((result.item, result.error))
+                if self.progress is not None:
+                    self.progress(report)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+        logger.info('Emailing done: %s', report.as_dict())
+        return report
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Latency, size and status metrics of Debitoor API calls.
+
+Examples
+--------
+    >>> metrics = MetricsCollector()
+    >>> metrics.install(client)
+    >>> client.get_service('CustomerService').list()
+    >>> metrics.as_dict()['services']['CustomerService']['latency']
+    >>> print(metrics.to_prometheus())
+"""
+import collections
+import re
+import threading
+
+from requests.compat import urlparse
+
+from .services import (CustomerService, DraftService, InvoiceService,
+                       TaxService)
+
+DEFAULT_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ID_SEGMENT = re.compile(r'^(?=.*\d)[0-9a-zA-Z_-]{8,}$|^\d+$')
+SERVICE_PREFIXES = sorted(
+    [(service.uri, service.__name__)
+     for service in (CustomerService, DraftService, InvoiceService)] +
+    [('/sales/taxrates', TaxService.__name__),
+     ('/purchase/taxrates', TaxService.__name__)],
+    key=lambda prefix: -len(prefix[0]))
+
+
+class Histogram(object):
+    """
+    Cumulative histogram, Prometheus style.
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def merge(self, other):
+        self.sum += other.sum
+        self.count += other.count
+        self.counts = [mine + theirs
+                       for mine, theirs in zip(self.counts, other.counts)]
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket holding it.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= rank:
+                return bound
+        return float('inf')
+
+    def as_dict(self):
+        return {'count': self.count, 'sum': self.sum,
+                'mean': self.sum / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+                'buckets': dict(zip(self.buckets, self.counts))}
+
+
+class EndpointStats(object):
+    __slots__ = ('latency', 'statuses', 'errors', 'request_bytes',
+                 'response_bytes', 'retries')
+
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.statuses = {}
+        self.errors = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        for mine, theirs in ((self.statuses, other.statuses),
+                             (self.errors, other.errors)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+        self.request_bytes += other.request_bytes
+        self.response_bytes += other.response_bytes
+        self.retries += other.retries
+
+    def as_dict(self):
+        return {'latency': self.latency.as_dict(),
+                'statuses': dict(self.statuses),
+                'errors': dict(self.errors),
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes,
+                'retries': self.retries}
+
+
+def endpoint_of(path):
+    """
+    Template an URL path, replacing entity ids by '{id}'.
+    """
+    return '/'.join('{id}' if ID_SEGMENT.match(segment) else segment
+                    for segment in path.split('/'))
+
+
+def service_of(path):
+    """
+    Name of the service owning an URL path, 'other' if unknown.
+    """
+    for prefix, service in SERVICE_PREFIXES:
+        if prefix in path:
+            return service
+    return 'other'
+
+
+class MetricsCollector(object):
+    """
+    Record per-endpoint and per-service metrics through DebitoorClient
+    hooks: latency histograms, status codes, errors, payload sizes and
+    retries.
+
+    Clients without a collector installed pay nothing beyond iterating
+    over empty hook lists.
+
+    Parameters
+    ----------
+    buckets: tuple
+        Latency histogram upper bounds, in seconds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.__lock = threading.Lock()
+        self.__stats = {}
+
+    def install(self, client):
+        """
+        Start recording calls of `client`.
+        """
+        client.add_hook('before_request', self.before_request)
+        client.add_hook('after_response', self.after_response)
+        client.add_hook('on_error', self.on_error)
+
+    def uninstall(self, client):
+        client.remove_hook('before_request', self.before_request)
+        client.remove_hook('after_response', self.after_response)
+        client.remove_hook('on_error', self.on_error)
+
+    def reset(self):
+        with self.__lock:
+            self.__stats = {}
+
+    def __get_stats(self, method, url):
+        path = urlparse(url).path
+        key = (service_of(path), method, endpoint_of(path))
+        stats = self.__stats.get(key)
+        if stats is None:
+            stats = self.__stats[key] = EndpointStats(self.buckets)
+        return stats
+
+    def before_request(self, method, url, attempt, kwargs):
+        data = kwargs.get('data')
+        with self.__lock:
+            stats = self.__get_stats(method, url)
+            if data:
+                stats.request_bytes += len(data)
+            if attempt > 1:
+                stats.retries += 1
+
+    def after_response(self, method, url, response, elapsed, attempt):
+        size = int(response.headers.get('content-length') or 0)
+        with self.__lock:
+            stats = self.__get_stats(method, url)
+            stats.latency.observe(elapsed)
+            stats.statuses[response.status_code] = \
+                stats.statuses.get(response.status_code, 0) + 1
+            stats.response_bytes += size
+
+    def on_error(self, method, url, error, elapsed, attempt):
+        name = error.__class__.__name__
+        with self.__lock:
+            stats = self.__get_stats(method, url)
+            stats.latency.observe(elapsed)
+            stats.errors[name] = stats.errors.get(name, 0) + 1
+
+    def as_dict(self):
+        """
+        Returns
+        -------
+            Dict with 'endpoints' metrics keyed by 'METHOD /endpoint', and
+            'services' metrics aggregated per service.
+        """
+        endpoints, services = {}, {}
+        with self.__lock:
+            for (service, method, endpoint), stats in self.__stats.items():
+                endpoints['{} {}'.format(method, endpoint)] = \
+                    stats.as_dict()
+                if service not in services:
+                    services[service] = EndpointStats(self.buckets)
+                services[service].merge(stats)
+        return {'endpoints': endpoints,
+                'services': dict((service, stats.as_dict())
+                                 for service, stats in services.items())}
+
+    def to_prometheus(self, prefix='pydebitoor'):
+        """
+        Returns
+        -------
+            Metrics in the Prometheus text exposition format.
+        """
+        families = collections.OrderedDict(
+            (name, (kind, []))
+            for name, kind in (('request_duration_seconds', 'histogram'),
+                               ('responses_total', 'counter'),
+                               ('errors_total', 'counter'),
+                               ('request_bytes_total', 'counter'),
+                               ('response_bytes_total', 'counter'),
+                               ('retries_total', 'counter')))
+
+        def add(family, suffix, labels, value):
+            families[family][1].append('{}_{}{}{{{}}} {}'.format(
+                prefix, family, suffix, labels, value))
+
+        with self.__lock:
+            for (service, method, endpoint), stats in sorted(
+                    self.__stats.items()):
+                labels = 'service="{}",method="{}",endpoint="{}"'.format(
+                    service, method, endpoint)
+                histogram = stats.latency
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    add('request_duration_seconds', '_bucket',
+                        '{},le="{}"'.format(labels, bound), count)
+                add('request_duration_seconds', '_bucket',
+                    labels + ',le="+Inf"', histogram.count)
+                add('request_duration_seconds', '_sum', labels,
+                    histogram.sum)
+                add('request_duration_seconds', '_count', labels,
+                    histogram.count)
+                for status, count in sorted(stats.statuses.items()):
+                    add('responses_total', '',
+                        '{},status="{}"'.format(labels, status), count)
+                for error, count in sorted(stats.errors.items()):
+                    add('errors_total', '',
+                        '{},error="{}"'.format(labels, error), count)
+                add('request_bytes_total', '', labels, stats.request_bytes)
+                add('response_bytes_total', '', labels, stats.response_bytes)
+                add('retries_total', '', labels, stats.retries)
+
+        lines = []
+        for family, (kind, samples) in families.items():
+            lines.append('# TYPE {}_{} {}'.format(prefix, family, kind))
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Compact typed entities.
+
+Models keep known fields in `__slots__` instead of a per-instance dict,
+which divides the memory footprint of large entity lists. Attributes use
+the API field names. Unknown fields are preserved in `extra`, so
+`to_dict()` gives back the payload expected by the services.
+
+Examples
+--------
+    >>> client = DebitoorClient('access_token', models=True)
+    >>> invoice = client.get_service('InvoiceService').get(invoice_id)
+    >>> invoice.totalGrossAmount, invoice.lines[0].description
+    >>> client.get_service('InvoiceService').update(invoice.id, invoice)
+"""
+
+
+class Model(object):
+    """
+    Base entity. Unset fields read as None and are not serialized.
+    """
+    __slots__ = ('extra',)
+    fields = ()
+
+    def __init__(self, **values):
+        self.extra = None
+        self._load(values)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a model from an API dict.
+        """
+        instance = cls.__new__(cls)
+        instance.extra = None
+        instance._load(data)
+        return instance
+
+    @classmethod
+    def from_list(cls, items):
+        return [cls.from_dict(item) for item in items]
+
+    def _load(self, data):
+        fields = self.fields
+        extra = None
+        for key, value in data.items():
+            if key in fields:
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self.extra = extra
+
+    def __getattr__(self, name):
+        # Only called for unset slots and unknown attributes.
+        if name in self.fields:
+            return None
+        raise AttributeError(name)
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+            API payload of the entity.
+        """
+        data = dict(self.extra) if self.extra else {}
+        for field in self.fields:
+            try:
+                value = object.__getattribute__(self, field)
+            except AttributeError:
+                continue
+            data[field] = value.to_dict() if isinstance(value, Model) \
+                else value
+        return data
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __getstate__(self):
+        # Set slots only: the default protocol reads every slot through
+        # __getattr__, so copies and pickles would serialize unset fields
+        # as None.
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                try:
+                    state[name] = object.__getattribute__(self, name)
+                except AttributeError:
+                    continue
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__,
+                                getattr(self, 'id', None) or '')
+
+
+class Customer(Model):
+    fields = __slots__ = (
+        'id', 'number', 'name', 'address', 'phone', 'email', 'homepage',
+        'ciNumber', 'vatNumber', 'countryCode', 'countryName',
+        'paymentTermsId', 'paymentTermsDays', 'notes', 'isArchived',
+        'createdDate', 'lastModified')
+
+
+class InvoiceLine(Model):
+    fields = __slots__ = (
+        'productId', 'productOrService', 'productSku', 'productName',
+        'description', 'quantity', 'unitId', 'unitName', 'unitNetPrice',
+        'unitGrossPrice', 'taxRate', 'taxEnabled', 'discountRate',
+        'incomeTaxDeductionRate', 'lineNumber')
+
+
+class Invoice(Model):
+    """
+    Invoice. `lines` are kept as raw dicts until first accessed, so models
+    only read for their header fields never decode them.
+    """
+    fields = (
+        'id', 'number', 'type', 'date', 'dueDate', 'paymentTermsId',
+        'customerId', 'customerName', 'customerAddress', 'customerCountry',
+        'customerEmail', 'customerNumber', 'customerCiNumber',
+        'customerVatNumber', 'currency', 'currencyRate', 'priceDisplayType',
+        'languageCode', 'notes', 'additionalNotes', 'totalNetAmount',
+        'totalTaxAmount', 'totalGrossAmount', 'totalNetAmountInCurrency',
+        'totalTaxAmountInCurrency', 'totalGrossAmountInCurrency',
+        'amountDue', 'paid', 'booked', 'sent', 'viewed', 'archived',
+        'createdDate', 'lastModified')
+    __slots__ = fields + ('_lines',)
+
+    def _load(self, data):
+        lines = data.get('lines')
+        if lines is not None:
+            data = dict(data)
+            self._lines = data.pop('lines')
+        super(Invoice, self)._load(data)
+
+    @property
+    def lines(self):
+        """
+        List of InvoiceLine, decoded on first access. Empty, and still
+        not serialized, if the invoice has no lines: assign `lines` to
+        add some.
+        """
+        try:
+            lines = self._lines
+        except AttributeError:
+            return []
+        if lines and not isinstance(lines[0], InvoiceLine):
+            lines = self._lines = InvoiceLine.from_list(lines)
+        return lines
+
+    @lines.setter
+    def lines(self, lines):
+        self._lines = list(lines)
+
+    def to_dict(self):
+        data = super(Invoice, self).to_dict()
+        try:
+            lines = self._lines
+        except AttributeError:
+            return data
+        data['lines'] = [line.to_dict() if isinstance(line, InvoiceLine)
+                         else line for line in lines]
+        return data
+
+
+class Draft(Invoice):
+    __slots__ = ()
+
+
+class TaxRates(Model):
+    fields = __slots__ = (
+        'baseTax', 'customerCountry', 'supplierCountry', 'date',
+        'domesticToForeign', 'domesticToIntraEu', 'reverseCharge',
+        'mapFromCustomerCountry', 'mapFromSupplierCountry', 'mapFromDate')
+
+    @property
+    def default_rate(self):
+        return (self.baseTax or {}).get('defaultRate')
+
+    @property
+    def rates(self):
+        return (self.baseTax or {}).get('rates', [])
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+"""
+Durable write outbox.
+
+Writes are appended to a local SQLite queue and acknowledged at once; a
+background thread sends them to Debitoor, in order for a given entity,
+retrying transient failures. Callers get a future resolved with the API
+answer (holding server-assigned ids), and/or a callback.
+
+Examples
+--------
+    >>> with Outbox(client, '/var/lib/app/outbox.sqlite') as outbox:
+    >>>     customers = outbox.service('CustomerService')
+    >>>     future = customers.create({'name': 'ACME', 'countryCode': 'FR'})
+    >>>     # ... later, or from another thread
+    >>>     customer_id = future.result()['id']
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from requests.exceptions import HTTPError, RequestException
+
+from .bulk import DEFAULT_MAX_WORKERS, execute_bulk
+from .client import SERVICE_MAPPING
+from .errors import NotFoundError, RateLimitError
+
+logger = logging.getLogger('pydebitoor')
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 300.0
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+WRITE_METHODS = ('create', 'update', 'partial_update', 'delete', 'complete',
+                 'diff_update', 'upsert')
+# Safe to send again when a crash left it unacknowledged.
+IDEMPOTENT_METHODS = ('update', 'partial_update', 'delete', 'diff_update')
+
+PENDING = 'pending'
+SENDING = 'sending'
+FAILED = 'failed'
+INTERRUPTED = 'interrupted'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    service TEXT NOT NULL,
+    method TEXT NOT NULL,
+    entity TEXT,
+    args TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, seq);
+CREATE INDEX IF NOT EXISTS outbox_entity ON outbox (entity, seq);
+"""
+
+
+def _dumps(value):
+    return json.dumps(value, default=lambda entity: entity.to_dict())
+
+
+def is_transient(error):
+    """
+    Whether a failed write may succeed if sent again later.
+    """
+    if isinstance(error, RateLimitError):
+        return True
+    if isinstance(error, HTTPError):
+        response = error.response
+        return response is None or response.status_code >= 500
+    return isinstance(error, RequestException)
+
+
+class OutboxService(object):
+    """
+    Service stand-in whose write methods enqueue calls in the outbox and
+    return futures.
+    """
+
+    def __init__(self, outbox, service_name):
+        if service_name not in SERVICE_MAPPING:
+            raise ValueError('Unknown service: %s' % service_name)
+        self.outbox = outbox
+        self.service_name = service_name
+
+    def __getattr__(self, method):
+        if method not in WRITE_METHODS or \
+                not hasattr(SERVICE_MAPPING[self.service_name], method):
+            raise AttributeError('{} has no outbox method {}'.format(
+                self.service_name, method))
+
+        def submit(*args, **kwargs):
+            return self.outbox.submit(self.service_name, method, *args,
+                                      **kwargs)
+        return submit
+
+
+class Outbox(object):
+    """
+    SQLite-backed queue of service writes, sent by a background thread.
+
+    Calls on a same entity (same service and id) are sent one at a time in
+    submission order; calls on different entities are sent concurrently,
+    `batch_size` at a time. Transient failures (connection errors, 429,
+    5xx) are retried with exponential backoff up to `max_attempts` times,
+    other errors fail the call.
+
+    Pending calls survive crashes and are sent on the next start. Calls that
+    were in flight during a crash are sent again if idempotent; creates and
+    draft completions are marked 'interrupted' instead, since they may have
+    been applied: check them and `retry()` or `discard()` them.
+
+    Parameters
+    ----------
+    client: DebitoorClient
+        Client used to send the calls.
+    path: str
+        SQLite database path.
+    max_workers: int
+        Number of calls sent concurrently.
+    batch_size: int
+        Number of queued calls considered per flush.
+    max_attempts: int
+        Number of tries of a call before it is marked failed.
+    backoff: float
+        Delay before the first retry, doubled at each attempt, in seconds.
+    max_backoff: float
+        Maximum delay between retries, in seconds.
+    flush_interval: float
+        Maximum delay between two looks at the queue, in seconds.
+    callback: callable
+        Called as `callback(seq, result, error)` from the flusher thread
+        when a call succeeded (error is None) or failed for good.
+    start: bool
+        Start the flusher thread right away.
+    """
+
+    def __init__(self, client, path, max_workers=DEFAULT_MAX_WORKERS,
+                 batch_size=DEFAULT_BATCH_SIZE,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, callback=None,
+                 start=True):
+        self.client = client
+        self.path = path
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.flush_interval = flush_interval
+        self.callback = callback
+        self.__lock = threading.RLock()
+        self.__futures = {}
+        self.__wakeup = threading.Event()
+        self.__idle = threading.Condition(self.__lock)
+        self.__stopping = threading.Event()
+        self.__thread = None
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.executescript(SCHEMA)
+        self.__recover()
+        if start:
+            self.start()
+
+    def __execute(self, sql, args=()):
+        with self.__lock, self.__connection:
+            return self.__connection.execute(sql, args)
+
+    def __query(self, sql, args=()):
+        with self.__lock:
+            return self.__connection.execute(sql, args).fetchall()
+
+    def __recover(self):
+        """
+        Requeue idempotent calls left in flight by a crash, flag others.
+        """
+        marks = ','.join('?' * len(IDEMPOTENT_METHODS))
+        with self.__lock, self.__connection:
+            requeued = self.__connection.execute(
+                'UPDATE outbox SET state = ? WHERE state = ? '
+                'AND method IN (%s)' % marks,
+                (PENDING, SENDING) + IDEMPOTENT_METHODS).rowcount
+            interrupted = self.__connection.execute(
+                'UPDATE outbox SET state = ?, error = ? WHERE state = ?',
+                (INTERRUPTED, 'Interrupted while sending', SENDING)).rowcount
+        if requeued or interrupted:
+            logger.warning('Outbox recovery: %s calls requeued, '
+                           '%s interrupted', requeued, interrupted)
+
+    def start(self):
+        if self.__thread is None:
+            self.__stopping.clear()
+            self.__thread = threading.Thread(target=self.__run,
+                                             name='pydebitoor-outbox')
+            self.__thread.daemon = True
+            self.__thread.start()
+        return self
+
+    def close(self, timeout=None):
+        """
+        Stop the flusher after its current batch. Queued calls stay in the
+        database and are sent on the next start.
+        """
+        self.__stopping.set()
+        self.__wakeup.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+            self.__thread = None
+        with self.__lock:
+            self.__connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def service(self, service_name):
+        """
+        Returns
+        -------
+            OutboxService queueing the writes of `service_name`.
+        """
+        return OutboxService(self, service_name)
+
+    def submit(self, service_name, method, *args, **kwargs):
+        """
+        Durably queue a service call.
+
+        Parameters
+        ----------
+        service_name: str
+            Name of the service, see `DebitoorClient.get_service`.
+        method: str
+            Write method: create, update, partial_update, delete, complete,
+            diff_update or upsert. Except for create and upsert, the entity
+            id must be the first positional argument.
+        args, kwargs:
+            Method arguments, JSON serializable (or pydebitoor models).
+
+        Returns
+        -------
+            Future resolved with the call result. Its `seq` attribute is
+            the call number in the outbox.
+        """
+        if method not in WRITE_METHODS:
+            raise ValueError('{} is not an outbox method'.format(method))
+        entity = None
+        if method not in ('create', 'upsert'):
+            if not args:
+                raise ValueError('{} requires the entity id as first '
+                                 'argument'.format(method))
+            entity = '{}/{}'.format(service_name, args[0])
+        with self.__lock:
+            seq = self.__execute(
+                'INSERT INTO outbox (service, method, entity, args, kwargs, '
+                'state, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (service_name, method, entity, _dumps(args), _dumps(kwargs),
+                 PENDING, time.time())).lastrowid
+            future = self.future(seq)
+        self.__wakeup.set()
+        return future
+
+    def future(self, seq):
+        """
+        Returns
+        -------
+            Future of the call `seq`, e.g. of a call recovered after
+            a restart.
+        """
+        with self.__lock:
+            future = self.__futures.get(seq)
+            if future is None:
+                future = self.__futures[seq] = Future()
+                future.seq = seq
+            return future
+
+    def stats(self):
+        """
+        Returns
+        -------
+            Number of queued calls per state.
+        """
+        counts = dict.fromkeys((PENDING, SENDING, FAILED, INTERRUPTED), 0)
+        counts.update(self.__query(
+            'SELECT state, COUNT(*) FROM outbox GROUP BY state'))
+        return counts
+
+    def entries(self, state=FAILED):
+        """
+        Returns
+        -------
+            List of dicts describing the calls in `state`.
+        """
+        return [{'seq': seq, 'service': service, 'method': method,
+                 'args': json.loads(args), 'kwargs': json.loads(kwargs),
+                 'attempts': attempts, 'error': error}
+                for seq, service, method, args, kwargs, attempts, error
+                in self.__query(
+                    'SELECT seq, service, method, args, kwargs, attempts, '
+                    'error FROM outbox WHERE state = ? ORDER BY seq',
+                    (state,))]
+
+    def retry(self, seq):
+        """
+        Queue a failed or interrupted call again.
+        """
+        self.__execute(
+            'UPDATE outbox SET state = ?, attempts = 0, next_attempt = 0 '
+            'WHERE seq = ? AND state IN (?, ?)',
+            (PENDING, seq, FAILED, INTERRUPTED))
+        self.__wakeup.set()
+
+    def discard(self, seq):
+        """
+        Drop a failed or interrupted call.
+        """
+        self.__execute('DELETE FROM outbox WHERE seq = ? AND state IN (?, ?)',
+                       (seq, FAILED, INTERRUPTED))
+
+    def flush(self, timeout=None):
+        """
+        Wait until no call is pending or being sent.
+
+        Returns
+        -------
+            True if the queue was drained, False on timeout.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.__idle:
+            while True:
+                stats = self.stats()
+                if not stats[PENDING] and not stats[SENDING]:
+                    return True
+                remaining = None if deadline is None \
+                    else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__wakeup.set()
+                self.__idle.wait(min(remaining or self.flush_interval,
+                                     self.flush_interval))
+
+    def __run(self):
+        while not self.__stopping.is_set():
+            try:
+                sent = self.flush_once()
+            except Exception:
+                logger.exception('Outbox flush failed')
+                sent = 0
+            if not sent:
+                self.__wakeup.wait(self.flush_interval)
+                self.__wakeup.clear()
+
+    def flush_once(self):
+        """
+        Send one batch of ready calls.
+
+        Returns
+        -------
+            Number of calls sent.
+        """
+        now = time.time()
+        groups = []
+        by_entity = {}
+        # Ready calls only, so backed-off ones do not use up the batch, and
+        # none queued behind a backed-off call on the same entity.
+        for row in self.__query(
+                'SELECT seq, service, method, entity, args, kwargs, '
+                'attempts, next_attempt FROM outbox WHERE state = ? '
+                'AND next_attempt <= ? AND NOT EXISTS ('
+                'SELECT 1 FROM outbox AS earlier WHERE '
+                'earlier.entity = outbox.entity AND earlier.seq < outbox.seq '
+                'AND earlier.state = ? AND earlier.next_attempt > ?) '
+                'ORDER BY seq LIMIT ?',
+                (PENDING, now, PENDING, now, self.batch_size)):
+            entity = row[3] or row[0]
+            if entity not in by_entity:
+                by_entity[entity] = []
+                groups.append(by_entity[entity])
+            by_entity[entity].append(row)
+        if not groups:
+            return 0
+        seqs = [row[0] for group in groups for row in group]
+        with self.__lock, self.__connection:
+            self.__connection.executemany(
+                'UPDATE outbox SET state = ? WHERE seq = ?',
+                [(SENDING, seq) for seq in seqs])
+        for _ in execute_bulk(self.__send_group, groups, self.max_workers):
+            pass
+        with self.__idle:
+            self.__idle.notify_all()
+        return len(seqs)
+
+    def __send_group(self, rows):
+        """
+        Send the calls of one entity in order, stopping at the first one
+        to retry so that later calls are not applied before it.
+        """
+        for index, row in enumerate(rows):
+            if not self.__send(row):
+                with self.__lock, self.__connection:
+                    self.__connection.executemany(
+                        'UPDATE outbox SET state = ? WHERE seq = ?',
+                        [(PENDING, later[0]) for later in rows[index + 1:]])
+                return
+
+    def __send(self, row):
+        """
+        Returns
+        -------
+            False if the call is to be retried later, True otherwise.
+        """
+        seq, service_name, method, _, args, kwargs, attempts, _ = row
+        try:
+            service = self.client.get_service(service_name)
+            result = getattr(service, method)(*json.loads(args),
+                                              **json.loads(kwargs))
+        except Exception as error:
+            if method == 'delete' and isinstance(error, NotFoundError):
+                # Already deleted, e.g. sent again after a crash.
+                return self.__done(seq, {}, None)
+            attempts += 1
+            if is_transient(error) and attempts < self.max_attempts:
+                delay = min(self.max_backoff,
+                            self.backoff * 2 ** (attempts - 1))
+                logger.debug('Outbox call %s failed (%s), retry in %ss',
+                             seq, error, delay)
+                self.__execute(
+                    'UPDATE outbox SET state = ?, attempts = ?, '
+                    'next_attempt = ?, error = ? WHERE seq = ?',
+                    (PENDING, attempts, time.time() + delay, str(error),
+                     seq))
+                return False
+            self.__execute(
+                'UPDATE outbox SET state = ?, attempts = ?, error = ? '
+                'WHERE seq = ?', (FAILED, attempts, str(error), seq))
+            return self.__done(seq, None, error, delete=False)
+        return self.__done(seq, result, None)
+
+    def __done(self, seq, result, error, delete=True):
+        if delete:
+            self.__execute('DELETE FROM outbox WHERE seq = ?', (seq,))
+        with self.__lock:
+            future = self.__futures.pop(seq, None)
+        if future is not None:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        if self.callback is not None:
+            try:
+                self.callback(seq, result, error)
+            except Exception:
+                logger.exception('Outbox callback failed for call %s', seq)
+        return True
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Client-side throttling of Debitoor API calls.
+"""
+import calendar
+import email.utils
+import threading
+import time
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header.
+
+    Parameters
+    ----------
+    value: str
+        Header value, either a number of seconds or an HTTP date.
+
+    Returns
+    -------
+        Delay in seconds, None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, calendar.timegm(parsed[:9]) - (parsed[9] or 0)
+                   - time.time())
+
+
+class RateLimiter(object):
+    """
+    Thread-safe token bucket with additive-increase/multiplicative-decrease
+    rate adaptation.
+
+    A single limiter is meant to be shared by every thread and service
+    using a client (or several clients hitting the same account).
+
+    Parameters
+    ----------
+    rate: float
+        Initial number of calls allowed per second.
+    burst: int
+        Bucket capacity, i.e. calls that can be sent at once after an idle
+        period. Default to one second worth of calls.
+    min_rate: float
+        Rate never goes below this value after throttling.
+    max_rate: float
+        Rate never goes above this value on success. Default to `rate`.
+    decrease_factor: float
+        Rate is multiplied by this factor each time the API answers 429.
+    increase_step: float
+        Rate is increased by this value after each successful call.
+        Default to 2% of `max_rate`.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.5, max_rate=None,
+                 decrease_factor=0.5, increase_step=None):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.max_rate = max_rate or rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst or max(1, int(self.max_rate))
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step or self.max_rate / 50.0
+        self.__rate = float(rate)
+        self.__tokens = float(self.burst)
+        self.__updated_at = monotonic()
+        self.__paused_until = 0.0
+        self.__waiting = 0
+        self.__throttled = 0
+        self.__condition = threading.Condition()
+
+    @property
+    def rate(self):
+        """
+        Current number of calls allowed per second.
+        """
+        return self.__rate
+
+    @property
+    def queue_depth(self):
+        """
+        Number of threads currently waiting for a token.
+        """
+        return self.__waiting
+
+    def stats(self):
+        """
+        Returns
+        -------
+            Dict describing the limiter state.
+        """
+        with self.__condition:
+            return {'rate': self.__rate,
+                    'queue_depth': self.__waiting,
+                    'throttled': self.__throttled,
+                    'paused_for': max(0.0, self.__paused_until - monotonic())}
+
+    def __refill(self, now):
+        elapsed = now - self.__updated_at
+        self.__updated_at = now
+        self.__tokens = min(self.burst, self.__tokens + elapsed * self.__rate)
+
+    def acquire(self):
+        """
+        Block until a call can be sent.
+        """
+        with self.__condition:
+            self.__waiting += 1
+            try:
+                while True:
+                    now = monotonic()
+                    self.__refill(now)
+                    if now < self.__paused_until:
+                        self.__condition.wait(self.__paused_until - now)
+                    elif self.__tokens >= 1:
+                        self.__tokens -= 1
+                        return
+                    else:
+                        self.__condition.wait(
+                            (1 - self.__tokens) / self.__rate)
+            finally:
+                self.__waiting -= 1
+
+    def on_success(self):
+        """
+        Record a successful call: slowly raise the rate back to `max_rate`.
+        """
+        with self.__condition:
+            if self.__rate < self.max_rate:
+                self.__rate = min(self.max_rate,
+                                  self.__rate + self.increase_step)
+
+    def on_throttled(self, retry_after=None):
+        """
+        Record a 429 answer: cut the rate and, if the API told us so,
+        pause every caller for `retry_after` seconds.
+        """
+        with self.__condition:
+            self.__throttled += 1
+            now = monotonic()
+            self.__refill(now)
+            self.__rate = max(self.min_rate,
+                              self.__rate * self.decrease_factor)
+            self.__tokens = 0.0
+            if retry_after:
+                self.__paused_until = max(self.__paused_until,
+                                          now + retry_after)
+            self.__condition.notify_all()
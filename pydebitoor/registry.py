@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Clients for many Debitoor accounts sharing a single connection pool.
+
+Examples
+--------
+    >>> registry = ClientRegistry(max_tenants=200, tenant_rate=5)
+    >>> client = registry.get(account.debitoor_token)
+    >>> client.get_service('InvoiceService').list()
+"""
+import collections
+import threading
+
+from .cache import ResponseCache, TTLCache
+from .client import (DEFAULT_API_URL, DEFAULT_POOL_CONNECTIONS,
+                     DEFAULT_POOL_MAXSIZE, DEFAULT_RESPONSE_CACHE_SIZE,
+                     DEFAULT_TAX_CACHE_TTL, DebitoorClient, make_session)
+from .ratelimit import RateLimiter, monotonic
+
+DEFAULT_MAX_TENANTS = 256
+DEFAULT_TAX_CACHE_SIZE = 16 * 1024
+
+
+class ClientRegistry(object):
+    """
+    Hand out one DebitoorClient per access token.
+
+    Every client shares the registry HTTP session (so sockets scale with
+    concurrent calls, not with accounts) and the registry caches, whose
+    entries are partitioned by token. Each tenant gets its own rate
+    limiter. Least recently used tenants are dropped when `max_tenants`
+    is reached or after `idle_timeout` seconds without use.
+
+    Parameters
+    ----------
+    base_url: str
+        API base URL. Default to DEFAULT_API_URL.
+    max_tenants: int
+        Maximum number of clients kept.
+    idle_timeout: float
+        Drop clients unused for this many seconds. None keeps them until
+        evicted by `max_tenants`.
+    tenant_rate: float
+        Calls per second allowed for each tenant. None disables
+        rate limiting.
+    pool_connections: int
+        Number of per-host connection pools to cache.
+    pool_maxsize: int
+        Maximum number of connections kept alive per host, for all
+        tenants together.
+    response_cache: ResponseCache or bool
+        Conditional GET cache shared by tenants. True builds a default one.
+    tax_cache: TTLCache or bool
+        Tax rates cache shared by tenants. True builds a default one.
+    client_kwargs: dict
+        Extra DebitoorClient arguments (timeout, retry_policy...).
+    """
+
+    def __init__(self, base_url=None, max_tenants=DEFAULT_MAX_TENANTS,
+                 idle_timeout=None, tenant_rate=None,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, response_cache=None,
+                 tax_cache=True, **client_kwargs):
+        if max_tenants < 1:
+            raise ValueError('max_tenants must be positive')
+        self.base_url = base_url or DEFAULT_API_URL
+        self.max_tenants = max_tenants
+        self.idle_timeout = idle_timeout
+        self.tenant_rate = tenant_rate
+        self.session = make_session(pool_connections, pool_maxsize)
+        if response_cache is True:
+            response_cache = ResponseCache(DEFAULT_RESPONSE_CACHE_SIZE)
+        self.response_cache = response_cache or None
+        if tax_cache is True:
+            tax_cache = TTLCache(DEFAULT_TAX_CACHE_SIZE,
+                                 DEFAULT_TAX_CACHE_TTL)
+        elif tax_cache is False:
+            tax_cache = None
+        self.tax_cache = tax_cache
+        self.client_kwargs = client_kwargs
+        self.__clients = collections.OrderedDict()
+        self.__last_used = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__clients)
+
+    def __contains__(self, access_token):
+        return access_token in self.__clients
+
+    def __make_client(self, access_token):
+        rate_limiter = None
+        if self.tenant_rate:
+            rate_limiter = RateLimiter(self.tenant_rate)
+        return DebitoorClient(access_token, base_url=self.base_url,
+                              session=self.session,
+                              rate_limiter=rate_limiter,
+                              response_cache=self.response_cache or False,
+                              tax_cache=False if self.tax_cache is None
+                              else self.tax_cache,
+                              **self.client_kwargs)
+
+    def __evict(self, now):
+        """
+        Drop idle and extra tenants, least recently used first.
+        """
+        while self.__clients:
+            access_token = next(iter(self.__clients))
+            idle = self.idle_timeout is not None and \
+                now - self.__last_used[access_token] > self.idle_timeout
+            if not idle and len(self.__clients) <= self.max_tenants:
+                break
+            self.__clients.pop(access_token).close()
+            del self.__last_used[access_token]
+
+    def get(self, access_token):
+        """
+        Parameters
+        ----------
+        access_token: str
+            Debitoor API token of the tenant.
+
+        Returns
+        -------
+            DebitoorClient of the tenant, created on first use.
+        """
+        now = monotonic()
+        with self.__lock:
+            client = self.__clients.pop(access_token, None)
+            if client is None:
+                client = self.__make_client(access_token)
+            self.__clients[access_token] = client
+            self.__last_used[access_token] = now
+            self.__evict(now)
+            return client
+
+    def remove(self, access_token):
+        """
+        Forget a tenant, e.g. when its token is revoked.
+        """
+        with self.__lock:
+            client = self.__clients.pop(access_token, None)
+            self.__last_used.pop(access_token, None)
+        if client is not None:
+            client.close()
+
+    def stats(self):
+        """
+        Returns
+        -------
+            Dict with the number of tenants and cache statistics.
+        """
+        return {'tenants': len(self.__clients),
+                'response_cache': self.response_cache.stats()
+                if self.response_cache else None,
+                'tax_cache': self.tax_cache.stats()
+                if self.tax_cache is not None else None}
+
+    def close(self):
+        """
+        Drop every tenant and release pooled connections.
+        """
+        with self.__lock:
+            self.__clients.clear()
+            self.__last_used.clear()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
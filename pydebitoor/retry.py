@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Retry policies for transient Debitoor API failures.
+"""
+import random
+
+from requests.exceptions import ConnectionError, ConnectTimeout, Timeout
+from urllib3.exceptions import NewConnectionError
+
+
+class RetryPolicy(object):
+    """
+    Decide whether, and when, a failed call is replayed.
+
+    Idempotent methods are retried on connection errors, timeouts and
+    `retry_statuses`. Other methods (POST, PATCH) are only retried when
+    the request provably never reached the API, i.e. the connection
+    could not be established.
+
+    Parameters
+    ----------
+    max_attempts: int
+        Maximum number of attempts, including the first one.
+    backoff_factor: float
+        Base delay in seconds. Attempt n waits backoff_factor * 2 ** (n - 1).
+    max_backoff: float
+        Upper bound of a single delay, in seconds.
+    jitter: bool
+        If true, pick a random delay between 0 and the computed backoff
+        ("full jitter"), so concurrent callers do not retry in lockstep.
+    retry_statuses: iterable
+        HTTP codes considered transient.
+    idempotent_methods: iterable
+        Methods safe to replay whatever the failure.
+    deadline: float
+        Total time budget of a call in seconds, retries included.
+        No retry is attempted if it would end past the deadline.
+    """
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT',
+                                    'DELETE'])
+    RETRY_STATUSES = frozenset([502, 503, 504])
+
+    def __init__(self, max_attempts=3, backoff_factor=0.5, max_backoff=30.0,
+                 jitter=True, retry_statuses=RETRY_STATUSES,
+                 idempotent_methods=IDEMPOTENT_METHODS, deadline=None):
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be at least 1')
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.idempotent_methods = frozenset(m.upper()
+                                            for m in idempotent_methods)
+        self.deadline = deadline
+
+    @staticmethod
+    def never_sent(error):
+        """
+        Returns
+        -------
+            True if `error` happened before the request reached the API.
+        """
+        if isinstance(error, ConnectTimeout):
+            return True
+        reason = getattr(error.args[0] if error.args else None,
+                         'reason', None)
+        return isinstance(reason, NewConnectionError)
+
+    def is_retryable(self, method, response=None, error=None):
+        """
+        Parameters
+        ----------
+        method: str
+            HTTP method of the failed call.
+        response: requests.Response
+            Response of the failed call, if any.
+        error: Exception
+            Exception raised by the failed call, if any.
+
+        Returns
+        -------
+            True if the call can be safely replayed.
+        """
+        if error is not None:
+            if not isinstance(error, (ConnectionError, Timeout)):
+                return False
+            return method.upper() in self.idempotent_methods or \
+                self.never_sent(error)
+        return response is not None and \
+            response.status_code in self.retry_statuses and \
+            method.upper() in self.idempotent_methods
+
+    def backoff(self, attempt):
+        """
+        Parameters
+        ----------
+        attempt: int
+            Number of the attempt that just failed, starting at 1.
+
+        Returns
+        -------
+            Delay to wait before the next attempt, in seconds.
+        """
+        delay = min(self.max_backoff,
+                    self.backoff_factor * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
@@ -1,14 +1,52 @@
 # -*- coding: utf-8 -*-
+import json
+import threading
+
+from pydebitoor.bulk import DEFAULT_MAX_WORKERS, execute_bulk
+from pydebitoor.errors import RequestError
+from pydebitoor.validation import Validator
+
+UPDATE_STATS = ('calls', 'skipped', 'patched', 'replaced', 'bytes_sent',
+                'bytes_saved')
+
+
+def diff_payload(previous, payload):
+    """
+    Fields of `payload` whose value differs from `previous`.
+    Fields absent from `payload` are ignored, not removed.
+
+    Parameters
+    ----------
+    previous: dict or pydebitoor.models.Model
+        Last known version of the entity.
+    payload: dict or pydebitoor.models.Model
+        New version of the entity.
+
+    Returns
+    -------
+        Dict of changed fields.
+    """
+    if hasattr(previous, 'to_dict'):
+        previous = previous.to_dict()
+    if hasattr(payload, 'to_dict'):
+        payload = payload.to_dict()
+    missing = object()
+    return dict((key, value) for key, value in payload.items()
+                if previous.get(key, missing) != value)
 
 
 class BaseService(object):
     uri = None
     version = None
     validation_uri = None
+    validation_schema = None
     allow_partial_update = False
+    model = None
 
     def __init__(self, client):
         self.client = client
+        self.__update_lock = threading.Lock()
+        self.__update_stats = dict.fromkeys(UPDATE_STATS, 0)
 
     def __make_uri(self, uri=None, element_id=None):
         assert self.uri is not None and self.version is not None, \
@@ -20,52 +58,281 @@ class BaseService(object):
             return '{}/{}/{}'.format(self.uri, element_id, self.version)
         return '{}/{}'.format(self.uri, self.version)
 
-    def validate(self, payload, validation_uri=None):
+    @property
+    def validator(self):
+        """
+        Local payload validator. Tax rates are checked only when the client
+        caches them, so validation stays offline once rates are known.
+        """
+        tax_rates = None
+        if getattr(self.client, 'tax_cache', None) is not None:
+            tax_rates = self._sale_tax_rates
+        return Validator(tax_rates)
+
+    def _sale_tax_rates(self, country_code, date):
+        rates = self.client.get_service('TaxService').sale_tax_rates(
+            country_code, date, as_model=False)
+        return (rates.get('baseTax') or {}).get('rates', [])
+
+    def validate(self, payload, validation_uri=None, remote=False):
         """
         Validate the payload of a create action.
 
+        The payload is checked in-process against the service schema (see
+        `pydebitoor.validation`). It is sent to the API validation endpoint
+        only if `remote` is true or a `validation_uri` is given.
+
         Parameters
         ----------
         payload: dict
             Entity to validate
+        validation_uri: str
+            API validation endpoint. Default to the service one.
+        remote: bool
+            Also validate through the API, after local checks passed.
         Returns
         -------
+            True
 
         Raises
         ------
         ValueError if payload is not valid.
+        TypeError for a remote validation with an AsyncDebitoorClient:
+        await `client.post(service.validation_uri, payload)` instead.
 
         """
+        if self.validation_schema:
+            self.validator.check(self.validation_schema, payload)
+        if not remote and not validation_uri:
+            return True
         validation_uri = validation_uri or self.validation_uri
         if not validation_uri:
             return True
+        self._require_blocking_client('validate')
 
-        response = self.client.post(validation_uri, payload=payload)
-        if response.status_code == 200:
-            return True
         try:
-            return ValueError(response.json()['errors'])
-        except:
-            response.raise_for_status()
+            self.client.post(validation_uri, payload=payload)
+        except RequestError as error:
+            raise ValueError(error.errors)
+        return True
+
+    def _require_blocking_client(self, name):
+        """
+        Raise TypeError when bound to an AsyncDebitoorClient: `name` runs
+        calls from threads or chains them, so it cannot return an
+        awaitable.
+        """
+        if getattr(self.client, 'is_async', False):
+            raise TypeError('{}.{} requires a blocking DebitoorClient'
+                            .format(self.__class__.__name__, name))
+
+    def _use_models(self, as_model):
+        if as_model is None:
+            as_model = getattr(self.client, 'models', False)
+        if not as_model or self.model is None:
+            return False
+        if getattr(self.client, 'is_async', False):
+            raise TypeError('{} cannot return models with an async client'
+                            .format(self.__class__.__name__))
+        return True
+
+    def _to_model(self, result, as_model=None, model=None):
+        """
+        Convert an API answer (dict or list of dicts) to `self.model`
+        entities, if requested by `as_model` or by the client `models`
+        flag when `as_model` is None.
+        """
+        try:
+            use_models = self._use_models(as_model)
+        except TypeError:
+            # Async client: drop the call coroutine, it was never sent.
+            getattr(result, 'close', lambda: None)()
+            raise
+        if not use_models:
+            return result
+        model = model or self.model
+        if isinstance(result, list):
+            return model.from_list(result)
+        return model.from_dict(result)
 
-    def list(self):
-        return self._list()
+    def _iter_models(self, results, as_model=None):
+        if not self._use_models(as_model):
+            return results
+        return (self.model.from_dict(result) for result in results)
 
+    def list(self, as_model=None):
+        return self._to_model(self._list(), as_model)
 
-    def create(self, element):
-        return self._create(element)
+    def iter_list(self, as_model=None):
+        """
+        Iterate over elements, decoded one by one while the response
+        is read, so the whole list is never held in memory.
+
+        Returns
+        -------
+            Generator of elements.
+        """
+        self._require_blocking_client('iter_list')
+        return self._iter_models(self._iter_list(), as_model)
+
+    def create(self, element, as_model=None):
+        return self._to_model(self._create(element), as_model)
 
-    def get(self, element_id):
-        return self._get(element_id)
+    def get(self, element_id, as_model=None):
+        return self._to_model(self._get(element_id), as_model)
 
     def delete(self, element_id):
         return self._delete(element_id)
 
-    def update(self, element_id, payload):
-        return self._update(element_id, payload)
+    def update(self, element_id, payload, as_model=None):
+        return self._to_model(self._update(element_id, payload), as_model)
+
+    def partial_update(self, element_id, payload, as_model=None):
+        return self._to_model(self._partial_update(element_id, payload),
+                              as_model)
+
+    def diff_update(self, element_id, payload, previous=None,
+                    as_model=None):
+        """
+        Update an element sending only the fields that changed.
+
+        `payload` is compared with `previous`, fetched if not given (a
+        conditional GET when the client has a response cache). Changed
+        fields are sent with a PATCH if the service allows partial
+        updates, the whole payload with a PUT otherwise. Nothing is sent
+        if no field changed. See `update_stats()` for the savings.
+
+        Parameters
+        ----------
+        element_id: str
+            Id of the element to update.
+        payload: dict or pydebitoor.models.Model
+            New version of the element.
+        previous: dict or pydebitoor.models.Model
+            Last known version of the element, e.g. from a local mirror.
+
+        Returns
+        -------
+            Updated element, or `previous` if nothing changed.
+        """
+        self._require_blocking_client('diff_update')
+        if previous is None:
+            previous = self._get(element_id)
+        changes = diff_payload(previous, payload)
+        full_size = len(json.dumps(
+            payload.to_dict() if hasattr(payload, 'to_dict') else payload))
+        if not changes:
+            self.__count_update(skipped=1, bytes_saved=full_size)
+            return self._to_model(previous.to_dict()
+                                  if hasattr(previous, 'to_dict')
+                                  else previous, as_model)
+        if not self.allow_partial_update:
+            result = self._update(element_id, payload)
+            self.__count_update(replaced=1, bytes_sent=full_size)
+            return self._to_model(result, as_model)
+        result = self._partial_update(element_id, changes)
+        size = len(json.dumps(changes))
+        self.__count_update(patched=1, bytes_sent=size,
+                            bytes_saved=max(0, full_size - size))
+        return self._to_model(result, as_model)
+
+    def __count_update(self, **counts):
+        with self.__update_lock:
+            self.__update_stats['calls'] += 1
+            for key, value in counts.items():
+                self.__update_stats[key] += value
+
+    def update_stats(self):
+        """
+        Returns
+        -------
+            Dict of `diff_update` counters: calls, skipped (requests saved),
+            patched, replaced (full PUT), bytes_sent and bytes_saved.
+        """
+        with self.__update_lock:
+            return dict(self.__update_stats)
+
+    def bulk_create(self, elements, max_workers=DEFAULT_MAX_WORKERS,
+                    max_pending=None):
+        """
+        Create many elements concurrently.
+
+        Parameters
+        ----------
+        elements: iterable
+            Elements to create, as dicts or `pydebitoor.models` entities.
+        max_workers: int
+            Number of concurrent API calls.
+        max_pending: int
+            Number of elements read ahead from `elements`.
+
+        Returns
+        -------
+            Generator of `pydebitoor.bulk.BulkResult`, in completion order.
+            A failing element does not stop the batch, its error is
+            reported in its result.
+
+        Raises
+        ------
+        TypeError with an AsyncDebitoorClient: gather the service
+        coroutines with `asyncio.gather` instead.
+        """
+        self._require_blocking_client('bulk_create')
+        return execute_bulk(self.create, elements, max_workers, max_pending)
+
+    def bulk_update(self, elements, max_workers=DEFAULT_MAX_WORKERS,
+                    max_pending=None):
+        """
+        Update many elements concurrently.
+
+        Parameters
+        ----------
+        elements: iterable
+            (element_id, payload) pairs.
+
+        Returns
+        -------
+            Generator of `pydebitoor.bulk.BulkResult`, see `bulk_create`.
+        """
+        self._require_blocking_client('bulk_update')
+        return execute_bulk(lambda pair: self.update(*pair), elements,
+                            max_workers, max_pending)
 
-    def partial_update(self, element_id, payload):
-        return self._partial_update(element_id, payload)
+    def bulk_partial_update(self, elements, max_workers=DEFAULT_MAX_WORKERS,
+                            max_pending=None):
+        """
+        Partially update many elements concurrently.
+
+        Parameters
+        ----------
+        elements: iterable
+            (element_id, payload) pairs.
+
+        Returns
+        -------
+            Generator of `pydebitoor.bulk.BulkResult`, see `bulk_create`.
+        """
+        self._require_blocking_client('bulk_partial_update')
+        return execute_bulk(lambda pair: self.partial_update(*pair),
+                            elements, max_workers, max_pending)
+
+    def bulk_delete(self, element_ids, max_workers=DEFAULT_MAX_WORKERS,
+                    max_pending=None):
+        """
+        Delete many elements concurrently.
+
+        Parameters
+        ----------
+        element_ids: iterable
+            Ids of the elements to delete.
+
+        Returns
+        -------
+            Generator of `pydebitoor.bulk.BulkResult`, see `bulk_create`.
+        """
+        self._require_blocking_client('bulk_delete')
+        return execute_bulk(self.delete, element_ids, max_workers,
+                            max_pending)
 
     def _create(self, element, **query_params):
         """
@@ -80,21 +347,32 @@ class BaseService(object):
         -------
 
         """
-        return self.client.post(self.__make_uri(), payload=element, **query_params)
+        result = self.client.post(self.__make_uri(), payload=element, **query_params)
+        self.client.invalidate(self.uri)
+        return result
 
     def _list(self, **query_params):
         return self.client.get(self.__make_uri(), **query_params)
 
+    def _iter_list(self, **query_params):
+        return self.client.get_stream(self.__make_uri(), **query_params)
+
     def _get(self, element_id, **query_params):
         return self.client.get(self.__make_uri(element_id=element_id), **query_params)
 
     def _delete(self, element_id, **query_params):
-        return self.client.delete(self.__make_uri(element_id=element_id), **query_params)
+        result = self.client.delete(self.__make_uri(element_id=element_id), **query_params)
+        self.client.invalidate(self.uri)
+        return result
 
     def _update(self, element_id, payload, **query_params):
-        return self.client.put(self.__make_uri(element_id=element_id), payload, **query_params)
+        result = self.client.put(self.__make_uri(element_id=element_id), payload, **query_params)
+        self.client.invalidate(self.uri)
+        return result
 
     def _partial_update(self, element_id, payload, **query_params):
         if not self.allow_partial_update:
             raise ValueError('%s does not support partial update' % self.__class__.__name__)
-        return self.client.patch(self.__make_uri(element_id=element_id), payload, **query_params)
+        result = self.client.patch(self.__make_uri(element_id=element_id), payload, **query_params)
+        self.client.invalidate(self.uri)
+        return result
@@ -1,21 +1,234 @@
 # -*- coding: utf-8 -*-
+import copy
+import threading
+
+from pydebitoor.bulk import DEFAULT_MAX_WORKERS, execute_bulk
+from pydebitoor.models import Customer
+from pydebitoor.ratelimit import monotonic
 from pydebitoor.services.base import BaseService
 
+DEFAULT_INDEX_REFRESH = 300
+
+
+class CustomerIndex(object):
+    """
+    In-memory hash index of customers, by id and by the value of any field
+    (email, number, ciNumber, an external key...). Per-field maps are built
+    on first lookup. Emails are matched case-insensitively.
+
+    The index keeps its own copies: customers given to `add` and returned
+    by `get` can be modified freely.
+
+    Parameters
+    ----------
+    customers: iterable
+        Customers to index, as dicts.
+    """
+
+    def __init__(self, customers=()):
+        self.__lock = threading.Lock()
+        self.__customers = {}
+        self.__keys = {}
+        self.built_at = monotonic()
+        for customer in customers:
+            self.add(customer)
+
+    def __len__(self):
+        return len(self.__customers)
+
+    @staticmethod
+    def normalize(key, value):
+        if key == 'email' and hasattr(value, 'lower'):
+            return value.strip().lower()
+        return value
+
+    def __key_map(self, key):
+        values = self.__keys.get(key)
+        if values is None:
+            values = self.__keys[key] = {}
+            for customer_id, customer in self.__customers.items():
+                value = customer.get(key)
+                if value is not None:
+                    values[self.normalize(key, value)] = customer_id
+        return values
+
+    def get(self, key, value):
+        """
+        Returns
+        -------
+            Copy of the customer dict whose `key` field equals `value`,
+            or None.
+        """
+        with self.__lock:
+            customer_id = self.__key_map(key).get(self.normalize(key, value))
+            customer = self.__customers.get(customer_id)
+        return None if customer is None else copy.deepcopy(customer)
+
+    def __unindex(self, customer_id):
+        previous = self.__customers.pop(customer_id, None)
+        if previous is not None:
+            for key, values in self.__keys.items():
+                value = self.normalize(key, previous.get(key))
+                if values.get(value) == customer_id:
+                    del values[value]
+
+    def add(self, customer):
+        """
+        Index a customer, replacing its previous version.
+        """
+        customer_id = customer['id']
+        customer = copy.deepcopy(customer)
+        with self.__lock:
+            self.__unindex(customer_id)
+            self.__customers[customer_id] = customer
+            for key, values in self.__keys.items():
+                value = customer.get(key)
+                if value is not None:
+                    values[self.normalize(key, value)] = customer_id
+
+    def remove(self, customer_id):
+        with self.__lock:
+            self.__unindex(customer_id)
+
 
 class CustomerService(BaseService):
+    """
+    Customer service.
+
+    `upsert` looks customers up in a CustomerIndex listed once and kept
+    current by this service writes, then refreshed every `index_refresh`
+    seconds (None never refreshes) to catch changes made elsewhere.
+    """
 
     uri = '/customers'
     version = 'v1'
     validation_uri = '/sales/customers/validate/v1'
+    validation_schema = 'customer'
     allow_partial_update = True
+    model = Customer
+    index_refresh = DEFAULT_INDEX_REFRESH
 
-    def create(self, customer, auto_number=False):
+    def __init__(self, client):
+        super(CustomerService, self).__init__(client)
+        self.__index = None
+        self.__index_lock = threading.Lock()
+
+    def get_index(self, refresh=False):
+        """
+        Parameters
+        ----------
+        refresh: bool
+            Rebuild the index even if it is not stale.
+
+        Returns
+        -------
+            CustomerIndex of every customer, listed on first call and when
+            older than `index_refresh` seconds.
+        """
+        self._require_blocking_client('get_index')
+        with self.__index_lock:
+            index = self.__index
+            if refresh or index is None or (
+                    self.index_refresh is not None and
+                    monotonic() - index.built_at > self.index_refresh):
+                index = self.__index = CustomerIndex(self._iter_list())
+            return index
+
+    def upsert(self, customer, key='email', auto_number=False,
+               as_model=None):
+        """
+        Create a customer, or update the one with the same `key` value.
+
+        The lookup is done in the customer index, not through the API, and
+        an existing customer is updated with `diff_update`, so unchanged
+        customers cost no call at all.
+
+        Parameters
+        ----------
+        customer: dict or Customer
+            Customer to create or update.
+        key: str
+            Field identifying the customer: 'email', 'number', or any
+            field holding an external key.
+        auto_number: bool
+            Let Debitoor number created customers.
+
+        Returns
+        -------
+            Created or updated customer.
+
+        Raises
+        ------
+        ValueError if the customer has no `key` value.
+        TypeError with an AsyncDebitoorClient.
+        """
+        self._require_blocking_client('upsert')
+        payload = customer.to_dict() if hasattr(customer, 'to_dict') \
+            else customer
+        value = payload.get(key)
+        if value is None:
+            raise ValueError('Customer has no {} to upsert on'.format(key))
+        existing = self.get_index().get(key, value)
+        if existing is None:
+            return self.create(payload, auto_number, as_model)
+        return self.diff_update(existing['id'], payload, previous=existing,
+                                as_model=as_model)
+
+    def bulk_upsert(self, customers, key='email',
+                    max_workers=DEFAULT_MAX_WORKERS, max_pending=None):
+        """
+        Upsert many customers concurrently, see `upsert`. Key values must
+        be unique within `customers`.
+
+        Returns
+        -------
+            Generator of `pydebitoor.bulk.BulkResult`, in completion order.
+        """
+        self._require_blocking_client('bulk_upsert')
+        self.get_index()
+        return execute_bulk(lambda customer: self.upsert(customer, key),
+                            customers, max_workers, max_pending)
+
+    def __index_customer(self, customer):
+        if self.__index is not None and isinstance(customer, dict) and \
+                customer.get('id'):
+            self.__index.add(customer)
+
+    def _create(self, element, **query_params):
+        result = super(CustomerService, self)._create(element,
+                                                      **query_params)
+        self.__index_customer(result)
+        return result
+
+    def _update(self, element_id, payload, **query_params):
+        result = super(CustomerService, self)._update(element_id, payload,
+                                                      **query_params)
+        self.__index_customer(result)
+        return result
+
+    def _partial_update(self, element_id, payload, **query_params):
+        result = super(CustomerService, self)._partial_update(
+            element_id, payload, **query_params)
+        self.__index_customer(result)
+        return result
+
+    def _delete(self, element_id, **query_params):
+        result = super(CustomerService, self)._delete(element_id,
+                                                      **query_params)
+        if self.__index is not None:
+            self.__index.remove(element_id)
+        return result
+
+    def create(self, customer, auto_number=False, as_model=None):
         """
         Create a new customer in Debitoor
         Parameters
         ----------
-        element: dict
+        element: dict or Customer
             describe
+        as_model: bool
+            Return a Customer instead of a dict. Default to the client
+            `models` flag.
 
         Returns
         -------
@@ -28,9 +241,11 @@ class CustomerService(BaseService):
         query_params = {}
         if auto_number:
             query_params = {'autonumber': 'true'}
-        return self._create(customer, **query_params)
+        return self._to_model(self._create(customer, **query_params),
+                              as_model)
 
-    def update(self, customer_id, customer, auto_number=False):
+    def update(self, customer_id, customer, auto_number=False,
+               as_model=None):
         """
         Create a new customer in Debitoor
         Parameters
@@ -45,4 +260,5 @@ class CustomerService(BaseService):
         query_params = {}
         if auto_number:
             query_params = {'autonumber': 'true'}
-        return self._update(customer_id, customer, **query_params)
+        return self._to_model(
+            self._update(customer_id, customer, **query_params), as_model)
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from pydebitoor.bulk import DEFAULT_MAX_WORKERS, execute_bulk
+from pydebitoor.models import Draft, Invoice
 from pydebitoor.services import InvoiceService
 
 
@@ -11,8 +13,10 @@ class DraftService(InvoiceService):
     uri = '/sales/draftinvoices'
     version = 'v1'
     validation_uri = '/sales/draftinvoices/validate/v1'
+    validation_schema = 'draft'
+    model = Draft
 
-    def complete(self, draft_id, update_auto_number=False):
+    def complete(self, draft_id, update_auto_number=False, as_model=None):
         """
         Complete a draft, an create a new invoice.
         Draft must be able to pass Invoice validation.
@@ -25,6 +29,9 @@ class DraftService(InvoiceService):
             Id of the draft to complete
         update_auto_number: bool
             if true, will force invoice number to customerSettings.lastCustomerNumber
+        as_model: bool
+            Return an Invoice instead of a dict. Default to the client
+            `models` flag.
 
         Returns
         -------
@@ -36,4 +43,33 @@ class DraftService(InvoiceService):
         if update_auto_number:
             query_params = {'updateAutoNumber': 'true'}
         uri = '{}/{}/book/{}'.format(self.uri, draft_id, self.version)
-        return self.client.post(uri, payload={}, **query_params)
+        result = self.client.post(uri, payload={}, **query_params)
+        self.client.invalidate(self.uri)
+        self.client.invalidate(InvoiceService.uri)
+        return self._to_model(result, as_model, model=Invoice)
+
+    def bulk_complete(self, draft_ids, update_auto_number=False,
+                      max_workers=DEFAULT_MAX_WORKERS, max_pending=None):
+        """
+        Complete many drafts concurrently.
+
+        Parameters
+        ----------
+        draft_ids: iterable
+            Ids of the drafts to complete
+        update_auto_number: bool
+            if true, will force invoice number to customerSettings.lastCustomerNumber
+        max_workers: int
+            Number of concurrent API calls.
+        max_pending: int
+            Number of drafts read ahead from `draft_ids`.
+
+        Returns
+        -------
+            Generator of `pydebitoor.bulk.BulkResult`, in completion order.
+            Results hold the created invoices.
+        """
+        self._require_blocking_client('bulk_complete')
+        return execute_bulk(
+            lambda draft_id: self.complete(draft_id, update_auto_number),
+            draft_ids, max_workers, max_pending)
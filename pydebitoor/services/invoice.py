@@ -1,18 +1,170 @@
 # -*- coding: utf-8 -*-
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from pydebitoor.bulk import DEFAULT_MAX_WORKERS, execute_bulk
+from pydebitoor.models import Invoice
 from pydebitoor.services.base import BaseService
 
+DATE_FORMAT = '%Y-%m-%d'
+DEFAULT_WINDOW_DAYS = 31
+
 
 class InvoiceService(BaseService):
 
     uri = '/sales/invoices'
     version = 'v1'
     validation_uri = '/sales/invoices/validate/v1'
+    validation_schema = 'invoice'
+    model = Invoice
 
-    def list(self, from_date=None, to_date=None):
+    def list(self, from_date=None, to_date=None, as_model=None):
         query_params = {}
 
         self._build_interval_params(query_params, from_date, to_date)
-        return self._list(**query_params)
+        return self._to_model(self._list(**query_params), as_model)
+
+    def iter_list(self, from_date=None, to_date=None,
+                  window_days=DEFAULT_WINDOW_DAYS, as_model=None):
+        """
+        Lazily iterate over invoices of an interval.
+
+        The interval is split into windows of `window_days` days, fetched
+        one at a time. Each response is decoded incrementally, so memory
+        stays flat whatever the account size.
+
+        Parameters
+        ----------
+        from_date: str or datetime.date
+            Interval start, 'YYYY-MM-DD'. If not set, everything up to
+            `to_date` is fetched in a single call.
+        to_date: str or datetime.date
+            Interval end, 'YYYY-MM-DD'. Default to today.
+        window_days: int
+            Number of days fetched per call.
+        as_model: bool
+            Yield Invoice entities instead of dicts. Default to the client
+            `models` flag.
+
+        Returns
+        -------
+            Generator of invoices.
+        """
+        self._require_blocking_client('iter_list')
+        return self._iter_models(
+            self._iter_windows(self._iter_list, from_date, to_date,
+                               window_days), as_model)
+
+    def _iter_windows(self, fetch, from_date, to_date, window_days):
+        for window_from, window_to in self._split_interval(
+                from_date, to_date, window_days):
+            query_params = {}
+            self._build_interval_params(query_params, window_from,
+                                        window_to)
+            for row in fetch(**query_params):
+                yield row
+
+    def list_parallel(self, from_date, to_date=None,
+                      window_days=DEFAULT_WINDOW_DAYS,
+                      max_workers=DEFAULT_MAX_WORKERS, max_rows=None,
+                      as_model=None):
+        """
+        Fetch invoices of a large interval by splitting it into windows
+        fetched concurrently.
+
+        Parameters
+        ----------
+        from_date: str or datetime.date
+            Interval start, 'YYYY-MM-DD'.
+        to_date: str or datetime.date
+            Interval end, 'YYYY-MM-DD'. Default to today.
+        window_days: int
+            Initial number of days per window.
+        max_workers: int
+            Number of windows fetched concurrently.
+        max_rows: int
+            If set, a window returning at least this many invoices is split
+            in two and re-fetched, so slow oversized windows shrink.
+
+        Returns
+        -------
+            List of invoices, deduplicated by id and sorted by date.
+        """
+        self._require_blocking_client('list_parallel')
+        return self._to_model(self._fetch_windows(
+            lambda window_from, window_to: self.list(
+                window_from, window_to, as_model=False),
+            from_date, to_date, window_days, max_workers, max_rows),
+            as_model)
+
+    def _fetch_windows(self, fetch, from_date, to_date, window_days,
+                       max_workers, max_rows):
+        """
+        Call `fetch(window_from, window_to)` on every window of the
+        interval from a pool of threads, splitting windows returning
+        `max_rows` elements or more, and merge the results.
+        """
+        if from_date is None:
+            raise ValueError('from_date is required for a parallel fetch')
+        merged = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = dict(
+                (executor.submit(fetch, *window), window)
+                for window in self._split_interval(from_date, to_date,
+                                                   window_days))
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    window_from, window_to = pending.pop(future)
+                    rows = future.result()
+                    start = self._parse_date(window_from)
+                    days = (self._parse_date(window_to) - start).days + 1
+                    if max_rows and len(rows) >= max_rows and days > 1:
+                        for window in self._split_interval(
+                                window_from, window_to, (days + 1) // 2):
+                            pending[executor.submit(fetch, *window)] = \
+                                window
+                        continue
+                    for row in rows:
+                        merged[row['id']] = row
+        return sorted(merged.values(),
+                      key=lambda row: (row.get('date') or '',
+                                       row.get('number') or 0))
+
+    @classmethod
+    def _parse_date(cls, value):
+        if value is None or isinstance(value, datetime.date):
+            return value
+        return datetime.datetime.strptime(value, DATE_FORMAT).date()
+
+    @classmethod
+    def _split_interval(cls, from_date, to_date, window_days):
+        """
+        Split [from_date, to_date] into consecutive, non-overlapping windows
+        of at most `window_days` days.
+
+        Returns
+        -------
+            List of ('YYYY-MM-DD', 'YYYY-MM-DD') bounds, both inclusive.
+        """
+        if window_days < 1:
+            raise ValueError('window_days must be positive')
+        from_date = cls._parse_date(from_date)
+        to_date = cls._parse_date(to_date) or datetime.date.today()
+        if from_date is None:
+            return [(None, to_date.strftime(DATE_FORMAT))]
+        if from_date > to_date:
+            raise ValueError('Query interval is not coherent')
+        windows = []
+        step = datetime.timedelta(days=window_days)
+        while from_date <= to_date:
+            window_to = min(to_date, from_date + step -
+                            datetime.timedelta(days=1))
+            windows.append((from_date.strftime(DATE_FORMAT),
+                            window_to.strftime(DATE_FORMAT)))
+            from_date = window_to + datetime.timedelta(days=1)
+        return windows
 
     @classmethod
     def _build_interval_params(cls, query_params, from_date, to_date):
@@ -33,21 +185,27 @@ class InvoiceService(BaseService):
         if expand:
             query_params['expand'] = ','.join(expand)
 
-    def get(self, invoice_id, expand_customer=False, expand_product=False):
+    def get(self, invoice_id, expand_customer=False, expand_product=False,
+            as_model=None):
         query_params = {}
         self._build_expand_params(query_params, expand_customer,
                                   expand_product)
-        return self._get(invoice_id, **query_params)
+        return self._to_model(self._get(invoice_id, **query_params),
+                              as_model)
 
-    def update(self, invoice_id, payload, expand_customer=False, expand_product=False):
+    def update(self, invoice_id, payload, expand_customer=False,
+               expand_product=False, as_model=None):
         query_params = {}
         self._build_expand_params(query_params, expand_customer,
                                   expand_product)
-        return self._update(invoice_id, payload, **query_params)
+        return self._to_model(
+            self._update(invoice_id, payload, **query_params), as_model)
 
     def copy(self, invoice_id):
         uri = '{}/{}/copy/v1'.format(self.uri, invoice_id, self.version)
-        self.client.post(uri, payload={})
+        result = self.client.post(uri, payload={})
+        self.client.invalidate(self.uri)
+        return result
 
     def email(self, invoice_id, recipient, subject,
               cc_recipient=None, message=None, attachment_name=None,
@@ -99,21 +257,136 @@ class InvoiceService(BaseService):
         uri = '{}/{}/email/v2'.format(self.uri, invoice_id)
         return self.client.post(uri, payload=payload)
 
-    def pdf(self, invoice_id):
+    def pdf(self, invoice_id, destination=None):
+        """
+        Get invoice PDF.
+
+        Parameters
+        ----------
+        invoice_id: str
+            ID of the invoice
+        destination: str or file-like
+            If set, stream the PDF to this path or file object instead of
+            returning it, see `DebitoorClient.download`. Requires a
+            blocking client.
+
+        Returns
+        -------
+            PDF content as bytes, or number of bytes written
+            if `destination` is set.
+        """
         uri = '{}/{}/pdf/{}'.format(self.uri, invoice_id, self.version)
-        return self.client.get(uri, payload={})
+        if destination is not None:
+            self._require_blocking_client('pdf')
+            return self.client.download(uri, destination)
+        return self.client.get(uri)
 
-    def thumbnail(self, invoice_id):
+    def thumbnail(self, invoice_id, destination=None):
+        """
+        Get invoice thumbnail, see `pdf`.
+        """
         uri = '{}/{}/thumbnail/{}'.format(self.uri, invoice_id, self.version)
-        return self.client.get(uri, payload={})
+        if destination is not None:
+            self._require_blocking_client('thumbnail')
+            return self.client.download(uri, destination)
+        return self.client.get(uri)
+
+    def bulk_pdf_export(self, invoice_ids, directory,
+                        max_workers=DEFAULT_MAX_WORKERS, overwrite=False,
+                        filename='{}.pdf'):
+        """
+        Download PDFs of many invoices concurrently, streamed to disk so
+        memory stays bounded whatever the number and size of files.
+
+        The export is lazy: the directory is created and downloads start
+        only when the returned generator is iterated. Consume it, e.g.
+        `for result in service.bulk_pdf_export(ids, path)`.
 
-    def headers(self, invoice_id=None, from_date=None, to_date=None):
+        Files already present in `directory` are not downloaded again,
+        so an interrupted or partially failed export is resumed by calling
+        this method again with the same arguments.
+
+        Parameters
+        ----------
+        invoice_ids: iterable
+            IDs of the invoices to export.
+        directory: str
+            Directory to write PDFs to. Created if missing.
+        max_workers: int
+            Number of concurrent downloads.
+        overwrite: bool
+            If true, download files even if they already exist.
+        filename: str
+            File name pattern, formatted with the invoice id.
+
+        Returns
+        -------
+            Generator of `pydebitoor.bulk.BulkResult`, in completion order.
+            Results hold the path of each PDF.
+        """
+        self._require_blocking_client('bulk_pdf_export')
+
+        def export(invoice_id):
+            path = os.path.join(directory, filename.format(invoice_id))
+            if overwrite or not os.path.exists(path):
+                self.pdf(invoice_id, destination=path)
+            return path
+
+        def results():
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            for result in execute_bulk(export, invoice_ids, max_workers):
+                yield result
+
+        return results()
+
+    def headers(self, invoice_id=None, from_date=None, to_date=None,
+                as_model=None):
         query_params = {}
 
         self._build_interval_params(query_params, from_date, to_date)
+        return self._to_model(
+            self.client.get(self._headers_uri(invoice_id), **query_params),
+            as_model)
+
+    def _headers_uri(self, invoice_id=None):
         if invoice_id:
-            uri = '{}/headers/{}/{}'.format(self.uri, invoice_id, self.version)
-        else:
-            uri = '{}/headers/{}'.format(self.uri, self.version)
+            return '{}/headers/{}/{}'.format(self.uri, invoice_id,
+                                             self.version)
+        return '{}/headers/{}'.format(self.uri, self.version)
 
-        return self.client.get(uri, **query_params)
+    def iter_headers(self, from_date=None, to_date=None,
+                     window_days=DEFAULT_WINDOW_DAYS, as_model=None):
+        """
+        Lazily iterate over invoice headers of an interval,
+        see `iter_list`.
+
+        Returns
+        -------
+            Generator of invoice headers.
+        """
+        self._require_blocking_client('iter_headers')
+        return self._iter_models(
+            self._iter_windows(
+                lambda **query_params: self.client.get_stream(
+                    self._headers_uri(), **query_params),
+                from_date, to_date, window_days), as_model)
+
+    def headers_parallel(self, from_date, to_date=None,
+                         window_days=DEFAULT_WINDOW_DAYS,
+                         max_workers=DEFAULT_MAX_WORKERS, max_rows=None,
+                         as_model=None):
+        """
+        Fetch invoice headers of a large interval concurrently,
+        see `list_parallel`.
+
+        Returns
+        -------
+            List of invoice headers, deduplicated by id and sorted by date.
+        """
+        self._require_blocking_client('headers_parallel')
+        return self._to_model(self._fetch_windows(
+            lambda window_from, window_to: self.headers(
+                from_date=window_from, to_date=window_to, as_model=False),
+            from_date, to_date, window_days, max_workers, max_rows),
+            as_model)
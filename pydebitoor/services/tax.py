@@ -1,11 +1,32 @@
 # -*- coding: utf-8 -*-
+from pydebitoor.cache import cached_call
+from pydebitoor.models import TaxRates
 from pydebitoor.services.base import BaseService
 
 
 class TaxService(BaseService):
+    """
+    Tax rates lookups.
+
+    Answers only change with tax law, so they are memoized in the client
+    `tax_cache` (see DebitoorClient), keyed on
+    (account, kind, country, date, category_id): rates depend on the
+    account country, so a cache can be shared by clients of several
+    accounts.
+    """
+    model = TaxRates
+
+    @property
+    def cache(self):
+        return getattr(self.client, 'tax_cache', None)
+
+    def _get_rates(self, key, uri, query_params):
+        key = (getattr(self.client, 'cache_partition', None),) + key
+        return cached_call(self.cache, key, self.client.get, uri,
+                           **query_params)
 
     def purchase_tax_rates(self, supplier_country_code,
-                           date, category_id=None):
+                           date, category_id=None, as_model=None):
         """
         Get applicable tax rates for purchase given a supplier country code and a date.
         Can give an optional category ID.
@@ -45,12 +66,12 @@ class TaxService(BaseService):
             query_params['categoryId'] = category_id
             query_params['mapFrompCategoryId'] = category_id
 
+        key = ('purchase', supplier_country_code, date, category_id)
+        return self._to_model(
+            self._get_rates(key, '/purchase/taxrates/v1', query_params),
+            as_model)
 
-        return self.client.get('purchase/taxrates/v1', **query_params)
-
-
-
-    def sale_tax_rates(self, customer_country_code, date):
+    def sale_tax_rates(self, customer_country_code, date, as_model=None):
         """
         Get tax rates applicable to a given customer at a given date.
         Parameters
@@ -84,4 +105,7 @@ class TaxService(BaseService):
             'mapFromDate': date
         }
 
-        return self.client.get('/sales/taxrates/v1', **query_params)
+        key = ('sale', customer_country_code, date, None)
+        return self._to_model(
+            self._get_rates(key, '/sales/taxrates/v1', query_params),
+            as_model)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Deduplication of identical concurrent calls.
+"""
+import copy
+import threading
+
+
+class _Call(object):
+    __slots__ = ('event', 'result', 'error', 'followers')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight(object):
+    """
+    Share one execution between threads asking for the same key at the
+    same time.
+
+    The first caller (the leader) runs the function, callers arriving
+    while it is in flight wait for it and receive a copy of its result,
+    or the exception it raised.
+
+    Examples
+    --------
+        >>> flight = SingleFlight()
+        >>> flight.do(('GET', url), fetch, url)
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def stats(self):
+        """
+        Returns
+        -------
+            Dict with the number of executed and coalesced calls, and
+            of calls currently in flight.
+        """
+        with self.__lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced,
+                    'in_flight': len(self.__calls)}
+
+    def forget(self, prefix):
+        """
+        Stop sharing in-flight calls whose key starts with `prefix`: their
+        current callers still get their result, later callers start a new
+        call. Used after a write, so reads issued after it do not receive
+        data fetched before it.
+
+        Parameters
+        ----------
+        prefix: str
+            Key prefix, keys that are not strings are kept.
+        """
+        with self.__lock:
+            for key in list(self.__calls):
+                if hasattr(key, 'startswith') and key.startswith(prefix):
+                    del self.__calls[key]
+
+    def __finish(self, key, call):
+        """
+        Release followers.
+
+        Returns
+        -------
+            True if other callers share the result.
+        """
+        with self.__lock:
+            if self.__calls.get(key) is call:
+                del self.__calls[key]
+        call.event.set()
+        return call.followers > 0
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Return `func(*args, **kwargs)`, unless a call with the same key is
+        already in flight, in which case wait for its result.
+
+        Parameters
+        ----------
+        key: hashable
+            Call identity.
+        func: callable
+            Function to execute.
+
+        Returns
+        -------
+            Function result. Shared results are deep copied so callers
+            can alter them independently.
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            if call is None:
+                call = self.__calls[key] = _Call()
+                self.executed += 1
+                leader = True
+            else:
+                call.followers += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            call.error = exc
+            self.__finish(key, call)
+            raise
+        call.result = result
+        if self.__finish(key, call):
+            return copy.deepcopy(result)
+        return result
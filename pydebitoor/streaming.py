@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental decoding of large JSON array responses.
+"""
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Consumed text is dropped from the buffer once it is this large.
+_COMPACT_THRESHOLD = 64 * 1024
+
+
+def iter_json_array(chunks, decoder=None):
+    """
+    Decode a top-level JSON array item by item, as chunks arrive.
+
+    Only the item being decoded is buffered, so peak memory is bound by
+    the largest item rather than by the whole document.
+
+    Parameters
+    ----------
+    chunks: iterable
+        Raw body chunks, bytes (decoded as UTF-8) or text.
+    decoder: object
+        Any object with a `raw_decode(text, index)` method, e.g.
+        `simplejson.JSONDecoder()` for a C accelerated backend.
+        Default to `json.JSONDecoder()`.
+
+    Returns
+    -------
+        Generator of decoded items.
+
+    Raises
+    ------
+    ValueError: If the document is not a valid JSON array.
+    """
+    decoder = decoder or json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    eof = False
+    started = False
+    # After an item a ',' or ']' must follow, after a ',' an item.
+    after_item = after_comma = False
+
+    def read():
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return None
+        if isinstance(chunk, bytes):
+            chunk = text_decoder.decode(chunk)
+        return chunk
+
+    while True:
+        while pos < len(buf) and buf[pos] in WHITESPACE:
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError('Unexpected end of JSON array')
+            chunk = read()
+            if chunk is None:
+                eof = True
+            else:
+                buf = buf[pos:] + chunk
+                pos = 0
+            continue
+
+        char = buf[pos]
+        if not started:
+            if char != '[':
+                raise ValueError('Expected a JSON array, got %r' % char)
+            started = True
+            pos += 1
+            continue
+        if char == ']':
+            if after_comma:
+                raise ValueError('Trailing comma at %d' % pos)
+            return
+        if char == ',':
+            if not after_item:
+                raise ValueError('Unexpected comma at %d' % pos)
+            after_item, after_comma = False, True
+            pos += 1
+            continue
+        if after_item:
+            raise ValueError('Expected , or ] at %d' % pos)
+
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            item, end = None, None
+        # An item ending exactly at the end of the buffer may be a
+        # truncated number or literal: wait for more data.
+        if end is None or (end == len(buf) and not eof):
+            if eof:
+                raise ValueError('Invalid JSON array item at %d' % pos)
+            # Grow the pending text geometrically before decoding again,
+            # so large items are not re-parsed once per chunk.
+            pending = [buf[pos:]]
+            size = len(pending[0])
+            wanted = 2 * size
+            while size < wanted:
+                chunk = read()
+                if chunk is None:
+                    eof = True
+                    break
+                pending.append(chunk)
+                size += len(chunk)
+            buf = ''.join(pending)
+            pos = 0
+            continue
+
+        yield item
+        after_item, after_comma = True, False
+        pos = end
+        if pos > _COMPACT_THRESHOLD:
+            buf = buf[pos:]
+            pos = 0
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+Local SQLite mirror of Debitoor customers and invoices.
+
+Examples
+--------
+    >>> store = SyncStore('/var/lib/app/debitoor.sqlite')
+    >>> engine = SyncEngine(client, store)
+    >>> engine.sync()
+    >>> store.find_invoices(customer_id=customer_id, from_date='2016-01-01')
+"""
+import datetime
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+
+from .bulk import DEFAULT_MAX_WORKERS, execute_bulk
+from .errors import NotFoundError
+from .services.invoice import DATE_FORMAT
+
+logger = logging.getLogger('pydebitoor')
+DEFAULT_FETCH_BY_ID_LIMIT = 100
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    id TEXT PRIMARY KEY,
+    number INTEGER,
+    email TEXT,
+    digest TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS customers_number ON customers (number);
+CREATE INDEX IF NOT EXISTS customers_email ON customers (email);
+CREATE TABLE IF NOT EXISTS invoices (
+    id TEXT PRIMARY KEY,
+    number TEXT,
+    customer_id TEXT,
+    date TEXT,
+    digest TEXT NOT NULL,
+    data TEXT NOT NULL,
+    version TEXT
+);
+CREATE INDEX IF NOT EXISTS invoices_number ON invoices (number);
+CREATE INDEX IF NOT EXISTS invoices_customer ON invoices (customer_id, date);
+CREATE INDEX IF NOT EXISTS invoices_date ON invoices (date);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _serialize(entity):
+    data = json.dumps(entity, sort_keys=True, separators=(',', ':'))
+    return data, hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class SyncStore(object):
+    """
+    Thread-safe SQLite store of mirrored entities, indexed by id, number,
+    email, customer and date.
+
+    Parameters
+    ----------
+    path: str
+        SQLite database path. Default to an in-memory database.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.__lock = threading.RLock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.executescript(SCHEMA)
+        columns = [row[1] for row in self.__query(
+            'PRAGMA table_info(invoices)')]
+        if 'version' not in columns:
+            # Stores created before invoice versions were tracked.
+            with self.__connection:
+                self.__connection.execute(
+                    'ALTER TABLE invoices ADD COLUMN version TEXT')
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def __query(self, sql, args=()):
+        with self.__lock:
+            return self.__connection.execute(sql, args).fetchall()
+
+    def get_state(self, name, default=None):
+        rows = self.__query('SELECT value FROM sync_state WHERE name = ?',
+                            (name,))
+        return rows[0][0] if rows else default
+
+    def set_state(self, name, value):
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO sync_state VALUES (?, ?)',
+                (name, value))
+
+    def digests(self, table, from_date=None):
+        """
+        Parameters
+        ----------
+        table: str
+            'customers' or 'invoices'.
+        from_date: str
+            Only return invoices dated from this day.
+
+        Returns
+        -------
+            Dict of entity id to content digest.
+        """
+        assert table in ('customers', 'invoices')
+        if from_date is not None:
+            return dict(self.__query(
+                'SELECT id, digest FROM invoices WHERE date >= ?',
+                (from_date,)))
+        return dict(self.__query('SELECT id, digest FROM %s' % table))
+
+    def invoice_versions(self, from_date=None):
+        """
+        Parameters
+        ----------
+        from_date: str
+            Only return invoices dated from this day.
+
+        Returns
+        -------
+            Dict of invoice id to version, see `save_invoices`.
+        """
+        if from_date is not None:
+            return dict(self.__query(
+                'SELECT id, version FROM invoices WHERE date >= ?',
+                (from_date,)))
+        return dict(self.__query('SELECT id, version FROM invoices'))
+
+    def save_customers(self, rows):
+        """
+        Parameters
+        ----------
+        rows: list
+            (customer, data, digest) tuples, see `_serialize`.
+        """
+        with self.__lock, self.__connection:
+            self.__connection.executemany(
+                'INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?, ?)',
+                [(customer['id'], customer.get('number'),
+                  customer.get('email'), digest, data)
+                 for customer, data, digest in rows])
+
+    def save_invoices(self, rows, versions=None):
+        """
+        Parameters
+        ----------
+        rows: list
+            (invoice, data, digest) tuples, see `_serialize`.
+        versions: dict
+            Invoice id to version, compared by the next sync with the
+            upstream one. Default to the invoice lastModified.
+        """
+        versions = versions or {}
+        with self.__lock, self.__connection:
+            self.__connection.executemany(
+                'INSERT OR REPLACE INTO invoices VALUES '
+                '(?, ?, ?, ?, ?, ?, ?)',
+                [(invoice['id'],
+                  None if invoice.get('number') is None
+                  else str(invoice['number']),
+                  invoice.get('customerId'), invoice.get('date'),
+                  digest, data,
+                  versions.get(invoice['id'], invoice.get('lastModified')))
+                 for invoice, data, digest in rows])
+
+    def delete_customers(self, customer_ids):
+        with self.__lock, self.__connection:
+            self.__connection.executemany(
+                'DELETE FROM customers WHERE id = ?',
+                [(customer_id,) for customer_id in customer_ids])
+
+    def delete_invoices(self, invoice_ids):
+        with self.__lock, self.__connection:
+            self.__connection.executemany(
+                'DELETE FROM invoices WHERE id = ?',
+                [(invoice_id,) for invoice_id in invoice_ids])
+
+    def get_customer(self, customer_id):
+        """
+        Returns
+        -------
+            Customer dict, None if unknown.
+        """
+        rows = self.__query('SELECT data FROM customers WHERE id = ?',
+                            (customer_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def find_customers(self, number=None, email=None):
+        """
+        Returns
+        -------
+            List of customers matching every given criterion.
+        """
+        clauses, args = [], []
+        if number is not None:
+            clauses.append('number = ?')
+            args.append(number)
+        if email is not None:
+            clauses.append('email = ?')
+            args.append(email)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return [json.loads(data) for (data,) in self.__query(
+            'SELECT data FROM customers%s ORDER BY number' % where, args)]
+
+    def get_invoice(self, invoice_id):
+        """
+        Returns
+        -------
+            Invoice dict, None if unknown.
+        """
+        rows = self.__query('SELECT data FROM invoices WHERE id = ?',
+                            (invoice_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def find_invoices(self, number=None, customer_id=None, from_date=None,
+                      to_date=None):
+        """
+        Parameters
+        ----------
+        number: str or int
+            Invoice number.
+        customer_id: str
+            Debitoor customer id.
+        from_date: str
+            Interval start, 'YYYY-MM-DD', inclusive.
+        to_date: str
+            Interval end, 'YYYY-MM-DD', inclusive.
+
+        Returns
+        -------
+            List of invoices matching every given criterion,
+            sorted by date.
+        """
+        clauses, args = [], []
+        if number is not None:
+            clauses.append('number = ?')
+            args.append(str(number))
+        if customer_id is not None:
+            clauses.append('customer_id = ?')
+            args.append(customer_id)
+        if from_date is not None:
+            clauses.append('date >= ?')
+            args.append(from_date)
+        if to_date is not None:
+            clauses.append('date <= ?')
+            args.append(to_date)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return [json.loads(data) for (data,) in self.__query(
+            'SELECT data FROM invoices%s ORDER BY date, number' % where,
+            args)]
+
+
+class SyncEngine(object):
+    """
+    Incrementally mirror Debitoor entities into a SyncStore.
+
+    Only entities whose content changed since the last sync are written,
+    and entities deleted from Debitoor are removed from the store.
+    Invoice headers are compared with the stored versions (lastModified)
+    so only new and changed invoices are fetched in full. The customer API
+    has no modification filter, so customers are streamed in full and
+    compared by content digest.
+
+    Parameters
+    ----------
+    client: DebitoorClient
+        Client used to fetch entities.
+    store: SyncStore
+        Local store.
+    fetch_by_id_limit: int
+        Up to this number of changed invoices, invoices are fetched one by
+        one, concurrently. Above it, the whole range is streamed instead.
+    max_workers: int
+        Number of concurrent calls when fetching invoices by id.
+    """
+
+    def __init__(self, client, store,
+                 fetch_by_id_limit=DEFAULT_FETCH_BY_ID_LIMIT,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        self.client = client
+        self.store = store
+        self.fetch_by_id_limit = fetch_by_id_limit
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _write_changed(entities, digests, save):
+        """
+        Save entities whose digest changed, by batches.
+
+        Returns
+        -------
+            Tuple (number of entities seen, number of entities written,
+            set of seen ids).
+        """
+        seen = set()
+        fetched = changed = 0
+        batch = []
+        for entity in entities:
+            fetched += 1
+            seen.add(entity['id'])
+            data, digest = _serialize(entity)
+            if digests.get(entity['id']) == digest:
+                continue
+            batch.append((entity, data, digest))
+            if len(batch) >= BATCH_SIZE:
+                save(batch)
+                changed += len(batch)
+                batch = []
+        if batch:
+            save(batch)
+            changed += len(batch)
+        return fetched, changed, seen
+
+    def sync_customers(self):
+        """
+        Mirror customers. Customers deleted from Debitoor are removed
+        from the store.
+
+        Returns
+        -------
+            Dict with fetched, changed and deleted counts.
+        """
+        digests = self.store.digests('customers')
+        service = self.client.get_service('CustomerService')
+        fetched, changed, seen = self._write_changed(
+            service.iter_list(as_model=False), digests,
+            self.store.save_customers)
+        deleted = set(digests) - seen
+        self.store.delete_customers(deleted)
+        logger.debug('Synced customers: %s fetched, %s changed, %s deleted',
+                     fetched, changed, len(deleted))
+        return {'fetched': fetched, 'changed': changed,
+                'deleted': len(deleted)}
+
+    def sync_invoices(self, from_date=None, full=False):
+        """
+        Mirror invoices changed since the last sync.
+
+        Headers of every invoice of the mirrored range are listed and their
+        lastModified compared with the stored one: new and changed invoices
+        are fetched, and stored invoices of the range no longer listed are
+        removed.
+
+        Parameters
+        ----------
+        from_date: str
+            'YYYY-MM-DD' start of the mirrored range, kept for later syncs.
+            If never set, every invoice is mirrored.
+        full: bool
+            Fetch every invoice of the range, even unchanged ones.
+
+        Returns
+        -------
+            Dict with listed, fetched, changed and deleted counts.
+        """
+        if from_date is None:
+            from_date = self.store.get_state('invoices_from')
+        service = self.client.get_service('InvoiceService')
+        stored = self.store.invoice_versions(from_date)
+        upstream = {}
+        for header in service.iter_headers(from_date, as_model=False):
+            # Without lastModified, any header change marks the invoice.
+            upstream[header['id']] = header.get('lastModified') or \
+                _serialize(header)[1]
+        changed = [invoice_id for invoice_id, version in upstream.items()
+                   if full or stored.get(invoice_id) != version]
+
+        def save(rows):
+            self.store.save_invoices(rows, dict(
+                (invoice['id'], invoice.get('lastModified') or
+                 upstream.get(invoice['id']))
+                for invoice, _, _ in rows))
+
+        fetched, written, _ = self._write_changed(
+            self._fetch_invoices(service, changed, from_date), {}, save)
+        deleted = set(stored) - set(upstream)
+        self.store.delete_invoices(deleted)
+        if from_date is not None:
+            self.store.set_state('invoices_from', from_date)
+        self.store.set_state('invoices',
+                             datetime.date.today().strftime(DATE_FORMAT))
+        logger.debug('Synced invoices from %s: %s listed, %s fetched, '
+                     '%s deleted', from_date, len(upstream), fetched,
+                     len(deleted))
+        return {'listed': len(upstream), 'fetched': fetched,
+                'changed': written, 'deleted': len(deleted)}
+
+    def _fetch_invoices(self, service, invoice_ids, from_date):
+        """
+        Generator of the invoices of `invoice_ids`, fetched by id when they
+        are few, filtered from the streamed range otherwise.
+        """
+        if not invoice_ids:
+            return
+        if len(invoice_ids) > self.fetch_by_id_limit:
+            wanted = set(invoice_ids)
+            for invoice in service.iter_list(from_date, as_model=False):
+                if invoice['id'] in wanted:
+                    yield invoice
+            return
+        for result in execute_bulk(
+                lambda invoice_id: service.get(invoice_id, as_model=False),
+                invoice_ids, self.max_workers):
+            if isinstance(result.error, NotFoundError):
+                # Deleted since listed, removed by the next sync.
+                continue
+            if result.error is not None:
+                raise result.error
+            yield result.result
+
+    def sync(self):
+        """
+        Mirror customers and invoices.
+
+        Returns
+        -------
+            Dict of per-entity sync statistics.
+        """
+        return {'customers': self.sync_customers(),
+                'invoices': self.sync_invoices()}
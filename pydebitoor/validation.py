@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Local validation of customer, invoice and draft payloads.
+
+Schemas below are compiled once into lists of checks, so validating a
+payload costs no API call. Invoice and draft lines are checked against
+the tax rates of the customer country when a rates lookup is given
+(see `BaseService.validate`, which uses the cached TaxService).
+
+Examples
+--------
+    >>> errors = Validator().errors('invoice', payload)
+    >>> {'lines.0.quantity': 'must be a number'}
+"""
+import datetime
+import re
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+STRING = 'string'
+NUMBER = 'number'
+INTEGER = 'integer'
+BOOLEAN = 'boolean'
+LIST = 'list'
+DATE = 'date'
+EMAIL = 'email'
+COUNTRY = 'country'
+CURRENCY = 'currency'
+
+# ISO 3166-1 alpha-2
+COUNTRY_CODES = frozenset((
+    'AD AE AF AG AI AL AM AO AQ AR AS AT AU AW AX AZ BA BB BD BE BF BG BH BI '
+    'BJ BL BM BN BO BQ BR BS BT BV BW BY BZ CA CC CD CF CG CH CI CK CL CM CN '
+    'CO CR CU CV CW CX CY CZ DE DJ DK DM DO DZ EC EE EG EH ER ES ET FI FJ FK '
+    'FM FO FR GA GB GD GE GF GG GH GI GL GM GN GP GQ GR GS GT GU GW GY HK HM '
+    'HN HR HT HU ID IE IL IM IN IO IQ IR IS IT JE JM JO JP KE KG KH KI KM KN '
+    'KP KR KW KY KZ LA LB LC LI LK LR LS LT LU LV LY MA MC MD ME MF MG MH MK '
+    'ML MM MN MO MP MQ MR MS MT MU MV MW MX MY MZ NA NC NE NF NG NI NL NO NP '
+    'NR NU NZ OM PA PE PF PG PH PK PL PM PN PR PS PT PW PY QA RE RO RS RU RW '
+    'SA SB SC SD SE SG SH SI SJ SK SL SM SN SO SR SS ST SV SX SY SZ TC TD TF '
+    'TG TH TJ TK TL TM TN TO TR TT TV TW TZ UA UG UM US UY UZ VA VC VE VG VI '
+    'VN VU WF WS YE YT ZA ZM ZW').split())
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+CURRENCY_PATTERN = re.compile(r'^[A-Z]{3}$')
+
+LINE_SCHEMA = {
+    'required': ('description', 'quantity'),
+    'types': {'description': STRING, 'quantity': NUMBER,
+              'unitNetPrice': NUMBER, 'unitGrossPrice': NUMBER,
+              'taxRate': NUMBER, 'taxEnabled': BOOLEAN,
+              'discountRate': NUMBER, 'productId': STRING},
+    'ranges': {'taxRate': (0, 100), 'discountRate': (0, 100)},
+    'one_of': (('unitNetPrice', 'unitGrossPrice'),),
+}
+
+CUSTOMER_SCHEMA = {
+    'required': ('name',),
+    'types': {'name': STRING, 'number': INTEGER, 'address': STRING,
+              'phone': STRING, 'email': EMAIL, 'homepage': STRING,
+              'ciNumber': STRING, 'vatNumber': STRING,
+              'countryCode': COUNTRY, 'paymentTermsId': INTEGER,
+              'paymentTermsDays': INTEGER, 'notes': STRING,
+              'isArchived': BOOLEAN},
+}
+
+DRAFT_SCHEMA = {
+    'required': (),
+    'types': {'number': INTEGER, 'date': DATE, 'dueDate': DATE,
+              'customerId': STRING, 'customerName': STRING,
+              'customerAddress': STRING, 'customerCountry': COUNTRY,
+              'customerEmail': EMAIL, 'currency': CURRENCY,
+              'currencyRate': NUMBER, 'paymentTermsId': INTEGER,
+              'notes': STRING, 'additionalNotes': STRING, 'lines': LIST},
+    'lines': LINE_SCHEMA,
+    'min_lines': 0,
+}
+
+INVOICE_SCHEMA = dict(DRAFT_SCHEMA, min_lines=1,
+                      one_of=(('customerId', 'customerName'),))
+
+SCHEMAS = {'customer': CUSTOMER_SCHEMA, 'invoice': INVOICE_SCHEMA,
+           'draft': DRAFT_SCHEMA}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_country(value):
+    return isinstance(value, string_types) and value in COUNTRY_CODES
+
+
+def _as_dict(line):
+    """
+    Line as a dict, or None if it is neither a dict nor a model.
+    """
+    if isinstance(line, dict):
+        return line
+    if hasattr(line, 'to_dict'):
+        return line.to_dict()
+    return None
+
+
+TYPE_CHECKS = {
+    STRING: (lambda value: isinstance(value, string_types),
+             'must be a string'),
+    NUMBER: (_is_number, 'must be a number'),
+    INTEGER: (lambda value: _is_number(value) and int(value) == value,
+              'must be an integer'),
+    BOOLEAN: (lambda value: isinstance(value, bool), 'must be a boolean'),
+    LIST: (lambda value: isinstance(value, list), 'must be a list'),
+    DATE: (lambda value: isinstance(value, string_types) and
+           bool(DATE_PATTERN.match(value)), 'must be a YYYY-MM-DD date'),
+    EMAIL: (lambda value: isinstance(value, string_types) and
+            bool(EMAIL_PATTERN.match(value)), 'must be a valid email'),
+    COUNTRY: (_is_country, 'unknown country code'),
+    CURRENCY: (lambda value: isinstance(value, string_types) and
+               bool(CURRENCY_PATTERN.match(value)),
+               'must be an ISO 4217 currency code'),
+}
+
+
+def compile_schema(schema):
+    """
+    Turn a schema into a list of `check(payload, prefix, errors)`
+    functions, each adding `{field: message}` entries to `errors`.
+    """
+    checks = []
+
+    for field in schema.get('required', ()):
+        def check_required(payload, prefix, errors, field=field):
+            if payload.get(field) in (None, ''):
+                errors[prefix + field] = 'required'
+        checks.append(check_required)
+
+    types = [(field, ) + TYPE_CHECKS[kind]
+             for field, kind in sorted(schema.get('types', {}).items())]
+
+    def check_types(payload, prefix, errors):
+        for field, is_valid, message in types:
+            value = payload.get(field)
+            if value is not None and not is_valid(value):
+                errors.setdefault(prefix + field, message)
+    checks.append(check_types)
+
+    for field, (low, high) in sorted(schema.get('ranges', {}).items()):
+        def check_range(payload, prefix, errors, field=field, low=low,
+                        high=high):
+            value = payload.get(field)
+            if _is_number(value) and not low <= value <= high:
+                errors.setdefault(prefix + field, 'must be between {} and {}'
+                                  .format(low, high))
+        checks.append(check_range)
+
+    for fields in schema.get('one_of', ()):
+        def check_one_of(payload, prefix, errors, fields=fields):
+            if all(payload.get(field) in (None, '') for field in fields):
+                errors[prefix + fields[0]] = 'one of {} is required'.format(
+                    ', '.join(fields))
+        checks.append(check_one_of)
+
+    if 'lines' in schema:
+        line_checks = compile_schema(schema['lines'])
+        min_lines = schema.get('min_lines', 0)
+
+        def check_lines(payload, prefix, errors):
+            lines = payload.get('lines') or []
+            if not isinstance(lines, list):
+                return
+            if len(lines) < min_lines:
+                errors[prefix + 'lines'] = 'at least {} line required' \
+                    .format(min_lines)
+            for index, line in enumerate(lines):
+                line = _as_dict(line)
+                if line is None:
+                    errors['{}lines.{}'.format(prefix, index)] = \
+                        'must be an object'
+                    continue
+                line_prefix = '{}lines.{}.'.format(prefix, index)
+                for check in line_checks:
+                    check(line, line_prefix, errors)
+        checks.append(check_lines)
+
+    return checks
+
+
+COMPILED = {}
+
+
+def get_rules(name):
+    """
+    Returns
+    -------
+        Compiled checks of the schema `name`, see SCHEMAS.
+    """
+    rules = COMPILED.get(name)
+    if rules is None:
+        rules = COMPILED[name] = compile_schema(SCHEMAS[name])
+    return rules
+
+
+class Validator(object):
+    """
+    Validate payloads against SCHEMAS.
+
+    Parameters
+    ----------
+    tax_rates: callable
+        `tax_rates(country_code, date)` returning the list of tax rates
+        allowed for a customer country at a 'YYYY-MM-DD' date. If set,
+        invoice and draft lines with a taxRate are checked against it.
+    """
+
+    def __init__(self, tax_rates=None):
+        self.tax_rates = tax_rates
+
+    def errors(self, name, payload):
+        """
+        Parameters
+        ----------
+        name: str
+            Schema name: 'customer', 'invoice' or 'draft'.
+        payload: dict or pydebitoor.models.Model
+            Payload to validate.
+
+        Returns
+        -------
+            Dict of errors keyed by field, empty if the payload is valid.
+            Line fields are keyed as 'lines.<index>.<field>'.
+        """
+        if hasattr(payload, 'to_dict'):
+            payload = payload.to_dict()
+        errors = {}
+        for check in get_rules(name):
+            check(payload, '', errors)
+        if self.tax_rates is not None and 'lines' in SCHEMAS[name]:
+            self.__check_tax_rates(payload, errors)
+        return errors
+
+    def __check_tax_rates(self, payload, errors):
+        country = payload.get('customerCountry')
+        lines = payload.get('lines')
+        if not _is_country(country) or not isinstance(lines, list):
+            return
+        date = payload.get('date')
+        if not isinstance(date, string_types) or \
+                not DATE_PATTERN.match(date):
+            date = datetime.date.today().strftime('%Y-%m-%d')
+        rates = None
+        for index, line in enumerate(lines):
+            line = _as_dict(line)
+            if line is None:
+                continue
+            rate = line.get('taxRate')
+            if not _is_number(rate) or line.get('taxEnabled') is False:
+                continue
+            if rates is None:
+                rates = set(self.tax_rates(country, date))
+            if rate not in rates:
+                errors.setdefault(
+                    'lines.{}.taxRate'.format(index),
+                    'not applicable in {} on {}'.format(country, date))
+
+    def check(self, name, payload):
+        """
+        Raises
+        ------
+        ValueError with the errors dict if the payload is not valid.
+        """
+        errors = self.errors(name, payload)
+        if errors:
+            raise ValueError(errors)
+        return True
@@ -11,5 +11,7 @@ setup(name='pydebitoor',
       url='https://github.com/idlead/pydebitoor.git',
       author='François Schmidts',
       author_email='francois.schmidts@dolead.com',
-      install_requires=['requests'],
+      install_requires=['requests', 'futures; python_version < "3.0"'],
+      extras_require={'async': ['aiohttp'], 'arrow': ['pyarrow'],
+                      'numpy': ['numpy']},
       packages=['pydebitoor', 'pydebitoor.services'])
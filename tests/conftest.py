@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import sys
+
+import pytest
+
+from benchmarks.mock_server import MockDebitoorServer, VALID_TOKEN
+from pydebitoor.client import DebitoorClient
+from pydebitoor.retry import RetryPolicy
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # async def syntax and asyncio.run.
+    collect_ignore.append('test_async_client.py')
+
+
+class Clock(object):
+    """
+    Stand-in for the `time` module of pydebitoor.cache.
+    """
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('pydebitoor.cache.time', clock)
+    return clock
+
+
+@pytest.fixture
+def server():
+    server = MockDebitoorServer(customers=20, invoices=200).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server):
+    client = DebitoorClient(VALID_TOKEN, base_url=server.base_url,
+                            retry_policy=RetryPolicy(backoff_factor=0.01))
+    yield client
+    client.close()
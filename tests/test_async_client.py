@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import inspect
+
+import pytest
+from requests.exceptions import HTTPError
+
+pytest.importorskip('aiohttp')
+
+from pydebitoor.async_client import AsyncDebitoorClient  # noqa: E402
+
+
+@pytest.fixture
+def async_client(server):
+    return AsyncDebitoorClient('token', base_url=server.base_url)
+
+
+def run(coroutine_function):
+    return asyncio.run(coroutine_function())
+
+
+@pytest.mark.parametrize('service_name, method, args', [
+    ('CustomerService', 'bulk_create', ([{'name': 'A'}],)),
+    ('CustomerService', 'bulk_update', ([('id', {'name': 'A'})],)),
+    ('CustomerService', 'bulk_partial_update', ([('id', {'name': 'A'})],)),
+    ('CustomerService', 'bulk_delete', (['id'],)),
+    ('CustomerService', 'bulk_upsert', ([{'email': 'a@b.fr'}],)),
+    ('DraftService', 'bulk_complete', (['id'],)),
+    ('InvoiceService', 'bulk_pdf_export', (['id'], '/nonexistent')),
+])
+def test_bulk_methods_refuse_async_client(async_client, server, service_name,
+                                          method, args):
+    service = async_client.get_service(service_name)
+    with pytest.raises(TypeError):
+        getattr(service, method)(*args)
+    assert server.calls == 0
+
+
+def test_gather_creates_customers(async_client, server):
+    service = async_client.get_service('CustomerService')
+
+    async def create():
+        async with async_client:
+            return await asyncio.gather(*[service.create({'name': str(index)})
+                                          for index in range(10)])
+
+    created = run(create)
+    assert all(customer['id'] in server.state.customers
+               for customer in created)
+
+
+INVOICE_ID = '000000000000000000000015'
+CUSTOMER = {'name': 'ACME', 'email': 'acme@example.com'}
+DATES = ('2016-01-01', '2016-12-31')
+
+# Arguments of every public service method returning an awaitable.
+AWAITABLE = {
+    'list': (), 'create': (CUSTOMER,), 'get': ('missing',),
+    'update': ('missing', CUSTOMER), 'partial_update': ('missing', CUSTOMER),
+    'delete': ('missing',), 'copy': (INVOICE_ID,),
+    'email': (INVOICE_ID, 'a@example.com', 'Invoice'),
+    'pdf': (INVOICE_ID,), 'thumbnail': (INVOICE_ID,),
+    'headers': (None,) + DATES, 'complete': ('missing',),
+    'sale_tax_rates': ('FR', '2016-01-01'),
+    'purchase_tax_rates': ('FR', '2016-01-01'),
+}
+# Arguments of methods needing a blocking client.
+BLOCKING = {
+    'iter_list': (), 'iter_headers': DATES, 'list_parallel': DATES,
+    'headers_parallel': DATES, 'diff_update': ('missing', CUSTOMER),
+    'upsert': (CUSTOMER,), 'get_index': (),
+    'bulk_create': ([CUSTOMER],), 'bulk_update': ([('id', CUSTOMER)],),
+    'bulk_partial_update': ([('id', CUSTOMER)],), 'bulk_delete': (['id'],),
+    'bulk_upsert': ([CUSTOMER],), 'bulk_complete': (['id'],),
+    'bulk_pdf_export': ([INVOICE_ID], '/nonexistent'),
+}
+# Methods running locally, without any call.
+LOCAL = {'validate': ({'name': 'ACME', 'customerName': 'ACME',
+                       'lines': [{'description': 'Line', 'quantity': 1,
+                                  'unitNetPrice': 1}]},),
+         'update_stats': ()}
+
+
+def public_methods(service):
+    return sorted(name for name in dir(service)
+                  if not name.startswith('_') and
+                  inspect.ismethod(getattr(service, name)))
+
+
+@pytest.mark.parametrize('service_name', ['CustomerService', 'DraftService',
+                                          'InvoiceService', 'TaxService'])
+def test_every_service_method(async_client, server, service_name):
+    service = async_client.get_service(service_name)
+    names = public_methods(service)
+    unknown = set(names) - set(AWAITABLE) - set(BLOCKING) - set(LOCAL)
+    assert not unknown, 'Add new methods to this test: {}'.format(unknown)
+
+    async def check():
+        async with async_client:
+            for name in names:
+                method = getattr(service, name)
+                if name in BLOCKING:
+                    with pytest.raises(TypeError):
+                        method(*BLOCKING[name])
+                    continue
+                if name in LOCAL:
+                    assert not asyncio.iscoroutine(method(*LOCAL[name]))
+                    continue
+                try:
+                    awaitable = method(*AWAITABLE[name])
+                except (AssertionError, ValueError):
+                    # Not supported by the service whatever the client:
+                    # CRUD without an URI, partial updates.
+                    assert service.uri is None or \
+                        not service.allow_partial_update
+                    continue
+                assert asyncio.iscoroutine(awaitable), name
+                try:
+                    await awaitable
+                except HTTPError:
+                    pass
+
+    run(check)
+    assert server.calls > 0
+
+
+@pytest.mark.parametrize('kwargs', [{'remote': True},
+                                    {'validation_uri': '/validate/v1'}])
+def test_remote_validation_needs_blocking_client(async_client, server,
+                                                 kwargs):
+    service = async_client.get_service('CustomerService')
+    with pytest.raises(TypeError):
+        service.validate({'name': 'ACME'}, **kwargs)
+    assert service.validate({'name': 'ACME'}) is True
+    assert server.calls == 0
+
+
+def test_models_need_blocking_client(async_client):
+    service = async_client.get_service('CustomerService')
+    with pytest.raises(TypeError):
+        service.get('missing', as_model=True)
+
+
+@pytest.mark.parametrize('method', ['pdf', 'thumbnail'])
+def test_downloads_need_blocking_client(async_client, tmpdir, method):
+    service = async_client.get_service('InvoiceService')
+    with pytest.raises(TypeError):
+        getattr(service, method)(INVOICE_ID,
+                                 destination=str(tmpdir.join('file')))
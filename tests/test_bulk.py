@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+import pytest
+
+from pydebitoor.bulk import execute_bulk
+from pydebitoor.errors import NotFoundError
+
+
+def test_results_report_each_item():
+    def func(item):
+        if item == 3:
+            raise KeyError(item)
+        return item * 2
+
+    results = sorted(execute_bulk(func, range(6), max_workers=2),
+                     key=lambda result: result.index)
+    assert [result.result for result in results] == [0, 2, 4, None, 8, 10]
+    assert [result.ok for result in results] == [True] * 3 + [False] + \
+        [True] * 2
+    assert isinstance(results[3].error, KeyError)
+    assert results[3].item == 3
+
+
+def test_items_are_read_lazily():
+    consumed = []
+
+    def items():
+        for index in itertools.count():
+            consumed.append(index)
+            yield index
+
+    results = execute_bulk(lambda item: item, items(), max_workers=2,
+                           max_pending=4)
+    assert consumed == []
+    for _ in range(3):
+        next(results)
+    assert len(consumed) <= 8
+    results.close()
+
+
+def test_max_pending_must_cover_workers():
+    with pytest.raises(ValueError):
+        list(execute_bulk(lambda item: item, [1], max_workers=4,
+                          max_pending=2))
+
+
+def test_bulk_create(client, server):
+    service = client.get_service('CustomerService')
+    results = list(service.bulk_create({'name': str(index)}
+                                       for index in range(20)))
+    assert all(result.ok for result in results)
+    assert len(server.state.customers) == 40
+
+
+def test_bulk_updates_and_deletes(client, server):
+    service = client.get_service('CustomerService')
+    customer_ids = sorted(server.state.customers)[:4]
+    assert all(result.ok for result in service.bulk_update(
+        (customer_id, {'name': 'Updated'}) for customer_id in customer_ids))
+    assert all(result.ok for result in service.bulk_partial_update(
+        (customer_id, {'email': 'x@example.com'})
+        for customer_id in customer_ids))
+    assert [server.state.customers[customer_id]
+            for customer_id in customer_ids] == \
+        [{'id': customer_id, 'name': 'Updated', 'email': 'x@example.com'}
+         for customer_id in customer_ids]
+
+    results = list(service.bulk_delete(customer_ids + ['missing']))
+    errors = [result.error for result in results if not result.ok]
+    assert len(errors) == 1 and isinstance(errors[0], NotFoundError)
+    assert not set(customer_ids) & set(server.state.customers)
+
+
+def test_bulk_complete(client, server):
+    service = client.get_service('DraftService')
+    draft_ids = [service.create({'customerName': 'ACME', 'lines': []})['id']
+                 for _ in range(3)]
+    invoices = [result.result for result in service.bulk_complete(draft_ids)]
+    assert not server.state.drafts
+    assert all(invoice['id'] in server.state.invoices
+               for invoice in invoices)
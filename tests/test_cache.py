@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from benchmarks.mock_server import VALID_TOKEN
+from pydebitoor.cache import ResponseCache, TTLCache
+from pydebitoor.client import DebitoorClient
+
+
+def test_entries_expire(clock):
+    cache = TTLCache(ttl=10)
+    cache.set('rates', 1)
+    cache.set('forever', 2, ttl=None)
+    clock.now += 9
+    assert cache.get('rates') == 1
+    clock.now += 2
+    assert cache.get('rates') is None
+    assert 'rates' not in cache
+    assert cache.get('forever') == 2
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'size': 1,
+                             'maxsize': 1024}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set('first', 1)
+    cache.set('second', 2)
+    cache.get('first')
+    cache.set('third', 3)
+    assert cache.keys() == ['first', 'third']
+    cache.set('first', 4)
+    cache.set('fourth', 4)
+    assert cache.keys() == ['first', 'fourth']
+
+
+def test_tax_cache_survives_a_restart(client, server, tmpdir, clock):
+    path = str(tmpdir.join('tax.json'))
+    client.tax_cache = TTLCache(ttl=60, path=path)
+    taxes = client.get_service('TaxService')
+    rates = taxes.sale_tax_rates('FR', '2020-01-01')
+    taxes.purchase_tax_rates('US', '2020-01-01', category_id='1')
+    assert taxes.sale_tax_rates('FR', '2020-01-01') == rates
+    assert server.calls == 2
+    client.tax_cache.save()
+
+    client.tax_cache = TTLCache(ttl=60, path=path)
+    assert len(client.tax_cache) == 2
+    assert taxes.sale_tax_rates('FR', '2020-01-01') == rates
+    taxes.purchase_tax_rates('US', '2020-01-01', category_id='1')
+    assert server.calls == 2
+
+    clock.now += 61
+    assert len(TTLCache(ttl=60, path=path)) == 0
+
+
+def test_unreadable_cache_file_is_ignored(tmpdir):
+    path = tmpdir.join('tax.json')
+    path.write('[["trunc')
+    cache = TTLCache(path=str(path))
+    assert len(cache) == 0
+    cache.set(('FR', None), {'rate': 20})
+    cache.save()
+    assert TTLCache(path=str(path)).get(('FR', None)) == {'rate': 20}
+    with pytest.raises(ValueError):
+        TTLCache().save()
+
+
+@pytest.fixture
+def cached_client(server):
+    client = DebitoorClient(VALID_TOKEN, base_url=server.base_url,
+                            response_cache=True)
+    yield client
+    client.close()
+
+
+def cached_uris(client):
+    return [key.split(' ', 1)[1].replace(client.base_url, '')
+            for key in client.response_cache.store.keys()]
+
+
+def test_not_modified_serves_cached_body(cached_client, server):
+    service = cached_client.get_service('CustomerService')
+    customer_id = sorted(server.state.customers)[0]
+    first = service.get(customer_id)
+    first['name'] = 'Changed locally'
+    second = service.get(customer_id)
+    assert second == server.state.customers[customer_id]
+    assert server.calls == 2
+    assert cached_client.response_cache.not_modified == 1
+
+    server.state.customers[customer_id]['name'] = 'Changed upstream'
+    assert service.get(customer_id)['name'] == 'Changed upstream'
+    assert cached_client.response_cache.not_modified == 1
+
+
+@pytest.mark.parametrize('write', [
+    lambda service, customer_id: service.create(
+        {'name': 'ACME', 'countryCode': 'FR'}),
+    lambda service, customer_id: service.update(
+        customer_id, {'name': 'ACME', 'countryCode': 'FR', 'number': 0}),
+    lambda service, customer_id: service.partial_update(
+        customer_id, {'name': 'ACME'}),
+    lambda service, customer_id: service.delete(customer_id),
+], ids=['POST', 'PUT', 'PATCH', 'DELETE'])
+def test_writes_invalidate_cached_responses(cached_client, server, write):
+    service = cached_client.get_service('CustomerService')
+    invoices = cached_client.get_service('InvoiceService')
+    customer_id = sorted(server.state.customers)[0]
+    service.list()
+    service.get(customer_id)
+    invoices.list()
+    assert len(cached_uris(cached_client)) == 3
+
+    write(service, customer_id)
+    assert [uri for uri in cached_uris(cached_client)
+            if uri.startswith('/customers')] == []
+    assert len(cached_uris(cached_client)) == 1
+    listed = dict((customer['id'], customer) for customer in service.list())
+    assert listed == server.state.customers
+    assert cached_client.response_cache.not_modified == 0
+
+
+def test_cache_is_partitioned_by_access_token(server):
+    server.config['token'] = None
+    cache = ResponseCache()
+    clients = [DebitoorClient(token, base_url=server.base_url,
+                              response_cache=cache)
+               for token in ('first token', 'second token')]
+    for client in clients:
+        client.get_service('CustomerService').list()
+    assert len(cache.store) == 2
+    assert cache.not_modified == 0
+
+    clients[0].get_service('CustomerService').create(
+        {'name': 'ACME', 'countryCode': 'FR'})
+    assert [key.split(' ')[0] for key in cache.store.keys()] == \
+        [ResponseCache.partition('second token')]
+    for client in clients:
+        client.close()
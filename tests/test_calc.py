@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from pydebitoor.calc import TaxCalculator
+
+
+class FakeTaxService(object):
+    calls = 0
+
+    def sale_tax_rates(self, country_code, date, as_model=None):
+        self.calls += 1
+        return {'baseTax': {'defaultRate': 20, 'rates': [0, 5.5, 10, 20]}}
+
+
+def make_drafts(count, seed=0):
+    rng = random.Random(seed)
+    return [{'customerCountry': 'FR', 'date': '2016-01-01',
+             'priceDisplayType': rng.choice(['net', 'gross']),
+             'lines': [{'quantity': rng.randint(1, 9),
+                        'unitNetPrice': rng.randint(1, 100000) / 100.0,
+                        'unitGrossPrice': rng.randint(1, 100000) / 100.0,
+                        'discountRate': rng.choice([0, 10, 12.5]),
+                        'taxRate': rng.choice([0, 5.5, 10, 20, None]),
+                        'taxEnabled': rng.choice([True, True, False])}
+                       for _ in range(rng.randint(0, 20))]}
+            for _ in range(count)]
+
+
+def test_net_totals():
+    calculator = TaxCalculator(use_numpy=False)
+    result = calculator.compute([{'lines': [
+        {'quantity': 2, 'unitNetPrice': 10, 'taxRate': 20},
+        {'quantity': 1, 'unitNetPrice': 1.005, 'taxRate': 20},
+        {'quantity': 1, 'unitNetPrice': 100, 'discountRate': 10,
+         'taxRate': 5.5}]}])[0]
+    assert result['totalNetAmount'] == 111.01
+    assert result['totalTaxAmount'] == 4.2 + 4.95
+    assert result['taxes'] == [
+        {'rate': 5.5, 'netAmount': 90.0, 'taxAmount': 4.95},
+        {'rate': 20, 'netAmount': 21.01, 'taxAmount': 4.2}]
+    assert result['lines']['netAmount'] == [20.0, 1.01, 90.0]
+
+
+def test_gross_totals():
+    result = TaxCalculator(use_numpy=False).compute([{
+        'priceDisplayType': 'gross',
+        'lines': [{'quantity': 1, 'unitGrossPrice': 120, 'taxRate': 20}]}])
+    assert result[0]['totalNetAmount'] == 100
+    assert result[0]['totalGrossAmount'] == 120
+
+
+def test_missing_rates_use_cached_default():
+    tax_service = FakeTaxService()
+    payload, totals = TaxCalculator(tax_service).prepare([{
+        'customerCountry': 'FR', 'date': '2016-01-01',
+        'lines': [{'quantity': 1, 'unitNetPrice': 10}] * 3}])[0]
+    assert [line['taxRate'] for line in payload['lines']] == [20] * 3
+    assert totals['totalTaxAmount'] == 6
+    assert tax_service.calls == 1
+
+
+def test_rejects_inapplicable_rates():
+    with pytest.raises(ValueError):
+        TaxCalculator(FakeTaxService()).compute([{
+            'customerCountry': 'FR',
+            'lines': [{'quantity': 1, 'unitNetPrice': 1, 'taxRate': 7}]}])
+
+
+def test_numpy_and_python_agree():
+    pytest.importorskip('numpy')
+    drafts = make_drafts(500)
+    assert TaxCalculator(FakeTaxService(), use_numpy=True).compute(drafts) \
+        == TaxCalculator(FakeTaxService(), use_numpy=False).compute(drafts)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from pydebitoor import client as client_module
+from pydebitoor.cache import TTLCache
+from pydebitoor.client import DebitoorClient, make_session
+from pydebitoor.errors import ApiConnectionError, NotFoundError
+
+
+def test_crud(client, server):
+    service = client.get_service('CustomerService')
+    created = service.create({'name': 'ACME', 'countryCode': 'FR'})
+    assert service.get(created['id'])['name'] == 'ACME'
+    service.partial_update(created['id'], {'name': 'ACME 2'})
+    assert server.state.customers[created['id']]['name'] == 'ACME 2'
+    service.delete(created['id'])
+    with pytest.raises(NotFoundError):
+        service.get(created['id'])
+
+
+def test_services_share_the_client_session(client):
+    assert client.get_service('InvoiceService') is \
+        client.get_service('InvoiceService')
+    adapter = client.session.get_adapter(client.base_url)
+    assert adapter is client.session.get_adapter('https://example.com')
+
+
+def test_connections_are_reused(client, server):
+    service = client.get_service('CustomerService')
+    for _ in range(5):
+        service.list()
+    pools = client.session.get_adapter(client.base_url).poolmanager.pools
+    assert [(pools[key].num_connections, pools[key].num_requests)
+            for key in pools.keys()] == [(1, 5)]
+
+
+def test_given_session_is_not_closed(server):
+    session = make_session()
+    with DebitoorClient('token', base_url=server.base_url,
+                        session=session) as client:
+        client.get_service('CustomerService').list()
+    assert session.adapters
+    session.get(server.base_url + '/environment/v1',
+                headers={'x-token': 'token'}).raise_for_status()
+    session.close()
+
+
+def test_remote_validation(client, server):
+    service = client.get_service('CustomerService')
+    assert service.validate({'name': 'ACME'}, remote=True)
+    assert server.calls == 1
+    with pytest.raises(ValueError):
+        service.validate({'name': 12}, remote=True)
+    assert server.calls == 1
+
+
+def test_bulk_pdf_export_is_lazy(client, server, tmpdir):
+    service = client.get_service('InvoiceService')
+    invoice_ids = sorted(server.state.invoices)[:5]
+    directory = tmpdir.join('pdfs')
+    results = service.bulk_pdf_export(invoice_ids + ['missing'],
+                                      str(directory))
+    assert not directory.check() and server.calls == 0
+
+    results = sorted(results, key=lambda result: result.index)
+    assert [result.ok for result in results] == [True] * 5 + [False]
+    assert sorted(path.basename for path in directory.listdir()) == \
+        sorted('{}.pdf'.format(invoice_id) for invoice_id in invoice_ids)
+
+    calls = server.calls
+    assert all(result.ok for result in service.bulk_pdf_export(
+        invoice_ids, str(directory)))
+    assert server.calls == calls
+
+
+@pytest.fixture
+def verified(monkeypatch):
+    verified = TTLCache()
+    monkeypatch.setattr(client_module, 'VERIFIED_CREDENTIALS', verified)
+    return verified
+
+
+def test_construction_does_not_call_the_api(server):
+    DebitoorClient('invalid', base_url=server.base_url).close()
+    assert server.calls == 0
+
+
+def test_verify_is_cached(client, server, verified, clock):
+    assert client.verify(ttl=60)
+    with DebitoorClient('token', base_url=server.base_url,
+                        verify_credentials=True) as other:
+        assert other.verify(ttl=60)
+    assert server.calls == 1
+    assert len(verified) == 1
+
+    clock.now += 61
+    assert client.verify(ttl=60)
+    assert server.calls == 2
+    assert client.verify(ttl=0)
+    assert server.calls == 3
+
+
+def test_invalid_credentials_are_not_cached(server, verified):
+    with DebitoorClient('invalid', base_url=server.base_url) as client:
+        for _ in range(2):
+            with pytest.raises(ApiConnectionError):
+                client.verify()
+    assert server.calls == 2
+    assert len(verified) == 0
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from pydebitoor.services.base import diff_payload
+from pydebitoor.services.customer import CustomerIndex
+
+
+def test_index_lookups():
+    index = CustomerIndex([{'id': '1', 'email': 'A@Example.com', 'number': 1},
+                           {'id': '2', 'email': 'b@example.com', 'number': 2}])
+    assert index.get('email', 'a@example.COM ')['id'] == '1'
+    assert index.get('number', 2)['id'] == '2'
+    index.add({'id': '1', 'email': 'c@example.com', 'number': 1})
+    assert index.get('email', 'a@example.com') is None
+    index.remove('2')
+    assert index.get('number', 2) is None
+    assert len(index) == 1
+
+
+def test_index_holds_copies():
+    customer = {'id': '1', 'email': 'a@example.com', 'name': 'A'}
+    index = CustomerIndex([customer])
+    customer['name'] = 'changed'
+    found = index.get('email', 'a@example.com')
+    assert found['name'] == 'A'
+    found['name'] = 'changed'
+    assert index.get('email', 'a@example.com')['name'] == 'A'
+
+
+def test_upsert_after_mutating_returned_customer(client, server):
+    service = client.get_service('CustomerService')
+    created = service.upsert({'name': 'Old', 'email': 'acme@example.com'})
+    created['name'] = 'New'
+    updated = service.upsert(created)
+    assert service.update_stats()['skipped'] == 0
+    assert updated['name'] == 'New'
+    assert server.state.customers[created['id']]['name'] == 'New'
+
+    updated['name'] = 'Newer'
+    service.upsert(updated)
+    assert server.state.customers[created['id']]['name'] == 'Newer'
+    calls = server.calls
+    service.upsert(updated)
+    assert server.calls == calls
+    assert service.update_stats()['skipped'] == 1
+
+
+@pytest.fixture
+def requests_sent(client):
+    sent = []
+    client.add_hook('before_request', lambda method, url, attempt, kwargs:
+                    sent.append((method, kwargs.get('data'))))
+    return sent
+
+
+def test_diff_payload():
+    assert diff_payload({'name': 'A', 'email': 'a@example.com'},
+                        {'name': 'B', 'email': 'a@example.com',
+                         'phone': '1'}) == {'name': 'B', 'phone': '1'}
+    assert diff_payload({'name': 'A', 'notes': 'kept'}, {'name': 'A'}) == {}
+
+
+def test_diff_update_skips_unchanged(client, server, requests_sent):
+    service = client.get_service('CustomerService')
+    customer_id = sorted(server.state.customers)[0]
+    previous = dict(server.state.customers[customer_id])
+    assert service.diff_update(customer_id, dict(previous),
+                               previous=previous) == previous
+    assert requests_sent == []
+    service.diff_update(customer_id, {'name': previous['name']})
+    assert [method for method, _ in requests_sent] == ['GET']
+    stats = service.update_stats()
+    assert (stats['calls'], stats['skipped'], stats['bytes_sent']) == \
+        (2, 2, 0)
+    assert stats['bytes_saved'] == len(json.dumps(previous)) + \
+        len(json.dumps({'name': previous['name']}))
+
+
+def test_diff_update_patches_changes(client, server, requests_sent):
+    service = client.get_service('CustomerService')
+    customer_id = sorted(server.state.customers)[0]
+    previous = dict(server.state.customers[customer_id])
+    payload = dict(previous, name='Renamed')
+    result = service.diff_update(customer_id, payload, previous=previous)
+    assert result['name'] == 'Renamed'
+    assert server.state.customers[customer_id] == payload
+    [(method, data)] = requests_sent
+    assert method == 'PATCH'
+    assert json.loads(data) == {'name': 'Renamed'}
+    stats = service.update_stats()
+    assert (stats['patched'], stats['replaced'], stats['skipped']) == \
+        (1, 0, 0)
+    assert stats['bytes_sent'] == len(json.dumps({'name': 'Renamed'}))
+    assert stats['bytes_saved'] == \
+        len(json.dumps(payload)) - stats['bytes_sent']
+
+
+def test_diff_update_without_partial_updates_replaces(client, server,
+                                                      requests_sent):
+    service = client.get_service('CustomerService')
+    service.allow_partial_update = False
+    customer_id = sorted(server.state.customers)[0]
+    previous = dict(server.state.customers[customer_id])
+    payload = dict(previous, name='Renamed')
+    service.diff_update(customer_id, payload, previous=previous)
+    [(method, data)] = requests_sent
+    assert method == 'PUT'
+    assert json.loads(data) == payload
+    stats = service.update_stats()
+    assert (stats['calls'], stats['replaced'], stats['patched']) == \
+        (1, 1, 0)
+    assert stats['bytes_sent'] == len(json.dumps(payload))
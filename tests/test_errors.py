@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import pytest
+from requests.models import Response
+
+from pydebitoor.errors import RequestError
+from pydebitoor.outbox import is_transient
+
+
+def make_response(body):
+    response = Response()
+    response.status_code = 400
+    response._content = body
+    return response
+
+
+@pytest.mark.parametrize('body, errors', [
+    (b'{"errors": {"name": "required"}}', {'name': 'required'}),
+    (b'{"message": "Bad request"}', {}),
+    (b'<html>Bad request</html>', {}),
+    (b'', {}),
+    (b'[1]', {}),
+])
+def test_request_error_parses_any_body(body, errors):
+    error = RequestError(response=make_response(body))
+    assert error.errors == errors
+    assert not is_transient(error)
+
+
+def test_request_error_without_response():
+    assert RequestError().errors == {}
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+
+import pytest
+
+from pydebitoor.export import (CUSTOMER_SCHEMA, INVOICE_LINE_SCHEMA,
+                               INVOICE_SCHEMA, export_customers,
+                               export_invoices, flatten_lines, iter_columns,
+                               iter_record_batches, write, write_csv)
+from pydebitoor.models import Invoice
+
+INVOICE = {'id': '1', 'number': 7, 'date': '2016-01-02', 'customerId': 'c',
+           'currency': 'EUR', 'customerName': u'Société Générale',
+           'totalGrossAmount': '12.5', 'unknown': 'dropped',
+           'lines': [{'description': u'Café', 'quantity': 2,
+                      'unitNetPrice': 1.5, 'taxRate': 20},
+                     {'description': 'Tea', 'quantity': 1}]}
+
+
+def read_rows(path):
+    if str is bytes:  # Python 2 csv reads bytes.
+        with open(path, 'rb') as csv_file:
+            return [dict((key, value.decode('utf-8'))
+                         for key, value in row.items())
+                    for row in csv.DictReader(csv_file)]
+    with io.open(path, encoding='utf-8', newline='') as csv_file:
+        return list(csv.DictReader(csv_file))
+
+
+def test_iter_columns_converts_and_batches():
+    batches = list(iter_columns([INVOICE, Invoice.from_dict(INVOICE),
+                                 {'id': 2}], INVOICE_SCHEMA, batch_size=2))
+    assert [len(batch['id']) for batch in batches] == [2, 1]
+    assert list(batches[0]) == [name for name, _ in INVOICE_SCHEMA]
+    assert batches[0]['number'] == [7, 7]
+    assert batches[0]['totalGrossAmount'] == [12.5, 12.5]
+    assert batches[1]['id'] == [u'2']
+    assert batches[1]['paid'] == [None]
+    with pytest.raises(ValueError):
+        list(iter_columns([INVOICE], INVOICE_SCHEMA, batch_size=0))
+
+
+def test_flatten_lines():
+    lines = list(flatten_lines([Invoice.from_dict(INVOICE)]))
+    assert [line['lineIndex'] for line in lines] == [0, 1]
+    assert lines[0]['invoiceId'] == '1'
+    assert lines[0]['invoiceNumber'] == 7
+    assert lines[1]['description'] == 'Tea'
+    assert 'lines' not in lines[0]
+
+
+def test_write_csv_to_path(tmpdir):
+    path = str(tmpdir.join('invoices.csv'))
+    assert write_csv([INVOICE] * 3, path, INVOICE_SCHEMA, batch_size=2) == 3
+    with io.open(path, encoding='utf-8') as csv_file:
+        assert csv_file.readline().strip() == \
+            ','.join(name for name, _ in INVOICE_SCHEMA)
+    rows = read_rows(path)
+    assert len(rows) == 3
+    assert rows[0]['customerName'] == u'Société Générale'
+    assert rows[0]['totalGrossAmount'] == '12.5'
+    assert rows[0]['paid'] == ''
+
+
+def test_write_csv_lines(tmpdir):
+    path = str(tmpdir.join('lines.csv'))
+    assert write_csv(flatten_lines([INVOICE]), path,
+                     INVOICE_LINE_SCHEMA) == 2
+    rows = read_rows(path)
+    assert [row['description'] for row in rows] == [u'Café', 'Tea']
+    assert [row['invoiceNumber'] for row in rows] == ['7', '7']
+    assert rows[1]['unitNetPrice'] == ''
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        write([], io.BytesIO(), INVOICE_SCHEMA, format='xlsx')
+
+
+def test_export_from_services(client, server, tmpdir):
+    service = client.get_service('InvoiceService')
+    path = str(tmpdir.join('invoices.csv'))
+    assert export_invoices(service, path, '2016-01-01', '2016-12-31',
+                           window_days=100) == len(server.state.invoices)
+    lines = sum(len(invoice['lines'])
+                for invoice in server.state.invoices.values())
+    path = str(tmpdir.join('lines.csv'))
+    assert export_invoices(service, path, '2016-01-01', '2016-12-31',
+                           lines=True) == lines
+    assert len(read_rows(path)) == lines
+    path = str(tmpdir.join('customers.csv'))
+    assert export_customers(client.get_service('CustomerService'),
+                            path) == len(server.state.customers)
+
+
+def test_arrow_batches():
+    pyarrow = pytest.importorskip('pyarrow')
+    batches = list(iter_record_batches([INVOICE] * 3, INVOICE_SCHEMA,
+                                       batch_size=2))
+    assert [batch.num_rows for batch in batches] == [2, 1]
+    assert batches[0].schema.field('number').type == pyarrow.int64()
+    assert batches[0].schema.field('totalGrossAmount').type == \
+        pyarrow.float64()
+    assert batches[0].column(batches[0].schema.get_field_index(
+        'customerName')).to_pylist() == [u'Société Générale'] * 2
+
+
+def test_write_parquet(tmpdir):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    path = str(tmpdir.join('lines.parquet'))
+    assert write(flatten_lines([INVOICE] * 5), path, INVOICE_LINE_SCHEMA,
+                 format='parquet', batch_size=4) == 10
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    assert parquet_file.metadata.num_row_groups == 3
+    table = parquet_file.read()
+    assert table.column_names == [name for name, _ in INVOICE_LINE_SCHEMA]
+    assert table.column('description').to_pylist() == [u'Café', 'Tea'] * 5
+    assert table.column('unitNetPrice').to_pylist()[:2] == [1.5, None]
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from pydebitoor.services import InvoiceService
+
+
+def by_id(rows):
+    return sorted(rows, key=lambda row: row['id'])
+
+
+def test_iter_list_matches_list(client, server):
+    service = client.get_service('InvoiceService')
+    streamed = list(service.iter_list('2016-01-01', '2016-12-31'))
+    listed = service.list('2016-01-01', '2016-12-31')
+    assert len(streamed) == len(server.state.invoices)
+    assert by_id(streamed) == by_id(listed)
+
+
+def test_iter_list_fetches_one_window_at_a_time(client, server):
+    service = client.get_service('InvoiceService')
+    invoices = service.iter_list('2016-01-01', '2016-03-31', window_days=30)
+    assert server.calls == 0
+    first = next(invoices)
+    assert server.calls == 1
+    assert '2016-01-01' <= first['date'] <= '2016-01-30'
+    rest = list(invoices)
+    assert server.calls == 4
+    assert len(rest) + 1 == len([
+        invoice for invoice in server.state.invoices.values()
+        if invoice['date'] <= '2016-03-31'])
+
+
+def test_iter_headers_has_no_lines(client, server):
+    headers = list(client.get_service('InvoiceService').iter_headers(
+        '2016-01-01', '2016-12-31', window_days=100))
+    assert len(headers) == len(server.state.invoices)
+    assert not any('lines' in header for header in headers)
+
+
+def test_iter_list_of_customers(client, server):
+    customers = list(client.get_service('CustomerService').iter_list())
+    assert by_id(customers) == by_id(server.state.customers.values())
+
+
+def test_incoherent_interval():
+    with pytest.raises(ValueError):
+        list(InvoiceService(None).iter_list('2016-02-01', '2016-01-01'))
+
+
+def test_split_interval():
+    assert InvoiceService._split_interval('2016-01-01', '2016-01-10', 4) == [
+        ('2016-01-01', '2016-01-04'), ('2016-01-05', '2016-01-08'),
+        ('2016-01-09', '2016-01-10')]
+    assert InvoiceService._split_interval('2016-02-28', '2016-03-01', 30) \
+        == [('2016-02-28', '2016-03-01')]
+    with pytest.raises(ValueError):
+        InvoiceService._split_interval('2016-01-01', '2016-01-10', 0)
+
+
+def test_fetch_windows_splits_full_windows():
+    windows = []
+
+    def fetch(window_from, window_to):
+        windows.append((window_from, window_to))
+        if window_from == '2016-01-01' and window_to > '2016-01-02':
+            return [{'id': str(number), 'date': window_from}
+                    for number in range(5)]
+        return [{'id': 'shared', 'date': '2016-01-03', 'number': 2},
+                {'id': window_to, 'date': window_to, 'number': 1}]
+
+    rows = InvoiceService(None)._fetch_windows(
+        fetch, '2016-01-01', '2016-01-08', window_days=4, max_workers=2,
+        max_rows=5)
+    assert sorted(windows) == [
+        ('2016-01-01', '2016-01-02'), ('2016-01-01', '2016-01-04'),
+        ('2016-01-03', '2016-01-04'), ('2016-01-05', '2016-01-08')]
+    # The full window is replaced by its halves, ids are deduplicated.
+    assert [row['id'] for row in rows] == [
+        '2016-01-02', 'shared', '2016-01-04', '2016-01-08']
+
+
+def test_fetch_windows_keeps_full_one_day_windows():
+    rows = InvoiceService(None)._fetch_windows(
+        lambda window_from, window_to: [
+            {'id': str(number), 'date': window_from} for number in range(3)],
+        '2016-01-01', '2016-01-01', window_days=1, max_workers=1,
+        max_rows=2)
+    assert len(rows) == 3
+
+
+def test_list_parallel_matches_list(client, server):
+    service = client.get_service('InvoiceService')
+    rows = service.list_parallel('2016-01-01', '2016-12-31', window_days=45,
+                                 max_workers=4, max_rows=20)
+    assert by_id(rows) == by_id(service.list('2016-01-01', '2016-12-31'))
+    assert [row['date'] for row in rows] == sorted(
+        invoice['date'] for invoice in server.state.invoices.values())
+    assert server.calls > 10
+
+
+def test_list_parallel_requires_from_date(client):
+    with pytest.raises(ValueError):
+        client.get_service('InvoiceService').list_parallel(None)
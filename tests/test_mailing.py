@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from pydebitoor.errors import NotFoundError, RequestError
+from pydebitoor.mailing import EmailCheckpoint, EmailDispatcher, EmailJob
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('emails.log'))
+
+
+def jobs(server, count=10):
+    return [EmailJob(invoice_id, 'customer@example.com', 'Your invoice')
+            for invoice_id in sorted(server.state.invoices)[:count]]
+
+
+def test_dispatcher_sends_and_reports(client, server):
+    reports = []
+    dispatcher = EmailDispatcher(client.get_service('InvoiceService'),
+                                 max_workers=4, progress=reports.append)
+    report = dispatcher.run(jobs(server) + [
+        ('missing', 'customer@example.com', 'Your invoice'),
+        (sorted(server.state.invoices)[0], '', 'No recipient')])
+    assert (report.sent, report.skipped) == (10, 0)
+    errors = dict((type(error), job.invoice_id)
+                  for job, error in report.failed)
+    assert sorted(errors.values()) == sorted(
+        ['missing', sorted(server.state.invoices)[0]])
+    assert set(errors) == set([NotFoundError, RequestError])
+    assert len(reports) == 12
+    assert server.calls == 12
+    assert report.as_dict()['failed'] == 2
+
+
+def test_resume_sends_only_missing_jobs(client, server, path):
+    service = client.get_service('InvoiceService')
+    first = EmailDispatcher(service, path).run(
+        jobs(server, 5) + [('missing', 'a@example.com', 'Invoice')])
+    assert (first.sent, len(first.failed)) == (5, 1)
+
+    server.state.invoices['missing'] = {'id': 'missing', 'lines': []}
+    calls = server.calls
+    second = EmailDispatcher(service, path).run(
+        jobs(server) + [('missing', 'a@example.com', 'Invoice')])
+    assert (second.sent, second.skipped, second.failed) == (6, 5, [])
+    assert server.calls - calls == 6
+    assert len(EmailCheckpoint(path)) == 11
+
+
+def test_truncated_last_line_is_dropped(client, server, path):
+    sent = jobs(server, 3)
+    with open(path, 'w') as checkpoint_file:
+        for job in sent[:2]:
+            checkpoint_file.write(json.dumps(job.key) + '\n')
+        checkpoint_file.write(json.dumps(sent[2].key)[:8])
+
+    report = EmailDispatcher(client.get_service('InvoiceService'),
+                             path).run(sent)
+    assert (report.sent, report.skipped) == (1, 2)
+    with open(path) as checkpoint_file:
+        assert [json.loads(line) for line in checkpoint_file] == \
+            [job.key for job in sent]
+
+
+def test_unterminated_last_line_is_dropped(path):
+    with open(path, 'w') as checkpoint_file:
+        checkpoint_file.write('"a"\n"b"')
+    checkpoint = EmailCheckpoint(path)
+    assert 'a' in checkpoint and 'b' not in checkpoint
+    checkpoint.mark('c')
+    checkpoint.close()
+    with open(path) as checkpoint_file:
+        assert checkpoint_file.read() == '"a"\n"c"\n'
+
+
+def test_corrupt_checkpoint_is_reported(path):
+    with open(path, 'w') as checkpoint_file:
+        checkpoint_file.write('"a"\n{broken\n"b"\n')
+    with pytest.raises(ValueError):
+        EmailCheckpoint(path)
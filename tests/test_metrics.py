@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import socket
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from pydebitoor.client import DebitoorClient
+from pydebitoor.errors import NotFoundError
+from pydebitoor.metrics import Histogram, MetricsCollector, endpoint_of
+from pydebitoor.retry import RetryPolicy
+
+
+@pytest.fixture
+def metrics(client):
+    metrics = MetricsCollector()
+    metrics.install(client)
+    return metrics
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [1, 3]
+    assert histogram.quantile(0.5) == 1.0
+    assert histogram.quantile(0.99) == float('inf')
+    assert histogram.as_dict()['count'] == 4
+
+
+def test_endpoint_of_hides_ids():
+    assert endpoint_of('/api/customers/5a1b2c3d4e5f/v1') == \
+        '/api/customers/{id}/v1'
+    assert endpoint_of('/api/sales/invoices/12/pdf/v1') == \
+        '/api/sales/invoices/{id}/pdf/v1'
+
+
+def test_hooks_record_calls(client, server, metrics):
+    service = client.get_service('CustomerService')
+    for _ in range(3):
+        service.list()
+    service.get(sorted(server.state.customers)[0])
+    with pytest.raises(NotFoundError):
+        service.get('000000000000000000000missing')
+    service.create({'name': 'ACME', 'countryCode': 'FR'})
+
+    stats = metrics.as_dict()
+    endpoints = stats['endpoints']
+    assert sorted(endpoints) == ['GET /api/customers/v1',
+                                 'GET /api/customers/{id}/v1',
+                                 'POST /api/customers/v1']
+    listed = endpoints['GET /api/customers/v1']
+    assert listed['latency']['count'] == 3
+    assert listed['statuses'] == {200: 3}
+    assert listed['response_bytes'] > 0
+    assert endpoints['GET /api/customers/{id}/v1']['statuses'] == \
+        {200: 1, 404: 1}
+    assert endpoints['POST /api/customers/v1']['request_bytes'] > 0
+    customers = stats['services']['CustomerService']
+    assert customers['latency']['count'] == 6
+    assert customers['statuses'] == {200: 5, 404: 1}
+
+    metrics.uninstall(client)
+    service.list()
+    assert metrics.as_dict()['services']['CustomerService']['latency'][
+        'count'] == 6
+
+
+def test_errors_and_retries_are_recorded():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    client = DebitoorClient('token', base_url='http://127.0.0.1:{}/api'
+                            .format(port),
+                            retry_policy=RetryPolicy(max_attempts=3,
+                                                     backoff_factor=0.01))
+    metrics = MetricsCollector()
+    metrics.install(client)
+    with pytest.raises(ConnectionError):
+        client.get_service('CustomerService').list()
+    client.close()
+    stats = metrics.as_dict()['endpoints']['GET /api/customers/v1']
+    assert stats['errors'] == {'ConnectionError': 3}
+    assert stats['retries'] == 2
+    assert stats['latency']['count'] == 3
+
+
+def test_prometheus_format(client, metrics):
+    client.get_service('CustomerService').list()
+    client.get_service('TaxService').sale_tax_rates('FR', '2020-01-01')
+    text = metrics.to_prometheus()
+    lines = text.splitlines()
+    assert text.endswith('\n')
+    assert '# TYPE pydebitoor_request_duration_seconds histogram' in lines
+    assert '# TYPE pydebitoor_responses_total counter' in lines
+    labels = 'service="CustomerService",method="GET",' \
+             'endpoint="/api/customers/v1"'
+    assert 'pydebitoor_responses_total{{{},status="200"}} 1'.format(
+        labels) in lines
+    assert 'pydebitoor_request_duration_seconds_bucket{{{},le="+Inf"}} 1' \
+        .format(labels) in lines
+    assert 'pydebitoor_request_duration_seconds_count{{{}}} 1'.format(
+        labels) in lines
+    assert any(line.startswith(
+        'pydebitoor_responses_total{service="TaxService"')
+        for line in lines)
+    for line in lines:
+        assert line.startswith('# TYPE ') or \
+            len(line.rsplit(' ', 1)) == 2
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import copy
+import pickle
+
+import pytest
+
+from pydebitoor.models import Customer, Draft, Invoice, InvoiceLine
+
+INVOICE = {'id': '1', 'number': 3, 'customerName': 'ACME', 'custom': 'x',
+           'lines': [{'description': 'Line', 'quantity': 2,
+                      'unitNetPrice': 10.0}]}
+
+
+def test_unset_fields_read_as_none_and_are_not_serialized():
+    customer = Customer(name='ACME', custom={'a': 1})
+    assert customer.email is None
+    assert customer.to_dict() == {'name': 'ACME', 'custom': {'a': 1}}
+    with pytest.raises(AttributeError):
+        customer.unknown
+
+
+def test_invoice_lines_are_decoded_lazily():
+    invoice = Invoice.from_dict(INVOICE)
+    assert invoice.to_dict() == INVOICE
+    assert isinstance(invoice.lines[0], InvoiceLine)
+    assert invoice.lines[0].quantity == 2
+    assert invoice.to_dict() == INVOICE
+
+
+def test_reading_missing_lines_does_not_add_them():
+    invoice = Invoice.from_dict({'id': '1', 'customerName': 'A'})
+    assert invoice.lines == []
+    assert invoice.to_dict() == {'id': '1', 'customerName': 'A'}
+    invoice.lines = [{'description': 'Line', 'quantity': 1}]
+    assert invoice.lines[0].description == 'Line'
+    assert invoice.to_dict()['lines'] == [{'description': 'Line',
+                                           'quantity': 1}]
+
+
+@pytest.mark.parametrize('duplicate', [
+    copy.copy, copy.deepcopy,
+    lambda model: pickle.loads(pickle.dumps(model)),
+    lambda model: pickle.loads(pickle.dumps(model, protocol=2))])
+@pytest.mark.parametrize('model, decode', [
+    (Invoice, False), (Invoice, True), (Draft, True), (Customer, False)])
+def test_copies_keep_unset_fields_unset(duplicate, model, decode):
+    data = dict(INVOICE)
+    if model is Customer:
+        del data['lines'], data['customerName']
+    original = model.from_dict(data)
+    if decode:
+        original.lines
+    result = duplicate(original)
+    assert type(result) is model
+    assert result.to_dict() == data
+    assert result == original
+
+
+def test_deepcopy_is_independent():
+    invoice = Invoice.from_dict(INVOICE)
+    duplicate = copy.deepcopy(invoice)
+    duplicate.lines[0].quantity = 5
+    duplicate.extra['custom'] = 'y'
+    assert invoice.to_dict() == INVOICE
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import time
+
+import pytest
+
+from pydebitoor.outbox import Outbox
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('outbox.sqlite'))
+
+
+def make_outbox(client, path, **kwargs):
+    kwargs.setdefault('backoff', 0.01)
+    kwargs.setdefault('flush_interval', 0.05)
+    return Outbox(client, path, **kwargs)
+
+
+def test_calls_are_sent_in_order(client, server, path):
+    customer_id = sorted(server.state.customers)[0]
+    with make_outbox(client, path) as outbox:
+        customers = outbox.service('CustomerService')
+        created = customers.create({'name': 'New'})
+        updates = [customers.partial_update(customer_id, {'name': str(i)})
+                   for i in range(10)]
+        assert outbox.flush(10)
+        assert created.result()['id'] in server.state.customers
+        assert all(future.exception() is None for future in updates)
+    assert server.state.customers[customer_id]['name'] == '9'
+
+
+def test_crash_recovery(client, server, path):
+    customer_id = sorted(server.state.customers)[0]
+    make_outbox(client, path, start=False).close()
+    connection = sqlite3.connect(path)
+    for method, args in (
+            ('partial_update', '["%s", {"name": "recovered"}]' % customer_id),
+            ('create', '[{"name": "maybe sent"}]')):
+        connection.execute(
+            "INSERT INTO outbox (service, method, entity, args, kwargs, "
+            "state, created_at) VALUES ('CustomerService', ?, ?, ?, '{}', "
+            "'sending', 0)", (method, 'CustomerService/' + customer_id
+                              if method != 'create' else None, args))
+    connection.commit()
+    connection.close()
+
+    with make_outbox(client, path) as outbox:
+        assert outbox.flush(10)
+        assert server.state.customers[customer_id]['name'] == 'recovered'
+        interrupted = outbox.entries('interrupted')
+        assert [entry['method'] for entry in interrupted] == ['create']
+        outbox.retry(interrupted[0]['seq'])
+        future = outbox.future(interrupted[0]['seq'])
+        assert future.result(10)['name'] == 'maybe sent'
+
+
+def test_permanent_errors_fail(client, path):
+    with make_outbox(client, path) as outbox:
+        future = outbox.service('CustomerService').partial_update(
+            'missing', {'name': 'x'})
+        assert outbox.flush(10)
+        assert future.exception(10) is not None
+        assert outbox.stats()['failed'] == 1
+
+
+def test_backed_off_calls_do_not_starve_ready_ones(client, server, path):
+    blocked_id, good_id = sorted(server.state.customers)[:2]
+    with make_outbox(client, path, start=False, batch_size=3) as outbox:
+        customers = outbox.service('CustomerService')
+        for index in range(4):
+            customers.partial_update(blocked_id, {'name': str(index)})
+        good = customers.partial_update(good_id, {'name': 'good'})
+        connection = sqlite3.connect(path)
+        with connection:
+            connection.execute(
+                'UPDATE outbox SET next_attempt = ? WHERE seq = 1',
+                (time.time() + 3600,))
+        connection.close()
+
+        assert outbox.flush_once() == 1
+        assert good.result(10)['name'] == 'good'
+        assert server.state.customers[blocked_id]['name'] != '3'
+        assert [entry['seq'] for entry in outbox.entries('pending')] == \
+            [1, 2, 3, 4]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from pydebitoor.ratelimit import RateLimiter, monotonic, parse_retry_after
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2') == 2.0
+    assert parse_retry_after('-3') == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('not a date') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+
+def test_acquire_respects_rate():
+    limiter = RateLimiter(50, burst=1)
+    started_at = monotonic()
+    for _ in range(11):
+        limiter.acquire()
+    # First token is in the bucket, the 10 others take 1/50s each.
+    assert monotonic() - started_at >= 0.18
+
+
+def test_throttling_halves_rate_and_success_raises_it():
+    limiter = RateLimiter(10, min_rate=1)
+    limiter.on_throttled()
+    assert limiter.rate == 5
+    limiter.on_throttled()
+    limiter.on_throttled()
+    limiter.on_throttled()
+    assert limiter.rate == 1
+    for _ in range(1000):
+        limiter.on_success()
+    assert limiter.rate == 10
+    assert limiter.stats()['throttled'] == 4
+
+
+def test_retry_after_pauses_every_caller():
+    limiter = RateLimiter(1000)
+    limiter.on_throttled(retry_after=0.2)
+    started_at = monotonic()
+    threads = [threading.Thread(target=limiter.acquire) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert monotonic() - started_at >= 0.2
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from pydebitoor import registry as registry_module
+from pydebitoor.registry import ClientRegistry
+
+
+@pytest.fixture
+def registry(server):
+    server.config['token'] = None
+    registry = ClientRegistry(base_url=server.base_url, max_tenants=3,
+                              tenant_rate=5, response_cache=True)
+    yield registry
+    registry.close()
+
+
+def test_clients_share_the_session(registry):
+    first, second = registry.get('first'), registry.get('second')
+    assert registry.get('first') is first
+    assert first is not second
+    assert first.session is second.session is registry.session
+    for client in (first, second):
+        client.get_service('CustomerService').list()
+    pools = registry.session.get_adapter(registry.base_url).poolmanager.pools
+    assert [pools[key].num_connections for key in pools.keys()] == [1]
+
+
+def test_tenants_have_their_own_rate_limiter(registry):
+    first, second = registry.get('first'), registry.get('second')
+    assert first.rate_limiter is not second.rate_limiter
+    assert first.rate_limiter.rate == second.rate_limiter.rate == 5
+
+
+def test_least_recently_used_tenant_is_evicted(registry):
+    clients = dict((token, registry.get(token))
+                   for token in ('first', 'second', 'third'))
+    registry.get('first')
+    registry.get('fourth')
+    assert len(registry) == 3
+    assert 'second' not in registry
+    assert registry.get('first') is clients['first']
+    assert registry.get('second') is not clients['second']
+
+
+def test_idle_tenants_are_evicted(server, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(registry_module, 'monotonic', lambda: now[0])
+    with ClientRegistry(base_url=server.base_url,
+                        idle_timeout=60) as registry:
+        registry.get('first')
+        now[0] += 30
+        registry.get('second')
+        now[0] += 40
+        registry.get('third')
+        assert 'first' not in registry
+        assert 'second' in registry and 'third' in registry
+
+
+def test_caches_are_partitioned_by_tenant(registry, server):
+    first, second = registry.get('first'), registry.get('second')
+    for client in (first, second, first):
+        client.get_service('CustomerService').list()
+        client.get_service('TaxService').sale_tax_rates('FR', '2020-01-01')
+    assert registry.response_cache.not_modified == 1
+    assert len(registry.response_cache.store) == 4
+    assert len(registry.tax_cache) == 2
+    # Tax rates answered from the cache, customers revalidated.
+    assert server.calls == 5
+    assert registry.stats()['tenants'] == 2
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import pytest
+from requests.exceptions import ConnectionError, HTTPError, ReadTimeout
+from requests.models import Response
+
+from pydebitoor.client import DebitoorClient
+from pydebitoor.retry import NO_RETRY, RetryPolicy
+
+
+def make_response(status_code):
+    response = Response()
+    response.status_code = status_code
+    return response
+
+
+def test_is_retryable():
+    policy = RetryPolicy()
+    assert policy.is_retryable('GET', make_response(503))
+    assert not policy.is_retryable('GET', make_response(500))
+    assert not policy.is_retryable('POST', make_response(503))
+    assert policy.is_retryable('PUT', error=ReadTimeout())
+    assert not policy.is_retryable('POST', error=ReadTimeout())
+    assert not policy.is_retryable('GET', error=ValueError())
+
+
+def test_backoff_is_capped():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5, jitter=False)
+    assert [policy.backoff(attempt) for attempt in (1, 2, 3, 4)] == \
+        [1, 2, 4, 5]
+
+
+def test_client_retries_transient_errors(server):
+    server.config['error_rate'] = 1.0
+    client = DebitoorClient('token', base_url=server.base_url,
+                            retry_policy=RetryPolicy(max_attempts=3,
+                                                     backoff_factor=0.01))
+    with pytest.raises(HTTPError):
+        client.get_service('CustomerService').list()
+    assert server.calls == 3
+
+
+def test_client_does_not_retry_posts(server):
+    server.config['error_rate'] = 1.0
+    client = DebitoorClient('token', base_url=server.base_url,
+                            retry_policy=RetryPolicy(backoff_factor=0.01))
+    with pytest.raises(HTTPError):
+        client.get_service('CustomerService').create({'name': 'A'})
+    assert server.calls == 1
+
+
+def test_no_retry_on_connection_error():
+    client = DebitoorClient('token', base_url='http://127.0.0.1:9/api',
+                            retry_policy=NO_RETRY)
+    with pytest.raises(ConnectionError):
+        client.get('/customers/v1')
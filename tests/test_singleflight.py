@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_server import VALID_TOKEN
+from pydebitoor.client import DebitoorClient
+from pydebitoor.singleflight import SingleFlight
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return {'value': 1}
+
+    with ThreadPoolExecutor(8) as executor:
+        leader = executor.submit(flight.do, 'key', fetch)
+        started.wait()
+        followers = [executor.submit(flight.do, 'key', fetch)
+                     for _ in range(7)]
+        results = [leader.result()] + [future.result()
+                                       for future in followers]
+    assert len(calls) == 1
+    assert all(result == {'value': 1} for result in results)
+    # Shared results are copies.
+    results[0]['value'] = 2
+    assert results[1]['value'] == 1
+    assert flight.stats() == {'executed': 1, 'coalesced': 7, 'in_flight': 0}
+
+
+def test_errors_are_shared():
+    flight = SingleFlight()
+
+    def fail():
+        raise KeyError('boom')
+
+    try:
+        flight.do('key', fail)
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('KeyError not raised')
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_forgotten_calls_are_not_shared():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch(value):
+        calls.append(value)
+        release.wait()
+        return value
+
+    with ThreadPoolExecutor(2) as executor:
+        before = executor.submit(flight.do, 'GET /customers/1', fetch, 1)
+        while not calls:
+            time.sleep(0.01)
+        flight.forget('GET /customers')
+        after = executor.submit(flight.do, 'GET /customers/1', fetch, 2)
+        while len(calls) < 2:
+            time.sleep(0.01)
+        release.set()
+        assert (before.result(), after.result()) == (1, 2)
+    assert flight.stats() == {'executed': 2, 'coalesced': 0, 'in_flight': 0}
+
+
+def test_get_after_write_does_not_join_earlier_get(server):
+    server.config.update(latency=0.3, jitter=0)
+    client = DebitoorClient(VALID_TOKEN, base_url=server.base_url,
+                            coalesce=True)
+    service = client.get_service('CustomerService')
+    customer_id = sorted(server.state.customers)[0]
+
+    def wait_in_flight(count):
+        while client.single_flight.stats()['in_flight'] < count:
+            time.sleep(0.01)
+
+    with ThreadPoolExecutor(3) as executor:
+        before = executor.submit(service.get, customer_id)
+        wait_in_flight(1)
+        joined = executor.submit(service.get, customer_id)
+        while client.single_flight.coalesced < 1:
+            time.sleep(0.01)
+        client.invalidate(service.uri)
+        after = executor.submit(service.get, customer_id)
+        wait_in_flight(1)
+        for future in (before, joined, after):
+            future.result()
+    client.close()
+    assert client.single_flight.stats() == \
+        {'executed': 2, 'coalesced': 1, 'in_flight': 0}
+    assert server.calls == 2
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from pydebitoor.streaming import iter_json_array
+
+
+def chunked(text, size):
+    data = text.encode('utf-8')
+    return [data[index:index + size] for index in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64 * 1024])
+def test_decodes_any_chunking(size):
+    items = [{'id': index, 'name': u'Cliént %d' % index, 'lines': [1.5, None]}
+             for index in range(50)] + [12345, 'text', True, None]
+    text = json.dumps(items)
+    assert list(iter_json_array(chunked(text, size))) == items
+
+
+def test_empty_array():
+    assert list(iter_json_array([b' [ ] '])) == []
+
+
+@pytest.mark.parametrize('text', [
+    '{"a": 1}', '[1, 2', '[1, {"a": ]', '[1 2 3]', '[,,1,]', '[,1]',
+    '[1,,2]', '[1,]', '[,]', '[{"a":1}{"b":2}]', '["a" "b"]'])
+def test_rejects_invalid_documents(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array([text]))
+
+
+@pytest.mark.parametrize('text', ['[1 2]', '[1,,2]', '[1,]'])
+def test_rejects_bad_separators_across_chunks(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(chunked(text, 1)))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+from pydebitoor.sync import SyncEngine, SyncStore
+
+
+@pytest.fixture
+def store():
+    store = SyncStore()
+    yield store
+    store.close()
+
+
+def test_first_sync_mirrors_everything(client, server, store):
+    stats = SyncEngine(client, store).sync()
+    assert stats['customers'] == {'fetched': 20, 'changed': 20,
+                                  'deleted': 0}
+    assert stats['invoices'] == {'listed': 200, 'fetched': 200,
+                                 'changed': 200, 'deleted': 0}
+    invoice_id = sorted(server.state.invoices)[0]
+    assert store.get_invoice(invoice_id) == server.state.invoices[invoice_id]
+    customer = sorted(server.state.customers.values(),
+                      key=lambda customer: customer['number'])[0]
+    assert store.find_customers(email=customer['email']) == [customer]
+
+
+def test_incremental_sync_fetches_changed_invoices(client, server, store):
+    engine = SyncEngine(client, store)
+    engine.sync()
+    invoices = sorted(server.state.invoices.values(),
+                      key=lambda invoice: invoice['date'])
+    old, deleted = invoices[0], invoices[1]
+    old['paid'] = True
+    old['lastModified'] = '2020-01-01T00:00:00Z'
+    del server.state.invoices[deleted['id']]
+    calls = server.calls
+
+    assert engine.sync_invoices() == {'listed': 199, 'fetched': 1,
+                                      'changed': 1, 'deleted': 1}
+    # Headers in one call, then the changed invoice.
+    assert server.calls == calls + 2
+    assert store.get_invoice(old['id'])['paid'] is True
+    assert store.get_invoice(deleted['id']) is None
+    assert engine.sync_invoices()['fetched'] == 0
+
+
+def test_many_changes_stream_the_range(client, server, store):
+    engine = SyncEngine(client, store, fetch_by_id_limit=10)
+    engine.sync_invoices('2016-06-01')
+    assert all(invoice['date'] >= '2016-06-01'
+               for invoice in store.find_invoices())
+    calls = server.calls
+    assert engine.sync_invoices()['fetched'] == 0
+    header_calls = server.calls - calls
+
+    for invoice in server.state.invoices.values():
+        invoice['lastModified'] = '2020-01-01T00:00:00Z'
+    calls = server.calls
+    stats = engine.sync_invoices()
+    assert stats['fetched'] == stats['listed'] == len(store.find_invoices())
+    # The range start is kept, and invoices are streamed over the same
+    # windows as headers instead of being fetched one by one.
+    assert server.calls - calls == 2 * header_calls
+
+
+def test_headers_without_last_modified(client, server, store):
+    for invoice in server.state.invoices.values():
+        del invoice['lastModified']
+    engine = SyncEngine(client, store)
+    engine.sync_invoices()
+    assert engine.sync_invoices()['fetched'] == 0
+    invoice = next(iter(server.state.invoices.values()))
+    invoice['paid'] = True
+    assert engine.sync_invoices()['fetched'] == 1
+    assert store.get_invoice(invoice['id'])['paid'] is True
+
+
+def test_customers_deleted_upstream_are_purged(client, server, store):
+    engine = SyncEngine(client, store)
+    engine.sync_customers()
+    customer_id = sorted(server.state.customers)[0]
+    del server.state.customers[customer_id]
+    assert engine.sync_customers() == {'fetched': 19, 'changed': 0,
+                                       'deleted': 1}
+    assert store.get_customer(customer_id) is None
+
+
+def test_store_created_without_versions(tmpdir):
+    path = str(tmpdir.join('sync.sqlite'))
+    connection = sqlite3.connect(path)
+    connection.execute(
+        'CREATE TABLE invoices (id TEXT PRIMARY KEY, number TEXT, '
+        'customer_id TEXT, date TEXT, digest TEXT NOT NULL, '
+        'data TEXT NOT NULL)')
+    connection.execute("INSERT INTO invoices VALUES "
+                       "('1', '1', NULL, '2016-01-01', 'x', '{}')")
+    connection.commit()
+    connection.close()
+    store = SyncStore(path)
+    assert store.invoice_versions() == {'1': None}
+    store.close()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from pydebitoor.models import InvoiceLine
+from pydebitoor.validation import Validator
+
+LINE = {'description': 'Line', 'quantity': 1, 'unitNetPrice': 10,
+        'taxRate': 20}
+
+
+def tax_rates(country, date):
+    return [0, 5.5, 10, 20]
+
+
+def test_valid_invoice():
+    assert Validator(tax_rates).errors('invoice', {
+        'customerName': 'ACME', 'customerCountry': 'FR',
+        'lines': [LINE, InvoiceLine.from_dict(LINE)]}) == {}
+
+
+def test_invalid_fields():
+    errors = Validator(tax_rates).errors('invoice', {
+        'customerCountry': 'FR', 'date': '01/01/2016',
+        'lines': [dict(LINE, quantity='1', taxRate=7)]})
+    # Invalid dates fall back to today for the tax rates lookup.
+    assert errors.pop('lines.0.taxRate').startswith('not applicable in FR')
+    assert errors == {
+        'customerId': 'one of customerId, customerName is required',
+        'date': 'must be a YYYY-MM-DD date',
+        'lines.0.quantity': 'must be a number'}
+
+
+@pytest.mark.parametrize('country', [['FR'], {'code': 'FR'}, 12, 'ZZ'])
+def test_malformed_country(country):
+    assert Validator().errors('customer', {
+        'name': 'ACME', 'countryCode': country}) == \
+        {'countryCode': 'unknown country code'}
+    errors = Validator(tax_rates).errors('invoice', {
+        'customerName': 'ACME', 'customerCountry': country,
+        'lines': [LINE]})
+    assert errors == {'customerCountry': 'unknown country code'}
+
+
+def test_malformed_lines():
+    errors = Validator(tax_rates).errors('invoice', {
+        'customerName': 'ACME', 'customerCountry': 'FR',
+        'lines': ['bad', None, 3, LINE]})
+    assert errors == {'lines.0': 'must be an object',
+                      'lines.1': 'must be an object',
+                      'lines.2': 'must be an object'}